@@ -0,0 +1 @@
+"""Benchmarks for queuectl (run from the repository root)."""
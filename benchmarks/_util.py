@@ -0,0 +1,26 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def temp_home():
+    """Point HOME at a throwaway directory so ~/.queuectl is isolated."""
+    old_home = os.environ.get("HOME")
+    with tempfile.TemporaryDirectory(prefix="queuectl-bench-") as d:
+        os.environ["HOME"] = d
+        try:
+            yield d
+        finally:
+            if old_home is None:
+                del os.environ["HOME"]
+            else:
+                os.environ["HOME"] = old_home
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    s = sorted(values)
+    k = min(len(s) - 1, max(0, int(round(pct / 100.0 * (len(s) - 1)))))
+    return s[k]
@@ -0,0 +1,77 @@
+"""Job round trips through a broker on localhost.
+
+Starts a broker in-process on a loopback TCP port, then claims ``--jobs``
+jobs ``--prefetch`` at a time through a ``broker.BrokerClient`` and
+records each as completed, either waiting for every reply
+(``pipelined=False``) or posting results and reading the replies with the
+next claim, as workers do. Reports jobs per second and the mean claim
+round trip.
+
+    python -m benchmarks.broker --jobs 5000 --prefetch 1 10
+"""
+import argparse
+import threading
+import time
+
+from queuectl import broker
+from queuectl import db
+
+from ._util import temp_home
+
+
+def run(jobs: int, prefetch: int = 1, pipelined: bool = True):
+    with temp_home():
+        db.init_db()
+        db.insert_jobs([{"id": f"j{i}", "command": "true"} for i in range(jobs)])
+        server = broker.make_server("127.0.0.1:0")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+        client = broker.BrokerClient(f"{host}:{port}")
+        claims = 0
+        claim_time = 0.0
+        done = 0
+        t0 = time.perf_counter()
+        while True:
+            c0 = time.perf_counter()
+            batch = client.fetch_and_lock_jobs("bench", prefetch)
+            claim_time += time.perf_counter() - c0
+            claims += 1
+            if not batch:
+                break
+            for job in batch:
+                if pipelined:
+                    client.complete_job(job["id"], "")
+                else:
+                    client.call("complete", job=job["id"], output="")
+                done += 1
+        elapsed = time.perf_counter() - t0
+        client.close()
+        server.shutdown()
+        server.server_close()
+        assert db.job_counts()["completed"] == done
+        db.close_conn()
+    return {
+        "jobs": done,
+        "prefetch": prefetch,
+        "pipelined": pipelined,
+        "seconds": elapsed,
+        "jobs_per_sec": done / elapsed if elapsed else None,
+        "claim_rtt_ms": claim_time / claims * 1000.0,
+    }
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="benchmarks.broker")
+    p.add_argument("--jobs", type=int, default=5000)
+    p.add_argument("--prefetch", type=int, nargs="+", default=[1, 10])
+    args = p.parse_args(argv)
+    print(f"{'prefetch':>8} {'results':>10} {'jobs/s':>8} {'claim ms':>9}")
+    for n in args.prefetch:
+        for pipelined in (False, True):
+            r = run(args.jobs, n, pipelined)
+            mode = "pipelined" if pipelined else "waited"
+            print(f"{n:>8} {mode:>10} {r['jobs_per_sec']:>8.0f} {r['claim_rtt_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Claim latency versus table size.
+
+Seeds the jobs table with N finished rows plus a small ready backlog and
+times ``db.fetch_and_lock_job``. Pass ``--no-index`` to drop the ready index
+and see the full-scan cost the index avoids. ``--scheduled M`` adds M
+high-priority retries waiting out their backoff an hour from now; they sit
+in the ``scheduled`` state, so the claim should not slow down.
+
+    python -m benchmarks.claim --rows 10000 100000 1000000
+    python -m benchmarks.claim --rows 10000 --scheduled 100000
+"""
+import argparse
+import time
+
+from queuectl import db
+
+from ._util import temp_home, percentile
+
+
+NOW = db.to_ms("2025-11-08T00:00:00Z")
+
+
+def seed(rows: int, ready: int, scheduled: int = 0):
+    conn = db.get_conn()
+    cur = conn.cursor()
+    cur.execute("BEGIN")
+    cur.executemany(
+        "INSERT INTO jobs(id,command,state,attempts,max_retries,created_at,updated_at,priority) VALUES(?,?,?,?,?,?,?,?)",
+        ((f"done-{i}", "true", "completed", 1, 3, NOW, NOW, i % 10) for i in range(rows)),
+    )
+    cur.executemany(
+        "INSERT INTO jobs(id,command,state,attempts,max_retries,created_at,updated_at,priority) VALUES(?,?,?,?,?,?,?,?)",
+        ((f"ready-{i}", "true", "pending", 0, 3, NOW, NOW, i % 10) for i in range(ready)),
+    )
+    cur.executemany(
+        "INSERT INTO jobs(id,command,state,attempts,max_retries,created_at,updated_at,next_run_at,priority) "
+        "VALUES(?,?,?,?,?,?,?,?,?)",
+        ((f"retry-{i}", "true", "scheduled", 1, 3, NOW, NOW, NOW + 3600 * 1000, 99) for i in range(scheduled)),
+    )
+    cur.execute("COMMIT")
+
+
+def run(rows: int, claims: int, index: bool = True, scheduled: int = 0):
+    with temp_home():
+        db.init_db()
+        if not index:
+            db.get_conn().execute("DROP INDEX IF EXISTS idx_jobs_ready")
+        seed(rows, claims, scheduled)
+        samples = []
+        for _ in range(claims):
+            t0 = time.perf_counter()
+            job = db.fetch_and_lock_job("bench", NOW)
+            samples.append((time.perf_counter() - t0) * 1000.0)
+            assert job is not None
+    return {
+        "rows": rows,
+        "scheduled": scheduled,
+        "claims": claims,
+        "index": index,
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "max_ms": max(samples),
+    }
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="benchmarks.claim")
+    p.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    p.add_argument("--claims", type=int, default=200)
+    p.add_argument("--no-index", action="store_true")
+    p.add_argument("--scheduled", type=int, default=0, help="future retries to seed")
+    args = p.parse_args(argv)
+    print(f"{'rows':>9} {'scheduled':>9} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for n in args.rows:
+        r = run(n, args.claims, index=not args.no_index, scheduled=args.scheduled)
+        print(f"{r['rows']:>9} {r['scheduled']:>9} {r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} {r['max_ms']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
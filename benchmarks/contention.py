@@ -0,0 +1,119 @@
+"""Write-lock contention between workers.
+
+N processes each run M claim/complete cycles against one database with
+``busy_timeout=0``, so every collision on the SQLite write lock surfaces as
+SQLITE_BUSY. Each cycle retries until it succeeds; the benchmark reports how
+many BUSY errors occurred and how long cycles spent waiting for the lock.
+With ``--queues K`` the processes are spread over K named queues, each its
+own database file.
+
+    python -m benchmarks.contention --procs 16 --cycles 200 --queues 1 4
+"""
+import argparse
+import multiprocessing as mp
+import os
+import sqlite3
+import time
+
+from queuectl import db
+
+from ._util import temp_home, percentile
+
+NOW = db.to_ms("2999-01-01T00:00:00Z")
+
+
+def _queue(i: int, queues: int) -> str:
+    return db.DEFAULT_QUEUE if queues == 1 else f"q{i % queues}"
+
+
+def _probe(name: str, queue: str, cycles: int, results):
+    os.environ["QUEUECTL_SQLITE_BUSY_TIMEOUT"] = "0"
+    with db.use_queue(queue):
+        _cycles(name, cycles, results)
+
+
+def _cycles(name: str, cycles: int, results):
+    conn = db.get_conn()
+    busy = 0
+    waits = []
+    for _ in range(cycles):
+        t0 = time.perf_counter()
+        while True:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                break
+            except sqlite3.OperationalError:
+                busy += 1
+                time.sleep(0.0005)
+        waits.append(time.perf_counter() - t0)
+        try:
+            row = conn.execute(
+                f"SELECT id FROM jobs WHERE {db._READY_WHERE} {db._READY_ORDER} LIMIT 1"
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE jobs SET state='processing', locked_by=? WHERE id=?", (name, row[0]))
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.rollback()
+            continue
+        if row:
+            while True:
+                try:
+                    db.complete_job(row[0], "")
+                    break
+                except sqlite3.OperationalError:
+                    busy += 1
+                    time.sleep(0.0005)
+    results.put((busy, waits))
+
+
+def run(procs: int, cycles: int, queues: int = 1):
+    with temp_home():
+        for k in range(queues):
+            with db.use_queue(_queue(k, queues)):
+                db.init_db()
+                db.insert_jobs([{"id": f"c{i}", "command": "true"} for i in range(procs * cycles)])
+        db.close_conn()
+        q = mp.Queue()
+        ps = [mp.Process(target=_probe, args=(f"p{i}", _queue(i, queues), cycles, q)) for i in range(procs)]
+        t0 = time.perf_counter()
+        for p in ps:
+            p.start()
+        busy = 0
+        waits = []
+        for _ in ps:
+            b, w = q.get(timeout=600)
+            busy += b
+            waits.extend(w)
+        for p in ps:
+            p.join()
+        elapsed = time.perf_counter() - t0
+    return {
+        "procs": procs,
+        "queues": queues,
+        "cycles": procs * cycles,
+        "busy_errors": busy,
+        "busy_per_cycle": busy / float(procs * cycles),
+        "lock_wait_p50_ms": percentile(waits, 50) * 1000.0,
+        "lock_wait_p99_ms": percentile(waits, 99) * 1000.0,
+        "lock_wait_total_s": sum(waits),
+        "seconds": elapsed,
+    }
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="benchmarks.contention")
+    p.add_argument("--procs", type=int, nargs="+", default=[1, 4, 16])
+    p.add_argument("--cycles", type=int, default=200)
+    p.add_argument("--queues", type=int, nargs="+", default=[1])
+    args = p.parse_args(argv)
+    for k in args.queues:
+        for n in args.procs:
+            r = run(n, args.cycles, k)
+            print(f"queues={k:<2} procs={n:<3} busy={r['busy_errors']:<6} "
+                  f"wait p50={r['lock_wait_p50_ms']:.3f}ms p99={r['lock_wait_p99_ms']:.3f}ms "
+                  f"total={r['seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Per-job database cost of the worker loop, without running a subprocess.
+
+Each iteration does what ``worker.run_job`` does around the command: claim,
+read config, and record the result. Reports jobs per second.
+
+    python -m benchmarks.db_cycle --jobs 5000
+"""
+import argparse
+import time
+
+from queuectl import db
+
+from ._util import temp_home
+
+START = db.to_ms("2025-01-01T00:00:00Z")
+NOW = db.to_ms("2025-11-08T00:00:00Z")
+
+
+def run(jobs: int):
+    with temp_home():
+        db.init_db()
+        conn = db.get_conn()
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT INTO jobs(id,command,state,attempts,max_retries,created_at,updated_at,priority) VALUES(?,?,?,?,?,?,?,?)",
+            ((f"j{i}", "true", "pending", 0, 3, START, START, 0) for i in range(jobs)),
+        )
+        conn.execute("COMMIT")
+        t0 = time.perf_counter()
+        done = 0
+        while True:
+            job = db.fetch_and_lock_job("bench", NOW)
+            if not job:
+                break
+            db.get_config("default-max-retries")
+            db.get_config("job-timeout")
+            db.complete_job(job["id"], "")
+            done += 1
+        elapsed = time.perf_counter() - t0
+    return {"jobs": done, "seconds": elapsed, "jobs_per_sec": done / elapsed if elapsed else None}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="benchmarks.db_cycle")
+    p.add_argument("--jobs", type=int, default=5000)
+    args = p.parse_args(argv)
+    r = run(args.jobs)
+    print(f"{r['jobs']} jobs in {r['seconds']:.2f}s: {r['jobs_per_sec']:.0f} jobs/s")
+
+
+if __name__ == "__main__":
+    main()
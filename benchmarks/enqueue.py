@@ -0,0 +1,39 @@
+"""Bulk enqueue rate through ``db.insert_jobs``.
+
+    python -m benchmarks.enqueue --jobs 100000 --batch-size 1000
+"""
+import argparse
+import time
+
+from queuectl import db
+
+from ._util import temp_home
+
+
+def run(jobs: int, batch_size: int = 1000):
+    with temp_home():
+        db.init_db()
+        now = db.now_ms()
+        t0 = time.perf_counter()
+        for start in range(0, jobs, batch_size):
+            batch = [
+                {"id": f"e{i}", "command": "true", "max_retries": 3, "created_at": now, "updated_at": now}
+                for i in range(start, min(jobs, start + batch_size))
+            ]
+            errors = db.insert_jobs(batch)
+            assert not errors, errors[:3]
+        elapsed = time.perf_counter() - t0
+    return {"jobs": jobs, "batch_size": batch_size, "seconds": elapsed, "jobs_per_sec": jobs / elapsed}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="benchmarks.enqueue")
+    p.add_argument("--jobs", type=int, default=100000)
+    p.add_argument("--batch-size", type=int, default=1000)
+    args = p.parse_args(argv)
+    r = run(args.jobs, args.batch_size)
+    print(f"{r['jobs']} jobs in {r['seconds']:.2f}s: {r['jobs_per_sec']:.0f} jobs/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Per-job cost of each job type for a trivial Python task.
+
+Runs ``--jobs`` jobs of each kind through ``worker.run_job`` in-process
+and reports wall time per job, including claim and write-back:
+
+- ``shell``: ``python -c 'import json; json.dumps([1])'`` through /bin/sh
+- ``argv``: the same command executed directly
+- ``callable``: ``json:dumps`` in the warm pool
+
+    python -m benchmarks.job_kinds --jobs 50
+"""
+import argparse
+import sys
+import time
+
+from queuectl import callpool
+from queuectl import cli
+from queuectl import db
+from queuectl import worker as worker_mod
+
+from ._util import temp_home, percentile
+
+SNIPPET = "import json; json.dumps([1])"
+
+
+def _job(kind: str, i: int):
+    if kind == "shell":
+        return {"id": f"s{i}", "command": f"{sys.executable} -c '{SNIPPET}'"}
+    if kind == "argv":
+        return {"id": f"a{i}", "argv": [sys.executable, "-c", SNIPPET]}
+    return {"id": f"c{i}", "callable": "json:dumps", "args": [[1]]}
+
+
+def run(jobs: int):
+    res = {}
+    with temp_home():
+        db.init_db()
+        try:
+            # start the pool up front; its one-off startup is not per-job cost
+            callpool.get_pool()
+            for kind in ("shell", "argv", "callable"):
+                db.insert_jobs([cli._prepare_job(_job(kind, i), 3, db.now_ms()) for i in range(jobs)])
+                samples = []
+                while True:
+                    t0 = time.perf_counter()
+                    job = db.fetch_and_lock_job("bench")
+                    if not job:
+                        break
+                    worker_mod.run_job(job, 2)
+                    samples.append((time.perf_counter() - t0) * 1000.0)
+                res[kind] = {
+                    "jobs": len(samples),
+                    "p50_ms": percentile(samples, 50),
+                    "p95_ms": percentile(samples, 95),
+                }
+            res["completed"] = db.job_counts()["completed"]
+        finally:
+            callpool.shutdown()
+    return res
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="benchmarks.job_kinds")
+    p.add_argument("--jobs", type=int, default=50)
+    args = p.parse_args(argv)
+    r = run(args.jobs)
+    for kind in ("shell", "argv", "callable"):
+        print(f"{kind:<9} p50={r[kind]['p50_ms']:.2f}ms p95={r[kind]['p95_ms']:.2f}ms")
+    print(f"completed {r['completed']} of {3 * args.jobs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Enqueue-to-start latency on an idle worker pool.
+
+Starts a supervisor with ``--workers`` idle workers, lets them back off,
+then enqueues jobs one at a time (the way ``queuectl enqueue`` does) and
+measures the time from commit to claim.
+
+    python -m benchmarks.latency --workers 4 --jobs 50
+"""
+import argparse
+import multiprocessing as mp
+import os
+import signal
+import time
+
+from queuectl import db
+from queuectl import notify
+from queuectl import worker as worker_mod
+
+from ._util import temp_home, percentile
+
+
+def run(workers: int, jobs: int, idle: float = 2.0, gap: float = 0.05, wakeup: bool = True):
+    with temp_home() as home:
+        db.init_db()
+        db.close_conn()
+        sup = mp.Process(target=worker_mod.start_workers, args=(workers, 2))
+        sup.start()
+        sock = os.path.join(home, ".queuectl", "wakeup.sock")
+        deadline = time.time() + 10
+        while wakeup and not os.path.exists(sock) and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(idle)
+        for i in range(jobs):
+            db.insert_job({"id": f"lat-{i}", "command": "true"})
+            if wakeup:
+                notify.poke()
+            time.sleep(gap)
+        deadline = time.time() + 30
+        while db.job_counts()["pending"] and time.time() < deadline:
+            time.sleep(0.05)
+        samples = []
+        for j in db.list_jobs(None):
+            if j["locked_at"]:
+                samples.append(float(j["locked_at"] - j["created_at"]))
+        os.kill(sup.pid, signal.SIGTERM)
+        sup.join(timeout=15)
+    return {
+        "workers": workers,
+        "jobs": len(samples),
+        "wakeup": wakeup,
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "max_ms": max(samples) if samples else None,
+    }
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="benchmarks.latency")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--jobs", type=int, default=50)
+    p.add_argument("--no-wakeup", action="store_true", help="do not poke workers (polling only)")
+    args = p.parse_args(argv)
+    r = run(args.workers, args.jobs, wakeup=not args.no_wakeup)
+    print(f"workers={r['workers']} jobs={r['jobs']} p50={r['p50_ms']:.2f}ms p95={r['p95_ms']:.2f}ms max={r['max_ms']:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Wall time of one-shot CLI commands, interpreter start included.
+
+Runs ``python -m queuectl enqueue`` (a new job each time) and ``status``
+``--runs`` times each as fresh processes against an initialized database,
+next to a bare ``python -c pass`` for the interpreter's own share. Each
+command gets one untimed warm-up run, and PYTHONDONTWRITEBYTECODE is
+dropped, so bytecode is cached as in a normal install. The target for
+``enqueue`` is a p50 under :data:`TARGET_MS`.
+
+    python -m benchmarks.startup --runs 30
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from queuectl import db
+
+from ._util import percentile, temp_home
+
+TARGET_MS = 50.0
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _time(argv, runs: int):
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    samples = []
+    for i in range(-1, runs):
+        args = [a.replace("{i}", str(i)) for a in argv]
+        t0 = time.perf_counter()
+        subprocess.run(args, cwd=_ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+        if i >= 0:
+            samples.append((time.perf_counter() - t0) * 1000.0)
+    return {"p50_ms": percentile(samples, 50), "p95_ms": percentile(samples, 95),
+            "mean_ms": sum(samples) / len(samples)}
+
+
+def run(runs: int = 30):
+    with temp_home():
+        db.init_db()
+        db.close_conn()
+        cli = [sys.executable, "-m", "queuectl"]
+        res = {
+            "runs": runs,
+            "python": _time([sys.executable, "-c", "pass"], runs),
+            "enqueue": _time(cli + ["enqueue", '{"id":"s{i}","command":"true"}'], runs),
+            "status": _time(cli + ["status"], runs),
+        }
+    res["enqueue"]["target_ms"] = TARGET_MS
+    return res
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="benchmarks.startup")
+    p.add_argument("--runs", type=int, default=30)
+    args = p.parse_args(argv)
+    r = run(args.runs)
+    print(f"{'command':>8} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for name in ("python", "enqueue", "status"):
+        s = r[name]
+        print(f"{name:>8} {s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['mean_ms']:>8.1f}")
+    verdict = "met" if r["enqueue"]["p50_ms"] < TARGET_MS else "missed"
+    print(f"enqueue target {TARGET_MS:.0f} ms: {verdict}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Run every benchmark and emit one JSON document.
+
+    python -m benchmarks                      # full suite to stdout
+    python -m benchmarks --quick -o run.json  # smaller sizes, to a file
+    python -m benchmarks --only claim latency
+    python -m benchmarks compare base.json new.json
+
+Every case runs against a throwaway ``HOME`` (so a temporary
+``~/.queuectl/queue.db``) and needs no network. ``compare`` flattens two
+result files and prints the relative change of every numeric metric.
+"""
+import argparse
+import json
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+
+from . import broker, claim, contention, db_cycle, enqueue, job_kinds, latency, startup, throughput, writeback
+
+
+def _cases(quick: bool):
+    return {
+        "enqueue": lambda: enqueue.run(20000 if quick else 100000),
+        "claim": lambda: [claim.run(n, 200) for n in ([10000, 100000] if quick else [10000, 100000, 1000000])],
+        "claim_scheduled": lambda: [claim.run(10000, 200, scheduled=n) for n in (10000, 100000)],
+        "db_cycle": lambda: db_cycle.run(2000 if quick else 5000),
+        "writeback": lambda: [writeback.run(2000 if quick else 5000, ms, synchronous=sync)
+                              for sync in ("FULL", "NORMAL") for ms in (0, 20)],
+        "broker": lambda: [broker.run(2000 if quick else 5000, n, pipelined)
+                           for n in (1, 10) for pipelined in (False, True)],
+        "throughput": lambda: [throughput.run(n, 200 if quick else 500) for n in (1, 4, 16)],
+        "latency": lambda: latency.run(4, 20 if quick else 50, idle=1.0 if quick else 2.0),
+        "job_kinds": lambda: job_kinds.run(20 if quick else 50),
+        "startup": lambda: startup.run(10 if quick else 30),
+        "contention": lambda: [contention.run(n, 50 if quick else 200, k) for k in (1, 4) for n in (1, 4, 16)],
+    }
+
+
+def _git_rev():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_suite(only=None, quick: bool = False):
+    cases = _cases(quick)
+    results = {}
+    for name, fn in cases.items():
+        if only and name not in only:
+            continue
+        print(f"running {name}...", file=sys.stderr)
+        t0 = time.perf_counter()
+        results[name] = fn()
+        print(f"  done in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def flatten(obj, prefix=""):
+    """Map ``results`` to ``{"claim.0.p50_ms": 0.4, ...}`` for numeric leaves."""
+    out = {}
+    if isinstance(obj, dict):
+        items = obj.items()
+    elif isinstance(obj, list):
+        items = enumerate(obj)
+    else:
+        if isinstance(obj, (int, float)) and not isinstance(obj, bool):
+            out[prefix] = obj
+        return out
+    for k, v in items:
+        out.update(flatten(v, f"{prefix}.{k}" if prefix else str(k)))
+    return out
+
+
+def compare(base_path: str, new_path: str):
+    with open(base_path) as f:
+        base = flatten(json.load(f)["results"])
+    with open(new_path) as f:
+        new = flatten(json.load(f)["results"])
+    width = max((len(k) for k in base.keys() | new.keys()), default=10)
+    print(f"{'metric':<{width}} {'base':>12} {'new':>12} {'change':>9}")
+    for key in sorted(base.keys() | new.keys()):
+        a, b = base.get(key), new.get(key)
+        if a is None or b is None:
+            change = "n/a"
+        elif a == 0:
+            change = "=" if b == 0 else "inf"
+        else:
+            change = f"{(b - a) / abs(a) * 100:+.1f}%"
+        fa = "-" if a is None else f"{a:.4g}"
+        fb = "-" if b is None else f"{b:.4g}"
+        print(f"{key:<{width}} {fa:>12} {fb:>12} {change:>9}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["compare"]:
+        p = argparse.ArgumentParser(prog="benchmarks compare")
+        p.add_argument("base")
+        p.add_argument("new")
+        args = p.parse_args(argv[1:])
+        compare(args.base, args.new)
+        return 0
+    p = argparse.ArgumentParser(prog="benchmarks")
+    p.add_argument("--quick", action="store_true", help="smaller sizes for a fast smoke run")
+    p.add_argument("--only", nargs="+", choices=sorted(_cases(False)), help="run only these cases")
+    p.add_argument("-o", "--output", help="write JSON here instead of stdout")
+    args = p.parse_args(argv)
+    doc = run_suite(args.only, args.quick)
+    text = json.dumps(doc, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
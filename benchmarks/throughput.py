@@ -0,0 +1,64 @@
+"""End-to-end throughput of no-op shell jobs through real worker processes.
+
+Enqueues ``--jobs`` ``true`` commands, starts a supervisor with N workers and
+times until every job is completed.
+
+    python -m benchmarks.throughput --workers 1 4 16 --jobs 500
+"""
+import argparse
+import multiprocessing as mp
+import os
+import signal
+import time
+
+from queuectl import db
+from queuectl import worker as worker_mod
+
+from ._util import temp_home
+
+
+def run(workers: int, jobs: int, prefetch: int = 1, concurrency: int = 1, command: str = "true"):
+    with temp_home():
+        db.init_db()
+        db.insert_jobs([{"id": f"t{i}", "command": command, "max_retries": 0} for i in range(jobs)])
+        db.close_conn()
+        t0 = time.perf_counter()
+        sup = mp.Process(target=worker_mod.start_workers, args=(workers, 2, prefetch, concurrency))
+        sup.start()
+        deadline = time.time() + 600
+        while time.time() < deadline:
+            counts = db.job_counts()
+            if counts["completed"] + counts["dead"] >= jobs:
+                break
+            time.sleep(0.02)
+        elapsed = time.perf_counter() - t0
+        counts = db.job_counts()
+        os.kill(sup.pid, signal.SIGTERM)
+        sup.join(timeout=30)
+        db.close_conn()
+    done = counts["completed"]
+    return {
+        "workers": workers,
+        "prefetch": prefetch,
+        "concurrency": concurrency,
+        "jobs": jobs,
+        "completed": done,
+        "seconds": elapsed,
+        "jobs_per_sec": done / elapsed if elapsed else None,
+    }
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="benchmarks.throughput")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    p.add_argument("--jobs", type=int, default=500)
+    p.add_argument("--prefetch", type=int, default=1)
+    p.add_argument("--concurrency", type=int, default=1)
+    args = p.parse_args(argv)
+    for n in args.workers:
+        r = run(n, args.jobs, args.prefetch, args.concurrency)
+        print(f"workers={n:<3} {r['completed']} jobs in {r['seconds']:.2f}s: {r['jobs_per_sec']:.0f} jobs/s")
+
+
+if __name__ == "__main__":
+    main()
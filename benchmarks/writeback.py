@@ -0,0 +1,80 @@
+"""Result write-back cost: one commit per job versus group commit.
+
+Claims ``--jobs`` jobs and records each as completed, either with
+``db.complete_job`` (one transaction each) or through a
+``writeback.WriteBack`` (one transaction per batch). Reports jobs per
+second and the number of commits. Under WAL with ``synchronous=FULL`` each
+commit fsyncs the WAL, so commits are the fsync count; ``NORMAL`` (the
+default) defers fsyncs to checkpoints.
+
+    python -m benchmarks.writeback --jobs 5000 --synchronous FULL NORMAL
+"""
+import argparse
+import os
+import time
+
+from queuectl import db
+from queuectl import writeback as writeback_mod
+
+from ._util import temp_home
+
+NOW = db.to_ms("2025-11-08T00:00:00Z")
+
+
+def run(jobs: int, interval_ms: int = 0, batch: int = writeback_mod.DEFAULT_BATCH,
+        synchronous: str = "NORMAL"):
+    old = os.environ.get("QUEUECTL_SQLITE_SYNCHRONOUS")
+    os.environ["QUEUECTL_SQLITE_SYNCHRONOUS"] = synchronous
+    try:
+        with temp_home():
+            db.init_db()
+            db.insert_jobs([{"id": f"j{i}", "command": "true", "created_at": NOW} for i in range(jobs)])
+            wb = writeback_mod.WriteBack(interval_ms, batch) if interval_ms else None
+            t0 = time.perf_counter()
+            done = 0
+            while True:
+                job = db.fetch_and_lock_job("bench", NOW)
+                if not job:
+                    break
+                (wb or db).complete_job(job["id"], "")
+                done += 1
+            commits = done
+            if wb is not None:
+                wb.close()
+                commits = wb.commits
+            elapsed = time.perf_counter() - t0
+            assert db.job_counts()["completed"] == done
+            db.close_conn()
+    finally:
+        if old is None:
+            del os.environ["QUEUECTL_SQLITE_SYNCHRONOUS"]
+        else:
+            os.environ["QUEUECTL_SQLITE_SYNCHRONOUS"] = old
+    return {
+        "jobs": done,
+        "synchronous": synchronous,
+        "writeback_ms": interval_ms,
+        "batch": batch if interval_ms else 1,
+        "result_commits": commits,
+        "seconds": elapsed,
+        "jobs_per_sec": done / elapsed if elapsed else None,
+    }
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="benchmarks.writeback")
+    p.add_argument("--jobs", type=int, default=5000)
+    p.add_argument("--synchronous", nargs="+", default=["FULL", "NORMAL"])
+    p.add_argument("--writeback-ms", type=int, default=20)
+    p.add_argument("--batch", type=int, default=writeback_mod.DEFAULT_BATCH)
+    args = p.parse_args(argv)
+    print(f"{'sync':>6} {'mode':>12} {'commits':>8} {'jobs/s':>8}")
+    for sync in args.synchronous:
+        for ms in (0, args.writeback_ms):
+            r = run(args.jobs, ms, args.batch, sync)
+            mode = f"group {ms}ms" if ms else "per job"
+            print(f"{sync:>6} {mode:>12} {r['result_commits']:>8} {r['jobs_per_sec']:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
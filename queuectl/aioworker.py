@@ -0,0 +1,217 @@
+"""asyncio execution engine: one worker process, many in-flight jobs.
+
+Used by ``worker start --concurrency K``. Jobs run through
+``asyncio.create_subprocess_shell`` so a single process can drive up to K
+shell commands at once. All database calls go through a single helper
+thread, keeping the event loop free while SQLite waits on its lock.
+"""
+import asyncio
+import os
+import random
+import signal
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import callpool
+from . import db
+from . import output as output_mod
+from . import stats
+from . import worker as worker_mod
+
+
+class AsyncWorker:
+    def __init__(self, worker_name: str, base_backoff: int, concurrency: int, wakeup=None, tags=None,
+                 queues=None, slot=None, writeback=None, store=db):
+        self.name = worker_name
+        self.base_backoff = base_backoff
+        self.concurrency = max(1, concurrency)
+        self.wakeup = wakeup
+        self.tags = tags
+        self.cycle = worker_mod.QueueCycle(queues or [(db.DEFAULT_QUEUE, 1)])
+        self.slot = slot
+        self.writeback = writeback
+        # db, or a broker.BrokerClient
+        self.store = store
+        # one thread, so one SQLite connection, for every DB call
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="queuectl-db")
+        self.inflight = set()
+        self.poked = None
+        self.recorder = stats.Recorder(store=store)
+        self.pool = None
+        self.call_executor = None
+
+    async def call_db(self, fn, *args, queue=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _in_queue, queue, fn, args)
+
+    def _on_wakeup(self):
+        # drain the shared socket; whoever reads first, everyone re-polls
+        try:
+            while True:
+                self.wakeup.sock.recv(64)
+        except (BlockingIOError, InterruptedError):
+            pass
+        self.poked.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.poked = asyncio.Event()
+        if self.wakeup is not None:
+            loop.add_reader(self.wakeup.sock.fileno(), self._on_wakeup)
+        max_idle = worker_mod.IDLE_BACKOFF_MAX_NOTIFIED if self.wakeup is not None else worker_mod.IDLE_BACKOFF_MAX
+        idle = worker_mod.IDLE_BACKOFF_MIN
+        try:
+            while not worker_mod._stopping(self.slot):
+                free = self.concurrency - len(self.inflight)
+                jobs = []
+                if free > 0:
+                    t0 = time.perf_counter()
+                    jobs = await self.call_db(worker_mod.claim, self.name, free, self.cycle, self.tags,
+                                              self.slot is None, self.store)
+                    if self.slot is not None:
+                        self.slot.claimed(bool(jobs))
+                    if jobs:
+                        worker_mod._observe_claim(self.recorder, jobs, time.perf_counter() - t0)
+                    for job in jobs:
+                        task = asyncio.ensure_future(self.run_job(job))
+                        self.inflight.add(task)
+                        task.add_done_callback(self.inflight.discard)
+                if self.recorder.due():
+                    await self.call_db(stats.write, self.recorder.take(), self.store)
+                if jobs:
+                    idle = worker_mod.IDLE_BACKOFF_MIN
+                    continue
+                # full, or nothing to claim: wait for a slot, a poke, or the backoff timer
+                self.poked.clear()
+                waiter = asyncio.ensure_future(self.poked.wait())
+                timeout = random.uniform(idle / 2, idle)
+                done, _ = await asyncio.wait(
+                    self.inflight | {waiter}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                waiter.cancel()
+                if waiter in done:
+                    idle = worker_mod.IDLE_BACKOFF_MIN
+                elif not done and free > 0:
+                    idle = min(max_idle, idle * 2)
+            if self.inflight:
+                await asyncio.wait(self.inflight)
+            await self.call_db(stats.write, self.recorder.take(), self.store)
+        finally:
+            if self.wakeup is not None:
+                loop.remove_reader(self.wakeup.sock.fileno())
+            self.executor.shutdown(wait=True)
+            if self.call_executor is not None:
+                self.call_executor.shutdown(wait=True)
+
+    async def run_job(self, job):
+        job_id = job["id"]
+        queue = job["queue"]
+        worker = job.get("locked_by")
+        if job.get("cache_key"):
+            cached = await self.call_db(self.store.cached_result, job["cache_key"], job["cache_ttl"])
+            if cached is not None:
+                await self.record(self.store.complete_job, job_id, cached, worker, queue=queue)
+                return
+        attempts, max_retries, timeout = await self.call_db(worker_mod._job_limits, job)
+        tail_bytes, compress = await self.call_db(output_mod.settings)
+        out = None
+        try:
+            out = output_mod.JobOutput(job_id, tail_bytes, compress)
+            started = time.perf_counter()
+            if job.get("kind") == "callable":
+                returncode, timed_out = await self.run_callable(job, out, timeout)
+            else:
+                returncode, timed_out = await self.run_process(job, out, timeout)
+            if timed_out:
+                out.note(f"Job timed out after {timeout}s\n")
+            out.close()
+            output = out.tail()
+            written = time.perf_counter()
+            self.recorder.observe("execute", written - started)
+            if self.slot is not None:
+                # busy time is per slot, so a full worker counts as busy
+                self.slot.busy((written - started) / self.concurrency)
+            if not timed_out and returncode == 0:
+                if job.get("cache_key"):
+                    await self.call_db(worker_mod.cache_result, self.store, job["cache_key"], output)
+                await self.record(self.store.complete_job, job_id, output, worker, queue=queue)
+            else:
+                await self.record(self.store.fail_job, job_id, attempts, max_retries, self.base_backoff, output,
+                                  worker, queue=queue)
+            self.recorder.observe("writeback", time.perf_counter() - written)
+        except Exception as e:
+            await self.record(self.store.fail_job, job_id, attempts, max_retries, self.base_backoff, str(e),
+                              worker, queue=queue)
+        finally:
+            if out is not None:
+                out.close()
+
+    async def record(self, fn, *args, queue):
+        """Write a job outcome now, or hand it to the write-back buffer."""
+        if self.writeback is None:
+            return await self.call_db(fn, *args, queue=queue)
+        getattr(self.writeback, fn.__name__)(*args, queue=queue)
+
+    async def run_process(self, job, out, timeout):
+        """Run a shell or argv job; return ``(returncode, timed_out)``."""
+        args, shell = worker_mod._process_args(job)
+        kwargs = dict(stdin=subprocess.DEVNULL, stdout=out.stdout, stderr=subprocess.STDOUT,
+                      start_new_session=True)
+        if shell:
+            proc = await asyncio.create_subprocess_shell(args, **kwargs)
+        else:
+            proc = await asyncio.create_subprocess_exec(*args, **kwargs)
+
+        async def _pump():
+            if out.piped:
+                while True:
+                    chunk = await proc.stdout.read(worker_mod.READ_CHUNK)
+                    if not chunk:
+                        break
+                    out.feed(chunk)
+            return await proc.wait()
+
+        try:
+            return await asyncio.wait_for(_pump(), timeout), False
+        except asyncio.TimeoutError:
+            _kill(proc)
+            await proc.wait()
+            return None, True
+        except asyncio.CancelledError:
+            _kill(proc)
+            raise
+
+    async def run_callable(self, job, out, timeout):
+        """Run a callable job in the warm pool, off the event loop."""
+        if self.pool is None:
+            # at most one pool child per slot, and no more than there are CPUs
+            size = min(self.concurrency, os.cpu_count() or 1)
+            self.pool = await self.call_db(callpool.get_pool, size)
+            self.call_executor = ThreadPoolExecutor(max_workers=self.pool.size,
+                                                    thread_name_prefix="queuectl-call")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.call_executor, worker_mod.run_callable, job, out, timeout, self.pool
+        )
+
+
+def _in_queue(queue, fn, args):
+    with db.use_queue(queue):
+        return fn(*args)
+
+
+def _kill(proc):
+    # kill the whole session: grandchildren of the shell would otherwise
+    # keep the output pipe (and proc.wait()) open
+    if proc is not None:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def run(worker_name: str, base_backoff: int, concurrency: int, wakeup=None, tags=None, queues=None,
+        slot=None, writeback=None, store=db):
+    asyncio.run(AsyncWorker(worker_name, base_backoff, concurrency, wakeup, tags, queues, slot,
+                            writeback, store).run())
@@ -0,0 +1,146 @@
+"""Queue-depth-driven sizing of the worker pool.
+
+``worker start --min N --max M`` lets the supervisor grow and shrink its
+worker processes. Every :attr:`Autoscaler.INTERVAL` seconds it samples
+
+- the ready backlog: pending and failed jobs in the workers' queues,
+  read from the trigger-maintained counters,
+- the claim hit rate: the share of claim attempts that returned a job,
+- the busy fraction: the share of worker time spent running jobs,
+- worker CPU: cores used by the worker processes and the jobs they have
+  reaped (Linux ``/proc``; skipped elsewhere).
+
+It scales up while there is a backlog, workers are busy and the host still
+has CPU to spare. It scales down while workers mostly idle and find nothing
+to claim. A condition must hold for several consecutive samples, and each
+change is followed by a cooldown, so a short burst or lull does not make
+the pool flap.
+"""
+import os
+import time
+from typing import Optional
+
+from . import db
+
+try:
+    _CLK_TCK = os.sysconf("SC_CLK_TCK")
+except (AttributeError, ValueError, OSError):
+    _CLK_TCK = 100
+
+
+def cpu_seconds(pid: int) -> Optional[float]:
+    """CPU time used by ``pid`` and its reaped children, or ``None`` if unknown."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    # the command name may contain spaces; fields resume after its ')'
+    fields = data[data.rfind(b")") + 2:].split()
+    try:
+        return sum(int(v) for v in fields[11:15]) / _CLK_TCK
+    except (ValueError, IndexError):
+        return None
+
+
+def ready_depth(queues, store=db) -> int:
+    """Pending plus failed jobs over ``queues`` (names)."""
+    depth = 0
+    for name in queues:
+        with db.use_queue(name):
+            counts = store.job_counts()
+        depth += counts.get("pending", 0) + counts.get("failed", 0)
+    return depth
+
+
+class Autoscaler:
+    """Decide the next worker count from periodic load samples."""
+
+    # seconds between samples
+    INTERVAL = 2.0
+    # consecutive samples a condition must hold before acting
+    UP_SAMPLES = 2
+    DOWN_SAMPLES = 5
+    # seconds after any change before scaling up / down again
+    UP_COOLDOWN = 4.0
+    DOWN_COOLDOWN = 30.0
+    # busy fraction above which workers are saturated / below which they idle
+    BUSY_HIGH = 0.8
+    BUSY_LOW = 0.3
+    # claim hit rate below which workers mostly find nothing
+    CLAIM_LOW = 0.5
+    # share of host cores in use above which more workers would not help
+    CPU_HIGH = 0.9
+
+    def __init__(self, min_workers: int, max_workers: int, ncpu: Optional[int] = None):
+        self.min = max(1, min_workers)
+        self.max = max(self.min, max_workers)
+        self.ncpu = ncpu or os.cpu_count() or 1
+        self.up_streak = 0
+        self.down_streak = 0
+        self.last_change = float("-inf")
+        self.prev = {}
+        self.prev_at = None
+
+    def clamp(self, n: int) -> int:
+        return min(self.max, max(self.min, n))
+
+    def sample(self, workers, now: Optional[float] = None):
+        """Return ``(hit_rate, busy, cpu)`` since the previous sample.
+
+        ``workers`` are ``(key, load, pid)`` triples, ``load`` being the
+        worker's running ``[claims, hits, busy_seconds]``. ``hit_rate`` is
+        ``None`` when no claim was attempted; ``cpu`` is a share of host
+        cores, or ``None`` when it cannot be read.
+        """
+        now = time.monotonic() if now is None else now
+        elapsed = now - self.prev_at if self.prev_at is not None else None
+        claims = hits = busy = cpu = 0.0
+        cpu_known = True
+        seen = {}
+        for key, load, pid in workers:
+            cur = (load[0], load[1], load[2], cpu_seconds(pid))
+            seen[key] = cur
+            before = self.prev.get(key)
+            if before is None:
+                # started since the last sample; counted from the next one
+                continue
+            claims += cur[0] - before[0]
+            hits += cur[1] - before[1]
+            busy += cur[2] - before[2]
+            if cur[3] is None or before[3] is None:
+                cpu_known = False
+            else:
+                cpu += cur[3] - before[3]
+        counted = sum(1 for key in seen if key in self.prev)
+        self.prev, self.prev_at = seen, now
+        if not elapsed or not counted:
+            return None, 0.0, None
+        hit_rate = hits / claims if claims else None
+        busy_frac = min(1.0, busy / (elapsed * counted))
+        cpu_frac = cpu / (elapsed * self.ncpu) if cpu_known else None
+        return hit_rate, busy_frac, cpu_frac
+
+    def decide(self, current: int, depth: int, hit_rate, busy: float, cpu,
+               now: Optional[float] = None) -> int:
+        """Return the worker count to move to (``current`` to stay put)."""
+        now = time.monotonic() if now is None else now
+        want_up = (current < self.max and depth > 0 and busy >= self.BUSY_HIGH
+                   and (cpu is None or cpu < self.CPU_HIGH))
+        # no claims at all while not busy: idle workers backing off
+        want_down = (current > self.min and busy <= self.BUSY_LOW
+                     and (hit_rate is None or hit_rate < self.CLAIM_LOW))
+        self.up_streak = self.up_streak + 1 if want_up else 0
+        self.down_streak = self.down_streak + 1 if want_down else 0
+        since = now - self.last_change
+        target = current
+        if self.up_streak >= self.UP_SAMPLES and since >= self.UP_COOLDOWN:
+            # at most double, and never more workers than queued jobs need
+            target = current + min(max(1, current), depth)
+        elif self.down_streak >= self.DOWN_SAMPLES and since >= self.DOWN_COOLDOWN:
+            target = current - max(1, current // 4)
+        target = self.clamp(target)
+        if target != current:
+            self.up_streak = self.down_streak = 0
+            self.last_change = now
+        return target
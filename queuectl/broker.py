@@ -0,0 +1,587 @@
+"""Broker: one process owns the database, workers on other hosts talk to it.
+
+SQLite must not be shared over a network filesystem, so ``queuectl broker
+serve`` runs on the host holding ``~/.queuectl`` and serves job operations
+over TCP or a Unix socket. ``worker start --broker ADDR`` then runs workers
+anywhere: each process keeps one persistent connection per thread and uses
+a :class:`BrokerClient` wherever it would otherwise use ``db``. The broker
+also runs what a local supervisor would: the scheduler, the lease reaper
+and background GC.
+
+Frames are a 4-byte big-endian length followed by a UTF-8 JSON object.
+A request is ``{"id": n, "op": ..., "queue": ..., ...}`` and its reply
+``{"id": n, "ok": true, "result": ...}`` or ``{"id": n, "ok": false,
+"error": "..."}``. Replies on a connection come back in request order, so a
+client may pipeline: job results are sent without waiting for the reply,
+which is read (and any error raised) with the next round trip. A
+connection opens with ``hello``, carrying ``QUEUECTL_BROKER_TOKEN`` if the
+broker was started with one. There is no encryption; keep the broker on a
+trusted network.
+"""
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from . import db
+from . import lease
+from . import notify
+from . import retention
+from . import scheduler as scheduler_mod
+
+PROTOCOL_VERSION = 1
+
+DEFAULT_PORT = 7463
+
+_HEADER = struct.Struct(">I")
+# largest frame either side accepts
+MAX_FRAME = 64 * 1024 * 1024
+
+# seconds a client reuses the broker's config before asking again
+CONFIG_TTL = 1.0
+
+# longest a ``wait`` request is held open, whatever the client asks for
+MAX_WAIT = 30.0
+
+
+class BrokerError(Exception):
+    """The broker rejected a request, or could not be reached."""
+
+
+def parse_address(text: str):
+    """``(family, address)`` for ``host:port``, ``:port``, ``unix:PATH`` or a socket path."""
+    if text.startswith("unix:"):
+        return socket.AF_UNIX, text[5:]
+    if "/" in text:
+        return socket.AF_UNIX, text
+    host, sep, port = text.rpartition(":")
+    if not sep:
+        host, port = text, str(DEFAULT_PORT)
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError(f"Invalid broker address: {text!r}") from None
+    if not 0 <= port < 65536:
+        raise ValueError(f"Invalid broker address: {text!r}")
+    return socket.AF_INET, (host.strip("[]") or "127.0.0.1", port)
+
+
+def _token() -> Optional[str]:
+    return os.environ.get("QUEUECTL_BROKER_TOKEN") or None
+
+
+def send_frame(sock, obj):
+    data = json.dumps(obj, separators=(",", ":")).encode()
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def read_frame(f) -> Optional[Dict[str, Any]]:
+    """Read one frame from file object ``f``; None at a clean end of stream."""
+    header = f.read(_HEADER.size)
+    if not header:
+        return None
+    if len(header) < _HEADER.size:
+        raise ConnectionError("connection closed mid-frame")
+    (size,) = _HEADER.unpack(header)
+    if size > MAX_FRAME:
+        # cannot resynchronise after skipping it
+        raise ConnectionError(f"frame of {size} bytes is too large")
+    data = f.read(size)
+    if len(data) < size:
+        raise ConnectionError("connection closed mid-frame")
+    return json.loads(data)
+
+
+# -- server ----------------------------------------------------------------
+
+
+class Signal:
+    """Generation counter that idle workers' ``wait`` requests block on."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.generation = 0
+
+    def fire(self):
+        with self.cond:
+            self.generation += 1
+            self.cond.notify_all()
+
+    def wait(self, timeout: float) -> bool:
+        with self.cond:
+            start = self.generation
+            return self.cond.wait_for(lambda: self.generation != start, timeout)
+
+
+def _op_claim(req):
+    return db.fetch_and_lock_jobs(req["worker"], int(req["n"]), tags=req.get("tags"))
+
+
+def _op_release(req):
+    return db.release_jobs(req["worker"], req["ids"])
+
+
+def _op_complete(req):
+    return db.complete_job(req["job"], req.get("output"), req.get("worker"))
+
+
+def _op_fail(req):
+    return db.fail_job(req["job"], req["attempts"], req.get("max_retries"), req["base"], req.get("output"),
+                       req.get("worker"))
+
+
+def _op_results(req):
+    return db.write_results([tuple(r) for r in req["results"]])
+
+
+def _op_heartbeat(req):
+    return db.renew_leases(req["worker"], req.get("lease"))
+
+
+def _op_enqueue(req):
+    if not req.get("duplicates"):
+        return db.insert_jobs(req["jobs"])
+    duplicates = []
+    errors = db.insert_jobs(req["jobs"], duplicates)
+    return {"errors": errors, "duplicates": duplicates}
+
+
+def _op_counts(req):
+    return db.job_counts()
+
+
+def _op_config(req):
+    return db.config_snapshot()
+
+
+def _op_latency(req):
+    return db.add_latency({stage: tuple(v) for stage, v in req["deltas"].items()})
+
+
+def _op_cache_get(req):
+    return db.cached_result(req["key"], req["ttl"])
+
+
+def _op_cache_put(req):
+    return db.cache_result(req["key"], req["output"])
+
+
+OPS = {
+    "claim": _op_claim,
+    "release": _op_release,
+    "complete": _op_complete,
+    "fail": _op_fail,
+    "results": _op_results,
+    "heartbeat": _op_heartbeat,
+    "enqueue": _op_enqueue,
+    "counts": _op_counts,
+    "config": _op_config,
+    "latency": _op_latency,
+    "cache_get": _op_cache_get,
+    "cache_put": _op_cache_put,
+}
+
+# ops after which idle workers may find something to claim (a completed
+# job may unblock its dependents)
+_WAKES = {"release", "complete", "fail", "results", "enqueue"}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        if self.server.address_family != socket.AF_UNIX:
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        try:
+            hello = read_frame(self.rfile)
+            if hello is None:
+                return
+            if hello.get("op") != "hello" or hello.get("version") != PROTOCOL_VERSION:
+                send_frame(self.connection, {"id": hello.get("id"), "ok": False,
+                                             "error": f"expected hello, protocol version {PROTOCOL_VERSION}"})
+                return
+            if self.server.token is not None and hello.get("token") != self.server.token:
+                send_frame(self.connection, {"id": hello.get("id"), "ok": False, "error": "bad token"})
+                return
+            send_frame(self.connection, {"id": hello.get("id"), "ok": True, "result": PROTOCOL_VERSION})
+            while True:
+                req = read_frame(self.rfile)
+                if req is None:
+                    return
+                send_frame(self.connection, self.server.dispatch(req))
+        except (OSError, ValueError):
+            # client went away or spoke garbage; drop the connection
+            return
+        finally:
+            db.close_conn()
+
+
+class _ServerMixin:
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def setup_broker(self, token: Optional[str]):
+        self.token = token
+        self.signal = Signal()
+        self.ready = set()
+        self.ready_lock = threading.Lock()
+
+    def _queue(self, name: Optional[str]) -> str:
+        name = db.check_queue_name(name or db.DEFAULT_QUEUE)
+        if name not in self.ready:
+            with self.ready_lock:
+                if name not in self.ready:
+                    with db.use_queue(name):
+                        db.init_db()
+                    self.ready.add(name)
+        return name
+
+    def dispatch(self, req) -> Dict[str, Any]:
+        op = req.get("op")
+        try:
+            if op == "wait":
+                timeout = min(MAX_WAIT, max(0.0, float(req.get("timeout") or 0)))
+                return {"id": req.get("id"), "ok": True, "result": self.signal.wait(timeout)}
+            fn = OPS.get(op)
+            if fn is None:
+                raise ValueError(f"unknown op {op!r}")
+            with db.use_queue(self._queue(req.get("queue"))):
+                result = fn(req)
+        except Exception as e:
+            return {"id": req.get("id"), "ok": False, "error": f"{type(e).__name__}: {e}"}
+        if op in _WAKES:
+            self.signal.fire()
+            if op == "enqueue":
+                # workers on the broker's own host
+                notify.poke()
+        return {"id": req.get("id"), "ok": True, "result": result}
+
+
+class TCPServer(_ServerMixin, socketserver.ThreadingTCPServer):
+    pass
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class UnixServer(_ServerMixin, socketserver.ThreadingUnixStreamServer):
+        pass
+
+
+def make_server(address: str, token: Optional[str] = None):
+    family, addr = parse_address(address)
+    if family == socket.AF_UNIX:
+        try:
+            os.unlink(addr)
+        except FileNotFoundError:
+            pass
+        server = UnixServer(addr, _Handler)
+    else:
+        server = TCPServer(addr, _Handler)
+    server.setup_broker(token)
+    return server
+
+
+def serve(address: str, stop: Optional[threading.Event] = None):
+    """Serve ``address`` until ``stop`` is set (or forever), doing the housekeeping too."""
+    db.init_db()
+    server = make_server(address, _token())
+    print(f"Broker listening on {address}", flush=True)
+    thread = threading.Thread(target=server.serve_forever, name="queuectl-broker", daemon=True)
+    thread.start()
+    stop = stop or threading.Event()
+    gc = retention.BackgroundGC()
+    scheduler = scheduler_mod.Scheduler(db.queue_names())
+    reaper = lease.Reaper(db.queue_names())
+    enqueued = None
+    try:
+        while not stop.wait(scheduler.wait(0.5)):
+            # pick up queues created since, by either side
+            scheduler.queues = reaper.queues = db.queue_names()
+            try:
+                promoted = scheduler.tick()
+                reaped = reaper.tick()
+            except Exception as e:
+                print("broker housekeeping failed:", e, flush=True)
+                continue
+            # jobs enqueued on this host without going through the broker
+            total = db.all_job_totals().get("enqueued")
+            if promoted or reaped or (enqueued is not None and total != enqueued):
+                server.signal.fire()
+            enqueued = total
+            gc.tick()
+    finally:
+        server.shutdown()
+        server.server_close()
+        if server.address_family == socket.AF_UNIX:
+            try:
+                os.unlink(server.server_address)
+            except OSError:
+                pass
+        db.close_conn()
+
+
+# -- client ----------------------------------------------------------------
+
+
+class _Conn:
+    def __init__(self, address: str, token: Optional[str], timeout: float):
+        family, addr = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(addr)
+            if family != socket.AF_UNIX:
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            self.sock.close()
+            raise
+        self.rfile = self.sock.makefile("rb")
+        self.next_id = 0
+        # ids sent whose replies have not been read, in order
+        self.unanswered = []
+        # errors replied to posted requests, for the client to report
+        self.failed = []
+        self.closed = False
+        try:
+            self.call("hello", version=PROTOCOL_VERSION, token=token)
+        except Exception:
+            self.close()
+            raise
+
+    def send(self, op: str, **args) -> int:
+        self.next_id += 1
+        send_frame(self.sock, dict(args, id=self.next_id, op=op))
+        self.unanswered.append(self.next_id)
+        return self.next_id
+
+    def reply(self, req_id: int):
+        """Read replies up to ``req_id``'s and return its result.
+
+        Errors in earlier (posted) replies go to ``failed`` instead of
+        raising, so a rejected result never costs the reply to a claim
+        sent after it.
+        """
+        while self.unanswered:
+            expected = self.unanswered.pop(0)
+            try:
+                rep = read_frame(self.rfile)
+            except BaseException:
+                # interrupted mid-frame (even by Ctrl+C): the stream is out of step
+                self.close()
+                raise
+            if rep is None or rep.get("id") != expected:
+                self.close()
+                raise ConnectionError("broker closed the connection")
+            if expected == req_id:
+                if not rep.get("ok"):
+                    raise BrokerError(rep.get("error") or "request failed")
+                return rep.get("result")
+            if not rep.get("ok"):
+                self.failed.append(rep.get("error") or "request failed")
+        raise BrokerError(f"no request {req_id} outstanding")
+
+    def call(self, op: str, **args):
+        return self.reply(self.send(op, **args))
+
+    def close(self):
+        self.closed = True
+        try:
+            self.rfile.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def _report(conn: _Conn):
+    """Print the errors the broker replied to posted requests."""
+    while conn.failed:
+        print("broker: posted request failed:", conn.failed.pop(0), flush=True)
+
+
+class BrokerClient:
+    """``db``-shaped access to a broker for worker code.
+
+    Methods mirror the ``db`` functions workers call and act on
+    ``db.current_queue()``, so ``worker.claim``, :class:`lease.Heartbeat`,
+    :class:`writeback.WriteBack` and friends take either one as their
+    ``store``. Each thread gets its own persistent connection.
+    """
+
+    def __init__(self, address: str, token: Optional[str] = None, timeout: float = 60.0):
+        parse_address(address)
+        self.address = address
+        self.token = token if token is not None else _token()
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self.local = threading.local()
+        self.config = None
+
+    def _conn(self) -> _Conn:
+        if self.pid != os.getpid():
+            # a forked child must not share its parent's sockets
+            self.pid = os.getpid()
+            self.local = threading.local()
+        conn = getattr(self.local, "conn", None)
+        if conn is None or conn.closed:
+            try:
+                conn = _Conn(self.address, self.token, MAX_WAIT + self.timeout)
+            except OSError as e:
+                raise BrokerError(f"cannot reach broker at {self.address}: {e}") from None
+            self.local.conn = conn
+        return conn
+
+    def _io(self, fn, *args, **kwargs):
+        conn = self._conn()
+        try:
+            return fn(conn, *args, **kwargs)
+        except (OSError, ValueError) as e:
+            # replies may be half read; start over on a new connection
+            conn.close()
+            raise BrokerError(f"lost broker at {self.address}: {e}") from None
+        finally:
+            _report(conn)
+
+    def call(self, op: str, **args):
+        """Send one request and wait for its reply."""
+        return self._io(lambda c: c.call(op, queue=db.current_queue(), **args))
+
+    def post(self, op: str, **args):
+        """Send a request without waiting; its reply is read with the next :meth:`call`.
+
+        An error reply is printed then, not raised: the posting code has moved on.
+        """
+        self._io(lambda c: c.send(op, queue=db.current_queue(), **args))
+
+    def pipeline(self, requests: List[Dict[str, Any]]) -> List[Any]:
+        """Send every ``{"op": ..., **args}`` request, then read all the replies."""
+        def run(conn):
+            ids = [conn.send(**dict(r, queue=r.get("queue") or db.current_queue())) for r in requests]
+            results, error = [], None
+            # read every reply before raising, so none is left for the next call
+            for i in ids:
+                try:
+                    results.append(conn.reply(i))
+                except BrokerError as e:
+                    results.append(None)
+                    error = error or e
+            if error is not None:
+                raise error
+            return results
+        return self._io(run)
+
+    def close(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None and self.pid == os.getpid():
+            try:
+                # wait for results still in flight
+                if conn.unanswered and not conn.closed:
+                    conn.reply(conn.unanswered[-1])
+            except (OSError, ValueError) as e:
+                # their jobs are requeued when the leases run out
+                print(f"broker: {len(conn.unanswered) + 1} requests unconfirmed at exit: {e}", flush=True)
+            except BrokerError as e:
+                conn.failed.append(str(e))
+            finally:
+                _report(conn)
+                conn.close()
+        self.local = threading.local()
+
+    # db-shaped API
+
+    def fetch_and_lock_jobs(self, worker_id: str, n: int, now=None, tags=None):
+        try:
+            return self.call("claim", worker=worker_id, n=n, tags=list(tags or []) or None)
+        except BrokerError as e:
+            # like a busy database: back off and poll again
+            print("claim via broker failed:", e, flush=True)
+            return []
+
+    def promote_due(self, now=None, limit=None) -> int:
+        # the broker runs the scheduler
+        return 0
+
+    def release_jobs(self, worker_id: str, job_ids):
+        return self.call("release", worker=worker_id, ids=list(job_ids))
+
+    def complete_job(self, job_id: str, output: Optional[str], worker: Optional[str] = None):
+        self.post("complete", job=job_id, output=output, worker=worker)
+
+    def fail_job(self, job_id: str, attempts: int, max_retries: Optional[int], base: int,
+                 output: Optional[str], worker: Optional[str] = None):
+        self.post("fail", job=job_id, attempts=attempts, max_retries=max_retries, base=base, output=output,
+                  worker=worker)
+
+    def write_results(self, results) -> int:
+        return self.call("results", results=[list(r) for r in results])
+
+    def renew_leases(self, worker_id: str, lease: Optional[int] = None) -> int:
+        return self.call("heartbeat", worker=worker_id, lease=lease)
+
+    def lease_ms(self) -> int:
+        return db.lease_ms()
+
+    def insert_jobs(self, jobs, duplicates=None) -> list:
+        if duplicates is None:
+            return [tuple(e) for e in self.call("enqueue", jobs=list(jobs))]
+        result = self.call("enqueue", jobs=list(jobs), duplicates=True)
+        duplicates.extend(tuple(d) for d in result["duplicates"])
+        return [tuple(e) for e in result["errors"]]
+
+    def job_counts(self) -> Dict[str, int]:
+        return self.call("counts")
+
+    def cached_result(self, key, ttl):
+        try:
+            return self.call("cache_get", key=key, ttl=ttl)
+        except BrokerError:
+            return None
+
+    def cache_result(self, key, output):
+        self.post("cache_put", key=key, output=output)
+
+    def add_latency(self, deltas):
+        self.post("latency", deltas={stage: [list(c), t] for stage, (c, t) in deltas.items()})
+
+    def config_snapshot(self) -> Dict[str, str]:
+        """The broker's config table, refreshed at most every :data:`CONFIG_TTL` seconds."""
+        cached = self.config
+        if cached is not None and time.monotonic() - cached[0] < CONFIG_TTL:
+            return cached[1]
+        try:
+            values = self.call("config")
+        except BrokerError:
+            if cached is None:
+                raise
+            # keep going on the last known config until the broker is back
+            return cached[1]
+        self.config = (time.monotonic(), values)
+        return values
+
+    def attach(self):
+        """Read config from the broker in this process (``db.get_config`` and friends)."""
+        db.set_config_source(self.config_snapshot)
+        return self
+
+
+class Wakeup:
+    """Stand-in for ``notify.WakeupChannel``: an idle worker long-polls the broker."""
+
+    # seconds per poll, so a draining worker is never held up for long
+    MAX_HOLD = 1.0
+
+    def __init__(self, client: BrokerClient):
+        self.client = client
+
+    def wait(self, timeout: float) -> bool:
+        try:
+            return bool(self.client.call("wait", timeout=min(timeout, self.MAX_HOLD)))
+        except BrokerError:
+            time.sleep(timeout)
+            return False
+
+    def close(self):
+        pass
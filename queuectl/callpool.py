@@ -0,0 +1,226 @@
+"""Warm process pool for ``callable`` jobs.
+
+A ``callable`` job names a Python function (``"pkg.mod:func"``) and its
+``args``. Instead of starting an interpreter per job, each worker keeps a few
+long-lived child processes, forked from a forkserver that has already
+imported queuectl and the modules listed in ``callable-preload``. Imported
+functions stay cached in the child, so a short job costs a pipe round trip.
+
+A child running past the job timeout is killed (with anything it started)
+and replaced. Children are also replaced after ``callable-max-tasks`` calls
+to bound leaks from user code. While a call runs, the child's stdout and
+stderr (file descriptors 1 and 2) point at the job's log file.
+
+Config keys: ``callable-workers``, ``callable-max-tasks``, ``callable-preload``.
+"""
+import importlib
+import json
+import multiprocessing as mp
+import os
+import signal
+import sys
+import threading
+import traceback
+from typing import List, Optional, Tuple
+
+from . import db
+
+DEFAULT_MAX_TASKS = 100
+
+# returncodes reported by CallPool.call
+OK = 0
+ERROR = 1
+DIED = -1
+
+
+def resolve(path: str):
+    """Import ``pkg.mod:func`` (``func`` may be dotted) and return the object."""
+    module, sep, attr = path.partition(":")
+    if not sep or not module or not attr:
+        raise ValueError(f"Invalid callable {path!r}; expected 'module:function'")
+    obj = importlib.import_module(module)
+    for part in attr.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+def _invoke(fn, args):
+    if isinstance(args, dict):
+        return fn(**args)
+    if isinstance(args, list):
+        return fn(*args)
+    if args is None:
+        return fn()
+    return fn(args)
+
+
+def _child_main(conn, preload: List[str]):
+    # own session, so a timeout kill also takes anything the function spawned
+    os.setsid()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            traceback.print_exc()
+    funcs = {}
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        if msg is None:
+            break
+        path, args, log_path = msg
+        fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.dup2(fd, 1)
+        os.dup2(fd, 2)
+        os.close(fd)
+        rc = OK
+        try:
+            fn = funcs.get(path)
+            if fn is None:
+                fn = funcs[path] = resolve(path)
+            result = _invoke(fn, args)
+            if result is not None:
+                print(json.dumps(result, default=str))
+        except BaseException:
+            traceback.print_exc()
+            rc = ERROR
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        try:
+            conn.send(rc)
+        except (EOFError, OSError):
+            break
+    # skip interpreter teardown; nothing here needs finalizing
+    os._exit(0)
+
+
+class _Child:
+    def __init__(self, ctx, preload: List[str]):
+        self.conn, child_conn = ctx.Pipe()
+        self.proc = ctx.Process(target=_child_main, args=(child_conn, preload), daemon=True)
+        self.proc.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def kill(self):
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            self.proc.kill()
+        self.proc.join()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (EOFError, OSError):
+            pass
+        self.proc.join(1)
+        if self.proc.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class CallPool:
+    """``size`` warm children; :meth:`call` is thread-safe and blocks."""
+
+    def __init__(self, size: int = 1, max_tasks: int = DEFAULT_MAX_TASKS, preload=()):
+        self.size = max(1, size)
+        self.max_tasks = max(1, max_tasks)
+        self.preload = list(preload)
+        if "forkserver" in mp.get_all_start_methods():
+            self.ctx = mp.get_context("forkserver")
+            self.ctx.set_forkserver_preload(["queuectl.callpool"] + self.preload)
+        else:
+            self.ctx = mp.get_context("spawn")
+        self.slots = threading.BoundedSemaphore(self.size)
+        self.lock = threading.Lock()
+        self.idle = [self._spawn() for _ in range(self.size)]
+
+    def _spawn(self) -> _Child:
+        return _Child(self.ctx, self.preload)
+
+    def _take(self) -> _Child:
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        return self._spawn()
+
+    def _give(self, child: _Child):
+        with self.lock:
+            self.idle.append(child)
+
+    def call(self, path: str, args, log_path: str, timeout: Optional[float]) -> Tuple[int, bool]:
+        """Run ``path(args)`` in a child; return ``(returncode, timed_out)``.
+
+        ``returncode`` is ``OK``, ``ERROR`` (it raised; the traceback is in
+        the log) or ``DIED`` (the child exited mid-call).
+        """
+        with self.slots:
+            child = self._take()
+            try:
+                child.conn.send((path, args, log_path))
+                if not child.conn.poll(timeout):
+                    child.kill()
+                    self._give(self._spawn())
+                    return ERROR, True
+                rc = child.conn.recv()
+            except (EOFError, OSError):
+                child.kill()
+                self._give(self._spawn())
+                return DIED, False
+            child.tasks += 1
+            if child.tasks >= self.max_tasks:
+                child.stop()
+                child = self._spawn()
+            self._give(child)
+            return rc, False
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for child in idle:
+            child.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def settings(default_size: int = 1):
+    """Return ``(size, max_tasks, preload)`` from config."""
+    try:
+        size = int(db.get_config("callable-workers") or default_size)
+    except ValueError:
+        size = default_size
+    try:
+        max_tasks = int(db.get_config("callable-max-tasks") or DEFAULT_MAX_TASKS)
+    except ValueError:
+        max_tasks = DEFAULT_MAX_TASKS
+    preload = [m.strip() for m in (db.get_config("callable-preload") or "").split(",") if m.strip()]
+    return size, max_tasks, preload
+
+
+def get_pool(default_size: int = 1) -> CallPool:
+    """This process's pool, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            size, max_tasks, preload = settings(default_size)
+            _pool = CallPool(size, max_tasks, preload)
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
@@ -1,14 +1,20 @@
 import argparse
+import itertools
 import json
 import os
+import re
+import shlex
 import sys
 import time
-import subprocess
-from datetime import datetime
 
 from . import db
-from . import worker as worker_mod
-from . import metrics as metrics_mod
+from . import notify
+from . import retention
+from . import writeback as writeback_mod
+
+# The worker, broker, metrics and stats modules (and multiprocessing,
+# socketserver, http.server behind them) are imported by the commands that
+# use them, so one-shot commands like enqueue and status start quickly.
 
 
 PID_FILE = os.path.expanduser("~/.queuectl/pid")
@@ -29,64 +35,300 @@ def _read_pid():
         return None
 
 
-def enqueue(args):
-    data = args.json
-    # ensure DB and tables exist
-    db.init_db()
-    try:
-        job = json.loads(data)
-    except Exception:
-        print("Invalid JSON")
-        return 2
-    if "id" not in job or "command" not in job:
-        print("Job must include id and command")
-        return 2
+def _prepare_job(job, default_retries: int, now: int):
+    """Validate a decoded job and fill in defaults. Raises ValueError."""
+    if not isinstance(job, dict):
+        raise ValueError("Job must be a JSON object")
+    if "id" not in job:
+        raise ValueError("Job must include id and command")
+    _prepare_kind(job)
     job.setdefault("state", "pending")
     job.setdefault("attempts", 0)
     if "max_retries" not in job:
-        cfg = db.get_config("default-max-retries")
-        job["max_retries"] = int(cfg) if cfg else 3
+        job["max_retries"] = default_retries
     # accept priority if provided
     job.setdefault("priority", job.get("priority", 0))
-    # accept tags and run_at scheduling
-    if "tags" in job and isinstance(job["tags"], list):
-        job["tags"] = ",".join(job["tags"])
+    # accept tags (list or comma-separated) and run_at scheduling
+    if "tags" in job:
+        job["tags"] = ",".join(db.split_tags(job["tags"])) or None
     job.setdefault("run_at", job.get("run_at"))
-    now = datetime.utcnow().isoformat() + "Z"
+    _prepare_deps(job)
+    _prepare_dedupe(job)
     job.setdefault("created_at", now)
     job.setdefault("updated_at", now)
+    # timestamps are given as ISO-8601 (or epoch ms) and stored as epoch ms
+    for col in db.TIME_COLUMNS:
+        if col in job:
+            job[col] = db.to_ms(job[col])
+    return job
+
+
+def _prepare_deps(job):
+    """Check ``depends_on`` (ids, or a comma-separated string) and ``on_dep_failure``."""
+    deps = job.get("depends_on")
+    if deps is not None:
+        if isinstance(deps, str):
+            deps = db.split_tags(deps)
+        if not isinstance(deps, list) or not all(isinstance(d, str) and d for d in deps):
+            raise ValueError("depends_on must be a list of job ids")
+        if any("," in d for d in deps):
+            raise ValueError("depends_on ids cannot contain commas")
+        if job["id"] in deps:
+            raise ValueError("A job cannot depend on itself")
+        job["depends_on"] = db.split_tags(deps) or None
+    policy = job.get("on_dep_failure")
+    if policy is not None and policy not in db.DEP_POLICIES:
+        raise ValueError(f"on_dep_failure must be one of: {', '.join(db.DEP_POLICIES)}")
+
+
+def _prepare_dedupe(job):
+    """Check ``idempotency_key``; turn ``cache_ttl`` (seconds or a duration like ``10m``) into ms."""
+    key = job.get("idempotency_key")
+    if key is not None and (not isinstance(key, str) or not key):
+        raise ValueError("idempotency_key must be a non-empty string")
+    ttl = job.get("cache_ttl")
+    if ttl is not None:
+        if isinstance(ttl, str):
+            ttl = retention.parse_duration(ttl)
+        if isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or ttl <= 0:
+            raise ValueError("cache_ttl must be a positive number of seconds or a duration like '10m'")
+        job["cache_ttl"] = int(ttl * 1000)
+
+
+def _prepare_kind(job):
+    """Turn ``argv``/``callable`` jobs into ``kind`` + ``payload`` (and a display ``command``)."""
+    kinds = [k for k in ("command", "argv", "callable") if k in job]
+    if len(kinds) != 1:
+        raise ValueError("Job must include exactly one of command, argv or callable")
+    if "argv" in job:
+        argv = job.pop("argv")
+        if not argv or not isinstance(argv, list) or not all(isinstance(a, str) for a in argv):
+            raise ValueError("argv must be a non-empty list of strings")
+        job["kind"] = "argv"
+        job["payload"] = json.dumps(argv)
+        job["command"] = shlex.join(argv)
+    elif "callable" in job:
+        target = job.pop("callable")
+        args = job.pop("args", None)
+        if not isinstance(target, str) or not re.fullmatch(r"[\w.]+:[\w.]+", target):
+            raise ValueError("callable must look like 'package.module:function'")
+        job["kind"] = "callable"
+        job["payload"] = json.dumps({"callable": target, "args": args})
+        job["command"] = target
+    else:
+        job["kind"] = "shell"
+
+
+def _display(job):
+    """Render a job row for output, with timestamps back in ISO-8601."""
+    for col in db.TIME_COLUMNS:
+        if col in job:
+            job[col] = db.ms_to_iso(job[col])
+    return job
+
+
+def _default_retries() -> int:
+    cfg = db.get_config("default-max-retries")
+    return int(cfg) if cfg else 3
+
+
+def _store(args):
+    """``db``, or a client for ``--broker`` (after checking the address)."""
+    if not getattr(args, "broker", None):
+        # ensure DB and tables exist
+        db.init_db()
+        return db
+    from . import broker as broker_mod
+    return broker_mod.BrokerClient(args.broker).attach()
+
+
+def _insert_job(store, job):
+    """Insert ``job``; return the id of the earlier job it duplicates, if any."""
+    if store is db:
+        stored = db.insert_job(job)
+        return stored if stored != job["id"] else None
+    duplicates = []
+    for _, msg in store.insert_jobs([job], duplicates):
+        raise ValueError(msg)
+    return duplicates[0][1] if duplicates else None
+
+
+def enqueue(args):
+    if args.file or args.stdin:
+        return enqueue_bulk(args)
+    data = args.json
+    if data is None:
+        print("Provide a job as JSON, or use --file/--stdin")
+        return 2
     try:
-        db.insert_job(job)
+        store = _store(args)
+    except ValueError as e:
+        print(e)
+        return 1
+    try:
+        job = json.loads(data)
+    except Exception:
+        print("Invalid JSON")
+        return 2
+    try:
+        job = _prepare_job(job, _default_retries(), db.now_ms())
+    except ValueError as e:
+        print(e)
+        return 2
+    try:
+        earlier = _insert_job(store, job)
+        if earlier is not None:
+            print(f"Duplicate of {earlier} (idempotency key {job['idempotency_key']!r}); not enqueued")
+            return 0
+        notify.poke()
         print("Enqueued", job["id"])
         return 0
+    except ValueError as e:
+        # duplicate id or a bad dependency
+        print(e)
+        return 1
     except Exception as e:
         print("Failed to enqueue:", e)
         return 1
 
 
+def _iter_jobs(fh, default_retries: int, errors: list):
+    """Yield ``(line_no, job)`` for each valid JSONL record in ``fh``.
+
+    Invalid lines are appended to ``errors`` as ``(line_no, message)``.
+    """
+    for line_no, line in enumerate(fh, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError:
+            errors.append((line_no, "Invalid JSON"))
+            continue
+        try:
+            yield line_no, _prepare_job(job, default_retries, db.now_ms())
+        except ValueError as e:
+            errors.append((line_no, str(e)))
+
+
+def enqueue_bulk(args):
+    """Stream JSONL jobs from --file or --stdin in batched transactions."""
+    try:
+        store = _store(args)
+    except ValueError as e:
+        print(e)
+        return 1
+    batch_size = max(1, args.batch_size)
+    default_retries = _default_retries()
+    errors = []
+    reported = 0
+    inserted = 0
+    duplicates = 0
+    t0 = time.perf_counter()
+    fh = sys.stdin if args.stdin else open(args.file, "r")
+    try:
+        records = _iter_jobs(fh, default_retries, errors)
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if batch:
+                dups = []
+                failed = store.insert_jobs([job for _, job in batch], dups)
+                for i, msg in failed:
+                    errors.append((batch[i][0], msg))
+                inserted += len(batch) - len(failed) - len(dups)
+                duplicates += len(dups)
+                notify.poke()
+            # report errors as they are found rather than at the end
+            errors.sort()
+            for line_no, msg in errors[reported:]:
+                print(f"line {line_no}: {msg}", file=sys.stderr)
+            reported = len(errors)
+            if len(batch) < batch_size:
+                break
+    finally:
+        if fh is not sys.stdin:
+            fh.close()
+    elapsed = time.perf_counter() - t0
+    rate = inserted / elapsed if elapsed > 0 else 0.0
+    skipped = f", {duplicates} duplicates" if duplicates else ""
+    print(f"Enqueued {inserted} jobs, {len(errors)} errors{skipped} in {elapsed:.2f}s ({rate:.0f} jobs/s)")
+    return 1 if errors else 0
+
+
 def worker_start(args):
+    from . import broker as broker_mod
+    from . import worker as worker_mod
     count = args.count
     daemon = args.daemon
-    base = int(db.get_config("backoff-base") or 2)
+    try:
+        queues = worker_mod.parse_queues(args.queues)
+        if args.broker:
+            broker_mod.parse_address(args.broker)
+    except ValueError as e:
+        print(e)
+        return 2
+    if args.min is not None and args.max is None:
+        print("--min needs --max")
+        return 2
+    if args.max is not None and (args.max < 1 or args.max < (args.min or 1)):
+        print("--max must be at least 1 and at least --min")
+        return 2
     if daemon:
         # spawn background process
-        cmd = [sys.executable, "-m", "queuectl", "run-daemon", "--count", str(count)]
+        cmd = [sys.executable, "-m", "queuectl", "run-daemon", "--count", str(count),
+               "--prefetch", str(args.prefetch), "--concurrency", str(args.concurrency)]
+        if args.tags:
+            cmd += ["--tags", args.tags]
+        if args.queues:
+            cmd += ["--queues", args.queues]
+        if args.max is not None:
+            cmd += ["--max", str(args.max)]
+            if args.min is not None:
+                cmd += ["--min", str(args.min)]
+        if args.writeback_ms:
+            cmd += ["--writeback-ms", str(args.writeback_ms), "--writeback-batch", str(args.writeback_batch)]
+        if args.broker:
+            cmd += ["--broker", args.broker]
         d = os.path.expanduser("~/.queuectl")
         os.makedirs(d, exist_ok=True)
         out = open(os.path.join(d, "daemon.out"), "a")
         err = open(os.path.join(d, "daemon.err"), "a")
+        import subprocess
         p = subprocess.Popen(cmd, stdout=out, stderr=err, stdin=subprocess.DEVNULL)
         _write_pid(p.pid)
         print("Started daemon pid", p.pid)
         print("Daemon logs:", os.path.join(d, "daemon.out"), os.path.join(d, "daemon.err"))
         return 0
     else:
-        print("Starting", count, "workers (foreground). Ctrl+C to stop")
-        db.init_db()
-        worker_mod.start_workers(count, base)
+        if args.max is not None:
+            print(f"Starting {args.min or 1}-{args.max} autoscaled workers (foreground). Ctrl+C to stop")
+        else:
+            print("Starting", count, "workers (foreground). Ctrl+C to stop")
+        try:
+            base = _backoff_base(args)
+        except broker_mod.BrokerError as e:
+            print(e)
+            return 1
+        worker_mod.start_workers(count, base, args.prefetch, args.concurrency,
+                                 db.split_tags(args.tags), queues, args.min, args.max, _writeback(args),
+                                 args.broker)
         return 0
 
 
+def _backoff_base(args) -> int:
+    """Config ``backoff-base``, from the broker with --broker."""
+    _store(args)
+    return int(db.get_config("backoff-base") or 2)
+
+
+def _writeback(args):
+    """``(interval_ms, batch)`` when --writeback-ms is set, else None."""
+    if not args.writeback_ms or args.writeback_ms <= 0:
+        return None
+    return args.writeback_ms, max(1, args.writeback_batch)
+
+
 def worker_stop(args):
     pid = _read_pid()
     if not pid:
@@ -107,10 +349,15 @@ def worker_stop(args):
 
 def status(args):
     db.init_db()
-    counts = db.job_counts()
+    per_queue = db.queue_counts()
+    counts = db.all_job_counts()
     print("Jobs:")
     for k, v in counts.items():
         print(f"  {k}: {v}")
+    if len(per_queue) > 1:
+        print("Queues:")
+        for name, qc in per_queue.items():
+            print(f"  {name}: " + ", ".join(f"{k}={v}" for k, v in qc.items()))
     pid = _read_pid()
     if pid:
         print("Daemon PID:", pid)
@@ -119,22 +366,80 @@ def status(args):
     return 0
 
 
-def list_cmd(args):
+def _add_list_args(p):
+    p.add_argument("--limit", type=int, default=None, help="print at most N jobs")
+    p.add_argument("--after", default=None, metavar="ID",
+                   help="start after this job id (the last id of the previous page)")
+    p.add_argument("--columns", default=None,
+                   help="comma-separated columns to print (default: all but output)")
+    p.add_argument("--with-output", action="store_true", help="include the output column")
+    p.add_argument("--tag", default=None, help="only jobs with this tag")
+    p.add_argument("--min-priority", type=int, default=None)
+    p.add_argument("--max-priority", type=int, default=None)
+    p.add_argument("--since", default=None, help="created at or after (ISO-8601)")
+    p.add_argument("--until", default=None, help="created before (ISO-8601)")
+
+
+def _stream_jobs(args, state):
+    """Print matching jobs as JSON lines without loading them all."""
     db.init_db()
-    items = db.list_jobs(args.state)
-    for j in items:
-        print(json.dumps(j))
+    columns = args.columns.split(",") if args.columns else list(db.LIST_COLUMNS)
+    if args.with_output and "output" not in columns:
+        columns.append("output")
+    try:
+        jobs = db.iter_jobs(
+            state, columns, after=args.after, limit=args.limit, tag=args.tag,
+            min_priority=args.min_priority, max_priority=args.max_priority,
+            since=db.to_ms(args.since), until=db.to_ms(args.until),
+        )
+        last, n = None, 0
+        for j in jobs:
+            last, n = j.get("id"), n + 1
+            print(json.dumps(_display(j)))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    except BrokenPipeError:
+        # e.g. piped into head; stop quietly
+        sys.stderr.close()
+        return 0
+    if args.limit is not None and n == args.limit and last is not None:
+        print(f"more: --after {last}", file=sys.stderr)
     return 0
 
 
-def dlq_list(args):
+def list_cmd(args):
+    if args.dag:
+        return _list_dag(args)
+    return _stream_jobs(args, args.state)
+
+
+def _list_dag(args):
+    """Print a job's DAG (what it waits for and what waits for it) and its progress."""
     db.init_db()
-    items = db.list_jobs("dead")
-    for j in items:
-        print(json.dumps(j))
+    columns = args.columns.split(",") if args.columns else db.LIST_COLUMNS + ["depends_on", "pending_deps"]
+    if args.with_output and "output" not in columns:
+        columns = columns + ["output"]
+    try:
+        jobs = db.dag_jobs(args.dag, columns + ([] if "state" in columns else ["state"]))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    states = {}
+    for j in jobs:
+        states[j["state"]] = states.get(j["state"], 0) + 1
+        if "state" not in columns:
+            del j["state"]
+        print(json.dumps(_display(j)))
+    summary = ", ".join(f"{state}={n}" for state, n in sorted(states.items()))
+    print(f"dag: {states.get('completed', 0)}/{len(jobs)} completed ({summary})", file=sys.stderr)
     return 0
 
 
+def dlq_list(args):
+    return _stream_jobs(args, "dead")
+
+
 def dlq_retry(args):
     db.init_db()
     job = db.get_job(args.job_id)
@@ -145,6 +450,7 @@ def dlq_retry(args):
         print("Job not in DLQ")
         return 2
     db.move_dlq_to_pending(args.job_id)
+    notify.poke()
     print("Moved to pending:", args.job_id)
     return 0
 
@@ -156,16 +462,93 @@ def config_set(args):
     return 0
 
 
+def _fmt_seconds(v):
+    if v is None:
+        return "-"
+    if v < 1:
+        return f"{v * 1000:.1f}ms"
+    return f"{v:.2f}s"
+
+
+def stats_cmd(args):
+    db.init_db()
+    if args.reset:
+        db.reset_latency()
+        print("Latency histograms reset")
+        return 0
+    from . import stats as stats_mod
+    summary = stats_mod.summary()
+    if args.json:
+        print(json.dumps(summary))
+        return 0
+    if not summary:
+        print("No latency data recorded yet")
+        return 0
+    print(f"{'stage':<12} {'count':>8} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for stage in stats_mod.STAGES:
+        if stage not in summary:
+            continue
+        s = summary[stage]
+        print(f"{stage:<12} {s['count']:>8} {_fmt_seconds(s['mean']):>9} {_fmt_seconds(s['p50']):>9} "
+              f"{_fmt_seconds(s['p95']):>9} {_fmt_seconds(s['p99']):>9}")
+    return 0
+
+
+def gc_cmd(args):
+    db.init_db()
+    try:
+        completed = retention.parse_duration(args.completed_older_than) if args.completed_older_than else None
+        dead = retention.parse_duration(args.dead_older_than) if args.dead_older_than else None
+    except ValueError as e:
+        print(e)
+        return 2
+    if completed is None and dead is None:
+        print("Nothing to do: pass --completed-older-than and/or --dead-older-than")
+        return 2
+    archive = args.archive_db or db.get_config("archive-db") or None
+    moved = retention.run_gc(completed, dead, batch_size=max(1, args.batch_size), archive_path=archive,
+                             vacuum_pages=0)
+    print(f"Archived {moved['completed']} completed, {moved['dead']} dead jobs"
+          + (f" to {archive}" if archive else ""))
+    return 0
+
+
+def broker_serve(args):
+    import signal
+    import threading
+    from . import broker as broker_mod
+    listen = args.listen or f"127.0.0.1:{broker_mod.DEFAULT_PORT}"
+    try:
+        broker_mod.parse_address(listen)
+    except ValueError as e:
+        print(e)
+        return 2
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda sig, frame: stop.set())
+    try:
+        broker_mod.serve(listen, stop)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def metrics_serve(args):
+    from . import metrics as metrics_mod
+    return metrics_mod.serve(args.port)
+
+
 def run_daemon(args):
     # runs master process that spawns worker processes
+    from . import worker as worker_mod
     count = args.count
-    base = int(db.get_config("backoff-base") or 2)
-    db.init_db()
+    base = _backoff_base(args)
     # write own pid
     _write_pid(os.getpid())
     print("Daemon running pid", os.getpid())
     try:
-        worker_mod.start_workers(count, base)
+        worker_mod.start_workers(count, base, args.prefetch, args.concurrency,
+                                 db.split_tags(args.tags), worker_mod.parse_queues(args.queues),
+                                 args.min, args.max, _writeback(args), args.broker)
     finally:
         try:
             os.remove(PID_FILE)
@@ -178,7 +561,15 @@ def build_parser():
     sub = p.add_subparsers(dest="cmd")
 
     enq = sub.add_parser("enqueue")
-    enq.add_argument("json")
+    enq.add_argument("json", nargs="?")
+    src = enq.add_mutually_exclusive_group()
+    src.add_argument("--file", help="read one JSON job per line from this file")
+    src.add_argument("--stdin", action="store_true", help="read one JSON job per line from stdin")
+    enq.add_argument("--batch-size", type=int, default=1000,
+                     help="jobs inserted per transaction in --file/--stdin mode")
+    enq.add_argument("--queue", default=None, help="named queue (default: default)")
+    enq.add_argument("--broker", default=None, metavar="ADDR",
+                     help="enqueue through the broker at host:port or unix:PATH")
     enq.set_defaults(func=enqueue)
 
     w = sub.add_parser("worker")
@@ -186,6 +577,24 @@ def build_parser():
     ws = wsub.add_parser("start")
     ws.add_argument("--count", type=int, default=1)
     ws.add_argument("--daemon", action="store_true")
+    ws.add_argument("--prefetch", type=int, default=1,
+                    help="jobs each worker claims per transaction and buffers locally")
+    ws.add_argument("--concurrency", type=int, default=1,
+                    help="jobs each worker process runs at once (asyncio engine when > 1)")
+    ws.add_argument("--tags", default=None,
+                    help="comma-separated tags; only claim jobs carrying one of them")
+    ws.add_argument("--queues", default=None,
+                    help="queues to serve with optional weights, e.g. emails:3,reports")
+    ws.add_argument("--min", type=int, default=None,
+                    help="autoscale: fewest workers to keep (default 1; needs --max)")
+    ws.add_argument("--max", type=int, default=None,
+                    help="autoscale between --min and this many workers by queue depth and load")
+    ws.add_argument("--writeback-ms", type=int, default=0,
+                    help="group-commit job results every this many ms (default: commit each result)")
+    ws.add_argument("--writeback-batch", type=int, default=writeback_mod.DEFAULT_BATCH,
+                    help="with --writeback-ms, commit early once this many results are waiting")
+    ws.add_argument("--broker", default=None, metavar="ADDR",
+                    help="pull jobs from the broker at host:port or unix:PATH instead of the local DB")
     ws.set_defaults(func=worker_start)
     wstop = wsub.add_parser("stop")
     wstop.set_defaults(func=worker_stop)
@@ -194,13 +603,21 @@ def build_parser():
 
     lst = sub.add_parser("list")
     lst.add_argument("--state", default=None)
+    lst.add_argument("--queue", default=None)
+    lst.add_argument("--dag", default=None, metavar="ID",
+                     help="show ID with the jobs it depends on and depends on it, and their progress")
+    _add_list_args(lst)
     lst.set_defaults(func=list_cmd)
 
     dlq = sub.add_parser("dlq")
     dlqsub = dlq.add_subparsers(dest="subcmd")
-    dlqsub.add_parser("list").set_defaults(func=dlq_list)
+    dl = dlqsub.add_parser("list")
+    dl.add_argument("--queue", default=None)
+    _add_list_args(dl)
+    dl.set_defaults(func=dlq_list)
     r = dlqsub.add_parser("retry")
     r.add_argument("job_id")
+    r.add_argument("--queue", default=None)
     r.set_defaults(func=dlq_retry)
 
     cfg = sub.add_parser("config")
@@ -210,15 +627,44 @@ def build_parser():
     cs.add_argument("value")
     cs.set_defaults(func=config_set)
 
+    st = sub.add_parser("stats", help="job lifecycle latency percentiles")
+    st.add_argument("--json", action="store_true")
+    st.add_argument("--reset", action="store_true", help="clear recorded histograms")
+    st.set_defaults(func=stats_cmd)
+
+    gc = sub.add_parser("gc", help="archive finished jobs and reclaim space")
+    gc.add_argument("--completed-older-than", metavar="AGE", help="e.g. 7d, 12h, 30m")
+    gc.add_argument("--dead-older-than", metavar="AGE")
+    gc.add_argument("--batch-size", type=int, default=retention.DEFAULT_BATCH_SIZE,
+                    help="jobs moved per write transaction")
+    gc.add_argument("--archive-db", metavar="PATH", help="archive into a separate SQLite file")
+    gc.set_defaults(func=gc_cmd)
+
     # internal
     rd = sub.add_parser("run-daemon")
     rd.add_argument("--count", type=int, default=1)
+    rd.add_argument("--prefetch", type=int, default=1)
+    rd.add_argument("--concurrency", type=int, default=1)
+    rd.add_argument("--tags", default=None)
+    rd.add_argument("--queues", default=None)
+    rd.add_argument("--min", type=int, default=None)
+    rd.add_argument("--max", type=int, default=None)
+    rd.add_argument("--writeback-ms", type=int, default=0)
+    rd.add_argument("--writeback-batch", type=int, default=writeback_mod.DEFAULT_BATCH)
+    rd.add_argument("--broker", default=None)
     rd.set_defaults(func=run_daemon)
+
+    br = sub.add_parser("broker", help="serve the job database to workers on other hosts")
+    brsub = br.add_subparsers(dest="subcmd")
+    bs = brsub.add_parser("serve")
+    bs.add_argument("--listen", default=None, metavar="ADDR",
+                    help="host:port or unix:PATH (default: 127.0.0.1 on port 7463)")
+    bs.set_defaults(func=broker_serve)
     metrics = sub.add_parser("metrics")
     metrics_sub = metrics.add_subparsers(dest="subcmd")
     ms = metrics_sub.add_parser("serve")
     ms.add_argument("--port", type=int, default=8000)
-    ms.set_defaults(func=lambda a: metrics_mod.serve(a.port))
+    ms.set_defaults(func=metrics_serve)
 
     return p
 
@@ -229,4 +675,13 @@ def main(argv=None):
     if not hasattr(args, "func"):
         p.print_help()
         return 2
-    return args.func(args)
+    queue = getattr(args, "queue", None)
+    if queue is None:
+        return args.func(args)
+    try:
+        db.check_queue_name(queue)
+    except ValueError as e:
+        print(e)
+        return 2
+    with db.use_queue(queue):
+        return args.func(args)
@@ -1,27 +1,270 @@
 import os
+import re
 import sqlite3
 import json
-from datetime import datetime
-from typing import Optional, Dict, Any
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, Callable, List, Tuple, Union
 
 
-def _db_path() -> str:
-    d = os.path.expanduser("~/.queuectl")
-    os.makedirs(d, exist_ok=True)
-    return os.path.join(d, "queue.db")
+# Per-connection PRAGMAs. Each can be overridden with an environment variable
+# named QUEUECTL_SQLITE_<NAME>, e.g. QUEUECTL_SQLITE_SYNCHRONOUS=FULL.
+PRAGMAS = {
+    "busy_timeout": "30000",
+    "synchronous": "NORMAL",
+    "cache_size": "-16000",
+    "mmap_size": "268435456",
+    "temp_store": "MEMORY",
+}
 
+# Prepared statements kept per connection (sqlite3 ``cached_statements``).
+STATEMENT_CACHE_SIZE = 256
 
-def get_conn():
-    path = _db_path()
-    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+_local = threading.local()
+
+# Time columns hold integer milliseconds since the Unix epoch (UTC).
+TIME_COLUMNS = ("created_at", "updated_at", "next_run_at", "locked_at", "run_at", "archived_at",
+                "lease_expires_at")
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_FRACTION = re.compile(r"\.(\d+)")
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def to_ms(value: Union[None, int, float, str]) -> Optional[int]:
+    """Convert an ISO-8601 string or epoch milliseconds to epoch milliseconds.
+
+    ISO values may omit the ``Z``, the seconds or the fraction; values
+    without an offset are taken as UTC. Raises ``ValueError`` if ``value``
+    is not a timestamp.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip()
+    if re.fullmatch(r"-?\d+", text):
+        return int(text)
+    if text[-1:] in ("Z", "z"):
+        text = text[:-1] + "+00:00"
+    # fromisoformat before 3.11 only takes 3 or 6 fractional digits
+    text = _FRACTION.sub(lambda m: "." + m.group(1)[:6].ljust(6, "0"), text, count=1)
+    try:
+        dt = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {value!r}") from None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - _EPOCH) // timedelta(milliseconds=1)
+
+
+def ms_to_iso(ms: Optional[int]) -> Optional[str]:
+    """Format epoch milliseconds as ``YYYY-MM-DDTHH:MM:SS.mmmZ``."""
+    if ms is None:
+        return None
+    return (datetime(1970, 1, 1) + timedelta(milliseconds=ms)).isoformat(timespec="milliseconds") + "Z"
+
+
+def _home() -> str:
+    return os.path.expanduser("~/.queuectl")
+
+
+def _db_file(queue: Optional[str] = None) -> str:
+    queue = queue or current_queue()
+    if queue == DEFAULT_QUEUE:
+        return os.path.join(_home(), "queue.db")
+    return os.path.join(_home(), "queues", f"{queue}.db")
+
+
+def _db_path(queue: Optional[str] = None) -> str:
+    path = _db_file(queue)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def _pragmas() -> Dict[str, str]:
+    res = {}
+    for name, value in PRAGMAS.items():
+        res[name] = os.environ.get(f"QUEUECTL_SQLITE_{name.upper()}", value)
+    return res
+
+
+def _connect(path: str):
+    conn = sqlite3.connect(
+        path,
+        timeout=30,
+        isolation_level=None,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
     conn.row_factory = sqlite3.Row
+    for name, value in _pragmas().items():
+        conn.execute(f"PRAGMA {name}={value}")
+    # a dead job's dependents die through the same trigger, down the DAG
+    conn.execute("PRAGMA recursive_triggers=ON")
     return conn
 
 
+def get_conn(queue: Optional[str] = None):
+    """Return this thread's long-lived connection to ``queue``'s database.
+
+    ``queue`` defaults to the thread's current queue (see :func:`use_queue`).
+    Connections are cached per thread and tied to the process that opened
+    them: a forked child never reuses its parent's handle and transparently
+    opens its own. A change of ``HOME`` (as tests do) also reconnects.
+    """
+    pid = os.getpid()
+    home = _home()
+    conns = getattr(_local, "conns", None)
+    if conns is None or _local.pid != pid or _local.home != home:
+        if conns is not None and _local.pid == pid:
+            for c in conns.values():
+                c.close()
+        conns = _local.conns = {}
+        _local.pid = pid
+        _local.home = home
+        _local.config = None
+    path = _db_file(queue)
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = _connect(_db_path(queue))
+    return conn
+
+
+def close_conn():
+    """Close this thread's cached connections (call before forking workers)."""
+    conns = getattr(_local, "conns", None)
+    if conns is not None and _local.pid == os.getpid():
+        for c in conns.values():
+            c.close()
+    _local.conns = None
+    _local.config = None
+
+
+DEFAULT_QUEUE = "default"
+
+_QUEUE_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,63}")
+
+
+def check_queue_name(name: str) -> str:
+    if not _QUEUE_NAME.fullmatch(name or ""):
+        raise ValueError(f"Invalid queue name: {name!r}")
+    return name
+
+
+def current_queue() -> str:
+    return getattr(_local, "queue", None) or DEFAULT_QUEUE
+
+
+@contextmanager
+def use_queue(name: Optional[str]):
+    """Run job operations in this thread against queue ``name``.
+
+    Every named queue is a separate database file (a shard) under
+    ``~/.queuectl/queues``, so writers on different queues never wait on
+    each other's lock. ``default`` is ``~/.queuectl/queue.db``. Config and
+    latency stats always live in the default database.
+    """
+    name = check_queue_name(name or DEFAULT_QUEUE)
+    prev = getattr(_local, "queue", None)
+    _local.queue = name
+    try:
+        yield name
+    finally:
+        _local.queue = prev
+
+
+def queue_names() -> List[str]:
+    """The default queue plus every named queue that has a database file."""
+    names = [DEFAULT_QUEUE]
+    d = os.path.join(_home(), "queues")
+    if os.path.isdir(d):
+        for f in sorted(os.listdir(d)):
+            if f.endswith(".db") and _QUEUE_NAME.fullmatch(f[:-3]) and f[:-3] != DEFAULT_QUEUE:
+                names.append(f[:-3])
+    return names
+
+
 def init_db():
+    """Open the current queue's database and bring its schema up to date.
+
+    The schema version is kept in ``PRAGMA user_version``, so on a current
+    database this is one header read. Otherwise the pending
+    :data:`_MIGRATIONS` run in order, once, in one write transaction.
+    """
     conn = get_conn()
+    if conn.execute("PRAGMA user_version").fetchone()[0] < len(_MIGRATIONS):
+        _migrate(conn)
+    return conn
+
+
+def _migrate(conn):
     cur = conn.cursor()
+    # only takes effect on a new, empty database; lets gc hand freed pages
+    # back to the filesystem with PRAGMA incremental_vacuum
+    cur.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+    # neither pragma can run inside a transaction; both persist in the file
     cur.execute("PRAGMA journal_mode=WAL;")
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        # another process may have migrated while we waited for the lock
+        version = cur.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(_MIGRATIONS[version:], version + 1):
+            migration(conn)
+            cur.execute(f"PRAGMA user_version={number}")
+        cur.execute("COMMIT")
+    except Exception:
+        conn.rollback()
+        raise
+
+
+# Columns added to jobs after the first release, oldest first.
+_JOB_COLUMNS = [
+    ("priority", "INTEGER DEFAULT 0"),
+    ("output_file", "TEXT"),
+    ("tags", "TEXT"),
+    ("run_at", "INTEGER"),
+    # job type: 'shell' (command), 'argv' or 'callable' (details in payload)
+    ("kind", "TEXT NOT NULL DEFAULT 'shell'"),
+    ("payload", "TEXT"),
+    # claims are leases; the supervisor requeues jobs whose lease ran out
+    ("lease_expires_at", "INTEGER"),
+    # dependencies: ids this job waits for (comma-separated, like tags), how
+    # many are still unsettled, and what a dead dependency does to it
+    ("depends_on", "TEXT"),
+    ("pending_deps", "INTEGER NOT NULL DEFAULT 0"),
+    ("on_dep_failure", "TEXT"),
+    # enqueue dedupe key, and the opt-in result cache (ttl in ms, key of the command)
+    ("idempotency_key", "TEXT"),
+    ("cache_ttl", "INTEGER"),
+    ("cache_key", "TEXT"),
+]
+
+
+def _add_columns(cur, table: str, columns) -> List[str]:
+    """Add the ``(name, definition)`` columns ``table`` lacks; return their names."""
+    have = {r[1] for r in cur.execute(f"PRAGMA table_info({table})")}
+    added = []
+    for name, definition in columns:
+        if name not in have:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+            added.append(name)
+    return added
+
+
+def _schema_v1(conn):
+    """The schema as of versioning, from an empty or any older database.
+
+    Databases from before ``user_version`` was kept are at version 0 and
+    may be at any earlier layout, so every step here checks first.
+    """
+    cur = conn.cursor()
     cur.execute("""
     CREATE TABLE IF NOT EXISTS jobs (
         id TEXT PRIMARY KEY,
@@ -29,33 +272,64 @@ def init_db():
         state TEXT NOT NULL,
         attempts INTEGER NOT NULL DEFAULT 0,
         max_retries INTEGER,
-        created_at TEXT NOT NULL,
-        updated_at TEXT NOT NULL,
-        next_run_at TEXT,
+        created_at INTEGER NOT NULL,
+        updated_at INTEGER NOT NULL,
+        next_run_at INTEGER,
         locked_by TEXT,
-        locked_at TEXT,
+        locked_at INTEGER,
         output TEXT
     )
     """)
+    added = _add_columns(cur, "jobs", _JOB_COLUMNS)
 
-    # Add optional columns for newer features (priority, output_file)
-    # Use ALTER TABLE ADD COLUMN which is safe if the column exists will raise; ignore errors
-    try:
-        cur.execute("ALTER TABLE jobs ADD COLUMN priority INTEGER DEFAULT 0")
-    except Exception:
-        pass
-    try:
-        cur.execute("ALTER TABLE jobs ADD COLUMN output_file TEXT")
-    except Exception:
-        pass
-    try:
-        cur.execute("ALTER TABLE jobs ADD COLUMN tags TEXT")
-    except Exception:
-        pass
-    try:
-        cur.execute("ALTER TABLE jobs ADD COLUMN run_at TEXT")
-    except Exception:
-        pass
+    # databases written before timestamps became epoch milliseconds
+    _migrate_epoch_ms(conn, "main", "jobs")
+    _migrate_epoch_ms(conn, "main", "jobs_archive")
+
+    if "lease_expires_at" in added:
+        # jobs a lost worker left behind before leases existed (after the
+        # conversion above, so locked_at is in milliseconds)
+        cur.execute(
+            "UPDATE jobs SET lease_expires_at=COALESCE(locked_at, updated_at)+? WHERE state='processing'",
+            (DEFAULT_LEASE_SECONDS * 1000,),
+        )
+
+    # Partial covering index over claimable jobs: the dequeue query walks it in
+    # priority order and never touches completed/dead rows.
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_jobs_ready
+    ON jobs(priority DESC, created_at, next_run_at, run_at, id)
+    WHERE state IN ('pending','failed')
+    """)
+    # Jobs waiting for run_at or a retry backoff, by due time (next_run_at).
+    # Only the scheduler reads it; the claim never sees these rows.
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_jobs_scheduled
+    ON jobs(next_run_at)
+    WHERE state='scheduled'
+    """)
+    # Running jobs by lease expiry, for the reaper.
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_jobs_lease
+    ON jobs(lease_expires_at)
+    WHERE state='processing'
+    """)
+    # Keyset pagination for list/dlq in (created_at, id) order. Finished
+    # jobs get their own partial index so a DLQ listing seeks straight to
+    # dead rows; live states are few enough to filter while walking
+    # idx_jobs_created, and keeping them out leaves the claim on idx_jobs_ready.
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at, id)")
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_jobs_finished_list
+    ON jobs(state, created_at, id)
+    WHERE state IN ('completed','dead')
+    """)
+    # Finished jobs by age, for retention/archival.
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_jobs_finished
+    ON jobs(state, updated_at)
+    WHERE state IN ('completed','dead')
+    """)
 
     cur.execute("""
     CREATE TABLE IF NOT EXISTS config (
@@ -64,6 +338,60 @@ def init_db():
     )
     """)
 
+    # Internal counters; config_version is bumped by every set_config so
+    # cached config snapshots know when to reload.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    """)
+    cur.execute("INSERT OR IGNORE INTO meta(key,value) VALUES('config_version',0)")
+
+    _init_counters(cur)
+    _init_tags(cur)
+    _init_scheduled(cur)
+    _init_deps(cur)
+
+    # Latest job for each idempotency key; a key older than the dedupe
+    # window is free again.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        key TEXT PRIMARY KEY,
+        job_id TEXT NOT NULL,
+        created_at INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys(created_at)")
+    # Memoized outputs of successful cache_ttl jobs by command (used in the
+    # default queue's database only), evicted least recently used first.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS result_cache (
+        key TEXT PRIMARY KEY,
+        output TEXT,
+        created_at INTEGER NOT NULL,
+        used_at INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_result_cache_used ON result_cache(used_at)")
+
+    # Job lifecycle latency histograms (see stats.py); bucket is an index
+    # into stats.BUCKETS.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS latency_buckets (
+        stage TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (stage, bucket)
+    ) WITHOUT ROWID
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS latency_sums (
+        stage TEXT PRIMARY KEY,
+        total REAL NOT NULL
+    )
+    """)
+
     # default config values
     defaults = {
         "default-max-retries": "3",
@@ -73,45 +401,425 @@ def init_db():
     for k, v in defaults.items():
         cur.execute("INSERT OR IGNORE INTO config(key,value) VALUES(?,?)", (k, v))
 
-    conn.commit()
-    return conn
+
+# Schema migrations, oldest first: migration N takes a database from
+# user_version N-1 to N inside init_db's write transaction. Append new
+# steps; never change one that has shipped.
+_MIGRATIONS = [_schema_v1]
+
+
+def _iso_to_ms(value, fallback):
+    # SQL function used by the migration; unparseable values become
+    # ``fallback`` (NULL, or the migration time for NOT NULL columns)
+    try:
+        return to_ms(value)
+    except ValueError:
+        return fallback
+
+
+def _migrate_epoch_ms(conn, schema: str, table: str):
+    """Rebuild ``table`` with INTEGER time columns if it still has TEXT ones.
+
+    Runs once per database: the table is copied into a new one with every
+    ISO-8601 value converted to epoch milliseconds, then swapped in, all in
+    one write transaction (the caller's, if it holds one). Indexes and
+    triggers on the old table are dropped with it and recreated by the
+    schema migration.
+    """
+    def columns():
+        return conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()
+
+    if not any(c[1] in TIME_COLUMNS and c[2].upper() == "TEXT" for c in columns()):
+        return
+    conn.create_function("iso_to_ms", 2, _iso_to_ms)
+    now = now_ms()
+    own = not conn.in_transaction
+    if own:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        cols = columns()
+        if not any(c[1] in TIME_COLUMNS and c[2].upper() == "TEXT" for c in cols):
+            if own:
+                conn.execute("ROLLBACK")
+            return
+        defs, exprs = [], []
+        for _, name, ctype, notnull, default, pk in cols:
+            if name in TIME_COLUMNS:
+                ctype = "INTEGER"
+                exprs.append(f"iso_to_ms({name}, {now if notnull else 'NULL'})")
+            else:
+                exprs.append(name)
+            d = f"{name} {ctype}"
+            if pk:
+                d += " PRIMARY KEY"
+            if notnull:
+                d += " NOT NULL"
+            if default is not None:
+                d += f" DEFAULT {default}"
+            defs.append(d)
+        names = ",".join(c[1] for c in cols)
+        conn.execute(f"CREATE TABLE {schema}.{table}_migrate ({', '.join(defs)})")
+        conn.execute(
+            f"INSERT INTO {schema}.{table}_migrate({names}) SELECT {','.join(exprs)} FROM {schema}.{table}"
+        )
+        conn.execute(f"DROP TABLE {schema}.{table}")
+        conn.execute(f"ALTER TABLE {schema}.{table}_migrate RENAME TO {table}")
+        if own:
+            conn.execute("COMMIT")
+    except Exception:
+        if own:
+            conn.rollback()
+        raise
+
+
+_INSERT_JOB_SQL = (
+    "INSERT INTO jobs(id,command,state,attempts,max_retries,created_at,updated_at,next_run_at,priority,output_file,run_at,tags,kind,payload,"
+    "depends_on,pending_deps,on_dep_failure,idempotency_key,cache_ttl,cache_key) "
+    "VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"
+)
+
+# Default config ``idempotency-window``: how long an idempotency key
+# dedupes repeated enqueues.
+DEFAULT_IDEMPOTENCY_WINDOW = "24h"
+
+# Default config ``result-cache-size``: cached results kept.
+DEFAULT_RESULT_CACHE_SIZE = 1000
+
+# What a dead dependency does to a job: 'cascade' (default) moves it to the
+# DLQ too, 'run' counts the dependency as settled.
+DEP_POLICIES = ("cascade", "run")
+
+
+def _job_row(job: Dict[str, Any], now: int):
+    state = job.get("state", "pending")
+    next_run_at = to_ms(job.get("next_run_at"))
+    run_at = to_ms(job.get("run_at"))
+    due = max(next_run_at or 0, run_at or 0)
+    if state in ("pending", "failed") and due > now:
+        # not claimable yet; the scheduler promotes it at next_run_at
+        state, next_run_at = "scheduled", due
+    return (
+        job["id"],
+        job["command"],
+        state,
+        job.get("attempts", 0),
+        job.get("max_retries"),
+        to_ms(job.get("created_at")) or now,
+        to_ms(job.get("updated_at")) or now,
+        next_run_at,
+        job.get("priority", 0),
+        job.get("output_file"),
+        run_at,
+        ",".join(split_tags(job.get("tags"))) or None,
+        job.get("kind") or "shell",
+        job.get("payload"),
+        ",".join(split_tags(job.get("depends_on"))) or None,
+        0,
+        job.get("on_dep_failure"),
+        job.get("idempotency_key"),
+        job.get("cache_ttl"),
+        cache_key(job) if job.get("cache_ttl") else None,
+    )
+
+
+def cache_key(job: Dict[str, Any]) -> str:
+    """Result cache key: a hash of what the job runs."""
+    # imported here: most CLI calls never hash, and startup time counts
+    import hashlib
+    what = [job.get("kind") or "shell", job["command"], job.get("payload")]
+    return hashlib.sha256(json.dumps(what).encode()).hexdigest()
+
+
+def idempotency_window_ms() -> int:
+    """Dedupe window from config ``idempotency-window`` (a duration like ``24h``)."""
+    from .retention import parse_duration
+    text = get_config("idempotency-window") or DEFAULT_IDEMPOTENCY_WINDOW
+    try:
+        return int(parse_duration(text) * 1000)
+    except ValueError:
+        return int(parse_duration(DEFAULT_IDEMPOTENCY_WINDOW) * 1000)
+
+
+_INSERT_TAG_SQL = "INSERT OR IGNORE INTO job_tags(tag,job_id,priority,created_at,ready) VALUES(?,?,?,?,?)"
+
+
+def split_tags(value) -> List[str]:
+    """Normalize a tag list or comma-separated string: stripped, no blanks or repeats."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    elif not isinstance(value, (list, tuple)):
+        value = [value]
+    return list(dict.fromkeys(t for t in (str(v).strip() for v in value) if t))
+
+
+def _tag_rows(job_id, state, created_at, priority, tags):
+    ready = int(state in ("pending", "failed"))
+    return [(tag, job_id, priority or 0, created_at, ready) for tag in split_tags(tags)]
+
+
+def _job_tag_rows(row):
+    """job_tags rows for an ``_INSERT_JOB_SQL`` parameter tuple."""
+    return _tag_rows(row[0], row[2], row[5], row[8], row[11])
+
+
+def _dep_edges(cur, job_id: str, deps: List[str], policy: Optional[str], strict: bool = True):
+    """``(unsettled, job_deps rows)`` for ``job_id`` depending on ``deps``.
+
+    A dependency is settled once completed, or dead under policy 'run'.
+    With ``strict`` (enqueue) an unknown dependency, or a dead one that
+    would cascade, raises ``ValueError``; otherwise (DLQ retry) a missing
+    one counts as settled and a dead one is waited for.
+    """
+    marks = ",".join("?" * len(deps))
+    states = dict(cur.execute(f"SELECT id, state FROM jobs WHERE id IN ({marks})", deps).fetchall())
+    edges = []
+    for dep in deps:
+        state = states.get(dep)
+        if strict and state is None:
+            raise ValueError(f"Unknown dependency: {dep}")
+        if strict and state == "dead" and policy != "run":
+            raise ValueError(f"Dependency {dep} is dead")
+        settled = state in (None, "completed") or (state == "dead" and policy == "run")
+        edges.append((dep, job_id, int(settled)))
+    return sum(1 for e in edges if not e[2]), edges
+
+
+def _execute_insert(cur, row):
+    try:
+        cur.execute(_INSERT_JOB_SQL, row)
+    except sqlite3.IntegrityError as e:
+        if "jobs.id" in str(e):
+            raise ValueError(f"Job {row[0]} already exists") from None
+        raise
+
+
+def _insert_row(cur, row, now: int, since: int = 0) -> Optional[str]:
+    """Insert one ``_job_row`` with its tag and dependency rows (caller holds a transaction).
+
+    If the row's idempotency key was used at or after ``since`` nothing is
+    inserted and the earlier job's id is returned. Otherwise the key is
+    recorded as used at ``now``, the enqueue time (not the job's own
+    ``created_at``, which the client may set).
+    """
+    key = row[17]
+    if key is not None:
+        seen = cur.execute("SELECT job_id, created_at FROM idempotency_keys WHERE key=?", (key,)).fetchone()
+        if seen is not None and seen[1] >= since:
+            return seen[0]
+    deps = split_tags(row[14])
+    edges = []
+    if deps:
+        pending, edges = _dep_edges(cur, row[0], deps, row[16])
+        if pending:
+            row = row[:2] + ("blocked",) + row[3:15] + (pending,) + row[16:]
+    _execute_insert(cur, row)
+    cur.executemany(_INSERT_TAG_SQL, _job_tag_rows(row))
+    cur.executemany(_INSERT_DEP_SQL, edges)
+    if key is not None:
+        cur.execute("INSERT OR REPLACE INTO idempotency_keys(key,job_id,created_at) VALUES(?,?,?)",
+                    (key, row[0], now))
+    return None
 
 
-def insert_job(job: Dict[str, Any]):
+def insert_job(job: Dict[str, Any]) -> str:
+    """Insert one job; return its id, or that of the job it duplicates by idempotency key.
+
+    Raises ``ValueError`` for a duplicate id or a bad dependency.
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+    now = now_ms()
+    row = _job_row(job, now)
+    if not row[11] and not row[14] and not row[17]:
+        _execute_insert(cur, row)
+        return row[0]
+    since = now - idempotency_window_ms() if row[17] else 0
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        earlier = _insert_row(cur, row, now, since)
+        cur.execute("COMMIT")
+    except Exception:
+        conn.rollback()
+        raise
+    return earlier or row[0]
+
+
+def insert_jobs(jobs: List[Dict[str, Any]], duplicates: Optional[list] = None) -> List[Tuple[int, str]]:
+    """Insert a batch of jobs in one transaction.
+
+    The batch goes through ``executemany``; if a row is rejected (e.g. a
+    duplicate id) the batch is replayed row by row inside the same
+    transaction so the good rows still land. Returns ``(index, error)``
+    for every rejected job. A job may depend on jobs earlier in the batch.
+    Jobs whose idempotency key was used within the dedupe window are
+    skipped and, given a ``duplicates`` list, reported there as
+    ``(index, earlier_job_id)``.
+    """
+    if not jobs:
+        return []
+    conn = get_conn()
+    cur = conn.cursor()
+    now = now_ms()
+    rows = [_job_row(j, now) for j in jobs]
+    errors = []
+    dups = []
+    since = now - idempotency_window_ms() if any(row[17] for row in rows) else 0
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute("SAVEPOINT batch")
+        try:
+            if any(row[14] or row[17] for row in rows):
+                # dependencies and keys are checked against the rows inserted so far
+                for i, row in enumerate(rows):
+                    earlier = _insert_row(cur, row, now, since)
+                    if earlier is not None:
+                        dups.append((i, earlier))
+            else:
+                cur.executemany(_INSERT_JOB_SQL, rows)
+                cur.executemany(_INSERT_TAG_SQL, [t for row in rows for t in _job_tag_rows(row)])
+            cur.execute("RELEASE batch")
+        except (sqlite3.Error, ValueError):
+            cur.execute("ROLLBACK TO batch")
+            cur.execute("RELEASE batch")
+            dups = []
+            for i, row in enumerate(rows):
+                try:
+                    # fails before writing anything, or not at all
+                    earlier = _insert_row(cur, row, now, since)
+                except (sqlite3.Error, ValueError) as e:
+                    errors.append((i, str(e)))
+                    continue
+                if earlier is not None:
+                    dups.append((i, earlier))
+        cur.execute("COMMIT")
+    except Exception:
+        conn.rollback()
+        raise
+    if duplicates is not None:
+        duplicates.extend(dups)
+    return errors
+
+
+def prune_idempotency_keys(limit: int = 500) -> int:
+    """Forget up to ``limit`` idempotency keys older than the dedupe window."""
     conn = get_conn()
     cur = conn.cursor()
-    now = datetime.utcnow().isoformat() + "Z"
     cur.execute(
-        "INSERT INTO jobs(id,command,state,attempts,max_retries,created_at,updated_at,next_run_at,priority,output_file) VALUES(?,?,?,?,?,?,?,?,?,?)",
-        (
-            job["id"],
-            job["command"],
-            job.get("state", "pending"),
-            job.get("attempts", 0),
-            job.get("max_retries"),
-            job.get("created_at", now),
-            job.get("updated_at", now),
-            job.get("next_run_at"),
-            job.get("priority", 0),
-            job.get("output_file"),
-        ),
+        "DELETE FROM idempotency_keys WHERE key IN "
+        "(SELECT key FROM idempotency_keys WHERE created_at<? ORDER BY created_at LIMIT ?)",
+        (now_ms() - idempotency_window_ms(), limit),
     )
     conn.commit()
+    return cur.rowcount
 
 
-def get_config(key: str) -> Optional[str]:
-    conn = get_conn()
+def cached_result(key: str, ttl: int, now: Optional[int] = None) -> Optional[str]:
+    """Output cached under ``key`` within the last ``ttl`` ms, or None.
+
+    A hit marks the entry recently used. The cache lives in the default
+    queue's database, so identical commands share it across queues. Errors
+    count as a miss.
+    """
+    now = now_ms() if now is None else now
+    conn = get_conn(DEFAULT_QUEUE)
+    try:
+        row = conn.execute("SELECT output FROM result_cache WHERE key=? AND created_at>=?",
+                           (key, now - ttl)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE result_cache SET used_at=? WHERE key=?", (now, key))
+    except sqlite3.Error:
+        return None
+    return row[0]
+
+
+def cache_result(key: str, output: Optional[str], now: Optional[int] = None):
+    """Remember a successful output, evicting least recently used entries past ``result-cache-size``."""
+    now = now_ms() if now is None else now
+    try:
+        size = max(0, int(get_config("result-cache-size") or DEFAULT_RESULT_CACHE_SIZE))
+    except ValueError:
+        size = DEFAULT_RESULT_CACHE_SIZE
+    conn = get_conn(DEFAULT_QUEUE)
     cur = conn.cursor()
-    cur.execute("SELECT value FROM config WHERE key=?", (key,))
-    row = cur.fetchone()
-    return row[0] if row else None
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute(
+            "INSERT INTO result_cache(key,output,created_at,used_at) VALUES(?,?,?,?) "
+            "ON CONFLICT(key) DO UPDATE SET output=excluded.output, created_at=excluded.created_at, "
+            "used_at=excluded.used_at",
+            (key, output, now, now),
+        )
+        cur.execute(
+            "DELETE FROM result_cache WHERE key IN "
+            "(SELECT key FROM result_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+            (size,),
+        )
+        cur.execute("COMMIT")
+    except Exception:
+        conn.rollback()
+        raise
+
+
+# Where a process with no database of its own (a worker attached to a
+# broker) reads config from; see set_config_source.
+_config_source = None
+
+
+def set_config_source(source: Optional[Callable[[], Dict[str, str]]]):
+    """Serve :func:`config_snapshot` from ``source()`` instead of the database (None to undo)."""
+    global _config_source
+    _config_source = source
+
+
+def config_snapshot() -> Dict[str, str]:
+    """Return the whole config table, cached per connection.
+
+    The cache is revalidated with ``PRAGMA data_version``, which costs no
+    query unless another connection has committed since the last check. Only
+    then is ``meta.config_version`` read, and the table itself is reloaded
+    only if that version moved.
+    """
+    if _config_source is not None:
+        return _config_source()
+    conn = get_conn(DEFAULT_QUEUE)
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    cache = getattr(_local, "config", None)
+    if cache is not None and cache[0] == data_version:
+        return cache[2]
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key='config_version'").fetchone()
+        version = row[0] if row else None
+        if cache is not None and version is not None and cache[1] == version:
+            values = cache[2]
+        else:
+            values = {r[0]: r[1] for r in conn.execute("SELECT key,value FROM config")}
+    except sqlite3.OperationalError:
+        # schema not created yet (init_db has not run)
+        return {}
+    _local.config = (data_version, version, values)
+    return values
+
+
+def get_config(key: str) -> Optional[str]:
+    return config_snapshot().get(key)
 
 
 def set_config(key: str, value: str):
-    conn = get_conn()
+    conn = get_conn(DEFAULT_QUEUE)
     cur = conn.cursor()
-    cur.execute("INSERT OR REPLACE INTO config(key,value) VALUES(?,?)", (key, value))
-    conn.commit()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute("INSERT OR REPLACE INTO config(key,value) VALUES(?,?)", (key, value))
+        cur.execute("UPDATE meta SET value=value+1 WHERE key='config_version'")
+        cur.execute("COMMIT")
+    except Exception:
+        conn.rollback()
+        raise
+    # our own commits do not move data_version; drop the cache explicitly
+    _local.config = None
 
 
 def list_jobs(state: Optional[str] = None):
@@ -124,82 +832,726 @@ def list_jobs(state: Optional[str] = None):
     return [dict(r) for r in cur.fetchall()]
 
 
+# WHERE clause of the partial indexes over finished jobs. SQLite only uses a
+# partial index when the query contains its WHERE terms, so queries for
+# state='dead' etc. include this too.
+_FINISHED = "state IN ('completed','dead')"
+
+# Columns returned by iter_jobs() unless others are asked for; output can
+# be large, so it is opt-in.
+LIST_COLUMNS = [
+    "id", "kind", "command", "state", "attempts", "max_retries", "priority", "tags",
+    "created_at", "updated_at", "next_run_at", "run_at", "locked_by", "lease_expires_at",
+]
+
+
+def job_columns() -> List[str]:
+    return [r[1] for r in get_conn().execute("PRAGMA table_info(jobs)")]
+
+
+def iter_jobs(state: Optional[str] = None, columns: Optional[List[str]] = None,
+              after: Optional[str] = None, limit: Optional[int] = None,
+              tag: Optional[str] = None, min_priority: Optional[int] = None,
+              max_priority: Optional[int] = None, since: Optional[int] = None,
+              until: Optional[int] = None, page_size: int = 500):
+    """Yield jobs as dicts in ``(created_at, id)`` order, one page at a time.
+
+    Pagination is keyset based: ``after`` is the id of the last job already
+    seen and each page seeks past its ``(created_at, id)`` through
+    ``idx_jobs_created`` (``idx_jobs_finished_list`` for completed/dead), so
+    deep pages cost the same as the first. Every page is its own short read, so a slow consumer never
+    pins a snapshot. ``since``/``until`` bound ``created_at`` (epoch ms,
+    inclusive/exclusive). Raises ``ValueError`` for an unknown column or
+    ``after`` id.
+    """
+    conn = get_conn()
+    columns = list(columns or LIST_COLUMNS)
+    known = set(job_columns())
+    bad = [c for c in columns if c not in known]
+    if bad:
+        raise ValueError(f"Unknown column(s): {', '.join(bad)}")
+    # the keyset needs both sort columns; they are dropped again before yielding
+    select = columns + [c for c in ("created_at", "id") if c not in columns]
+    where, params = [], []
+    if state in ("completed", "dead"):
+        # repeating the partial index's own term lets the planner use it
+        where.append(_FINISHED)
+    if state:
+        where.append("state=?")
+        params.append(state)
+    if tag:
+        where.append("id IN (SELECT job_id FROM job_tags WHERE tag=?)")
+        params.append(tag)
+    if min_priority is not None:
+        where.append("priority>=?")
+        params.append(min_priority)
+    if max_priority is not None:
+        where.append("priority<=?")
+        params.append(max_priority)
+    if since is not None:
+        where.append("created_at>=?")
+        params.append(since)
+    if until is not None:
+        where.append("created_at<?")
+        params.append(until)
+    key = None
+    if after is not None:
+        row = conn.execute("SELECT created_at, id FROM jobs WHERE id=?", (after,)).fetchone()
+        if row is None:
+            raise ValueError(f"Unknown job id for --after: {after}")
+        key = (row[0], row[1])
+    sql = (
+        f"SELECT {','.join(select)} FROM jobs WHERE "
+        + " AND ".join(where + ["(created_at, id) > (?, ?)"])
+        + " ORDER BY created_at, id LIMIT ?"
+    )
+    first_sql = f"SELECT {','.join(select)} FROM jobs" + (
+        " WHERE " + " AND ".join(where) if where else ""
+    ) + " ORDER BY created_at, id LIMIT ?"
+    extra = [c for c in select if c not in columns]
+    remaining = limit
+    while remaining is None or remaining > 0:
+        n = page_size if remaining is None else min(page_size, remaining)
+        if key is None:
+            rows = conn.execute(first_sql, (*params, n)).fetchall()
+        else:
+            rows = conn.execute(sql, (*params, *key, n)).fetchall()
+        for r in rows:
+            job = dict(r)
+            key = (job["created_at"], job["id"])
+            for c in extra:
+                del job[c]
+            yield job
+        if remaining is not None:
+            remaining -= len(rows)
+        if len(rows) < n:
+            return
+
+
+JOB_STATES = ["blocked", "scheduled", "pending", "processing", "completed", "failed", "dead"]
+
+# Lifetime counters kept in meta by the triggers below (``stale``: results
+# dropped because the worker's claim had been reaped; see _count_stale).
+JOB_TOTALS = ["enqueued", "completed", "failed", "dead", "stale"]
+
+_COUNTER_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_jobs_count_insert AFTER INSERT ON jobs BEGIN
+        INSERT OR IGNORE INTO job_counts(state,n) VALUES(NEW.state,0);
+        UPDATE job_counts SET n=n+1 WHERE state=NEW.state;
+        UPDATE meta SET value=value+1 WHERE key='enqueued_total';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_jobs_count_update AFTER UPDATE OF state ON jobs
+    WHEN OLD.state IS NOT NEW.state BEGIN
+        UPDATE job_counts SET n=n-1 WHERE state=OLD.state;
+        INSERT OR IGNORE INTO job_counts(state,n) VALUES(NEW.state,0);
+        UPDATE job_counts SET n=n+1 WHERE state=NEW.state;
+        UPDATE meta SET value=value+1 WHERE key=NEW.state || '_total'
+            AND NEW.state IN ('completed','dead');
+        UPDATE meta SET value=value+1 WHERE key='failed_total'
+            AND NEW.state IN ('scheduled','failed','dead') AND NEW.attempts > OLD.attempts;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_jobs_count_delete AFTER DELETE ON jobs BEGIN
+        UPDATE job_counts SET n=n-1 WHERE state=OLD.state;
+    END
+    """,
+]
+
+
+def _init_counters(cur):
+    """Create per-state counters and the triggers that keep them current.
+
+    The first time (including on databases created before counters existed)
+    the counters are backfilled from the jobs table inside the same write
+    transaction that installs the triggers, so no transition is missed.
+    """
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS job_counts (
+        state TEXT PRIMARY KEY,
+        n INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    installed = cur.execute(
+        "SELECT sql FROM sqlite_master WHERE type='trigger' AND name='trg_jobs_count_update'"
+    ).fetchone()
+    if installed and "'scheduled'" in installed[0]:
+        return
+    if installed:
+        # retries now fail into 'scheduled'; counters stay, the trigger is replaced
+        cur.execute("DROP TRIGGER trg_jobs_count_update")
+        cur.execute(_COUNTER_TRIGGERS[1])
+        cur.execute("INSERT OR IGNORE INTO job_counts(state,n) VALUES('scheduled',0)")
+        return
+    for sql in _COUNTER_TRIGGERS:
+        cur.execute(sql)
+    cur.execute("DELETE FROM job_counts")
+    cur.execute("INSERT INTO job_counts(state,n) SELECT state, COUNT(1) FROM jobs GROUP BY state")
+    for state in JOB_STATES:
+        cur.execute("INSERT OR IGNORE INTO job_counts(state,n) VALUES(?,0)", (state,))
+    backfill = {
+        "enqueued": "SELECT COUNT(1) FROM jobs",
+        "completed": "SELECT COUNT(1) FROM jobs WHERE state='completed'",
+        "failed": "SELECT COALESCE(SUM(attempts),0) FROM jobs",
+        "dead": "SELECT COUNT(1) FROM jobs WHERE state='dead'",
+        "stale": "SELECT 0",
+    }
+    for name in JOB_TOTALS:
+        n = cur.execute(backfill[name]).fetchone()[0]
+        # IGNORE: a table rebuild (see _migrate_epoch_ms) drops the
+        # triggers but must not reset the lifetime totals
+        cur.execute("INSERT OR IGNORE INTO meta(key,value) VALUES(?,?)", (f"{name}_total", n))
+
+
+_TAG_TRIGGERS = [
+    # the claim walks only ready=1 tag rows, so mirror claimability
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_jobs_tags_ready AFTER UPDATE OF state ON jobs
+    WHEN (OLD.state IN ('pending','failed')) IS NOT (NEW.state IN ('pending','failed')) BEGIN
+        UPDATE job_tags SET ready=(NEW.state IN ('pending','failed')) WHERE job_id=NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_jobs_tags_delete AFTER DELETE ON jobs BEGIN
+        DELETE FROM job_tags WHERE job_id=OLD.id;
+    END
+    """,
+]
+
+
+def _init_tags(cur):
+    """Create the ``job_tags`` index table, its triggers, and backfill it.
+
+    One row per (tag, job) carries the job's priority and created_at and a
+    ``ready`` flag kept in step with the job's state, so a tag-routed claim
+    is served entirely by ``idx_job_tags_ready``. As with the counters, the
+    table is rebuilt from ``jobs.tags`` whenever the triggers are missing.
+    """
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS job_tags (
+        tag TEXT NOT NULL,
+        job_id TEXT NOT NULL,
+        priority INTEGER NOT NULL DEFAULT 0,
+        created_at INTEGER NOT NULL,
+        ready INTEGER NOT NULL,
+        PRIMARY KEY (tag, job_id)
+    ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_job_tags_job ON job_tags(job_id)")
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_job_tags_ready
+    ON job_tags(tag, priority DESC, created_at)
+    WHERE ready=1
+    """)
+    installed = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='trg_jobs_tags_ready'"
+    ).fetchone()
+    if installed:
+        return
+    for sql in _TAG_TRIGGERS:
+        cur.execute(sql)
+    cur.execute("DELETE FROM job_tags")
+    rows = cur.execute(
+        "SELECT id, state, created_at, priority, tags FROM jobs WHERE tags IS NOT NULL AND tags<>''"
+    ).fetchall()
+    for r in rows:
+        cur.executemany(_INSERT_TAG_SQL, _tag_rows(*r))
+
+
+_INSERT_DEP_SQL = "INSERT OR IGNORE INTO job_deps(depends_on,job_id,resolved) VALUES(?,?,?)"
+
+# A blocked job whose last dependency settles becomes pending, or
+# scheduled if its run_at is still ahead. NEW is the settling dependency.
+_UNBLOCK = """
+    UPDATE jobs SET pending_deps=pending_deps-1, updated_at=NEW.updated_at,
+        state=CASE WHEN pending_deps>1 THEN 'blocked'
+                   WHEN COALESCE(next_run_at,0)>NEW.updated_at THEN 'scheduled' ELSE 'pending' END
+    WHERE state='blocked' {policy}
+        AND id IN (SELECT job_id FROM job_deps WHERE depends_on=NEW.id AND resolved=0);
+"""
+
+_DEP_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_jobs_deps_completed AFTER UPDATE OF state ON jobs
+    WHEN NEW.state='completed' AND OLD.state IS NOT 'completed' BEGIN
+        {_UNBLOCK.format(policy="")}
+        UPDATE job_deps SET resolved=1 WHERE depends_on=NEW.id AND resolved=0;
+    END
+    """,
+    # dependents on policy 'run' carry on; the rest die too, and their
+    # own dependents after them (PRAGMA recursive_triggers)
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_jobs_deps_dead AFTER UPDATE OF state ON jobs
+    WHEN NEW.state='dead' AND OLD.state IS NOT 'dead' BEGIN
+        {_UNBLOCK.format(policy="AND on_dep_failure='run'")}
+        UPDATE jobs SET state='dead', pending_deps=0, updated_at=NEW.updated_at,
+            output='Dependency ' || NEW.id || ' failed'
+        WHERE state='blocked' AND on_dep_failure IS NOT 'run'
+            AND id IN (SELECT job_id FROM job_deps WHERE depends_on=NEW.id AND resolved=0);
+        UPDATE job_deps SET resolved=1 WHERE depends_on=NEW.id AND resolved=0;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_jobs_deps_delete AFTER DELETE ON jobs BEGIN
+        DELETE FROM job_deps WHERE job_id=OLD.id;
+        DELETE FROM job_deps WHERE depends_on=OLD.id;
+    END
+    """,
+]
+
+
+def _init_deps(cur):
+    """Create the ``job_deps`` edge table and the triggers that settle it.
+
+    One row per (dependency, dependent) edge, ``resolved`` once the
+    dependency has completed or died. A job with unsettled dependencies is
+    ``blocked`` with their number in ``pending_deps``. The triggers update
+    a dependency's dependents in the transaction that finishes it, through
+    the primary key, so readiness costs one indexed update per edge and
+    nothing ever scans for unblocked jobs.
+    """
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS job_deps (
+        depends_on TEXT NOT NULL,
+        job_id TEXT NOT NULL,
+        resolved INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (depends_on, job_id)
+    ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_job_deps_job ON job_deps(job_id)")
+    for sql in _DEP_TRIGGERS:
+        cur.execute(sql)
+
+
+def dag_jobs(job_id: str, columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """``job_id`` with everything it (transitively) depends on and everything depending on it.
+
+    In ``(created_at, id)`` order. Raises ``ValueError`` for an unknown
+    job or column.
+    """
+    conn = get_conn()
+    columns = list(columns or LIST_COLUMNS + ["depends_on", "pending_deps"])
+    bad = [c for c in columns if c not in set(job_columns())]
+    if bad:
+        raise ValueError(f"Unknown column(s): {', '.join(bad)}")
+    if conn.execute("SELECT 1 FROM jobs WHERE id=?", (job_id,)).fetchone() is None:
+        raise ValueError(f"Unknown job id: {job_id}")
+    rows = conn.execute(
+        f"""
+        WITH RECURSIVE
+            up(id) AS (SELECT ? UNION SELECT d.depends_on FROM job_deps d JOIN up ON d.job_id=up.id),
+            down(id) AS (SELECT ? UNION SELECT d.job_id FROM job_deps d JOIN down ON d.depends_on=down.id)
+        SELECT {','.join(columns)} FROM jobs
+        WHERE id IN (SELECT id FROM up UNION SELECT id FROM down)
+        ORDER BY created_at, id
+        """,
+        (job_id, job_id),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def _init_scheduled(cur):
+    """Move not-yet-due jobs of older databases into the ``scheduled`` state.
+
+    Before the scheduler, pending/failed rows waited on their own time
+    columns and the claim filtered them. Runs once, tracked in ``meta``.
+    """
+    if cur.execute("SELECT 1 FROM meta WHERE key='scheduled_state'").fetchone():
+        return
+    now = now_ms()
+    cur.execute(
+        "UPDATE jobs SET state='scheduled', "
+        "next_run_at=MAX(COALESCE(next_run_at,0), COALESCE(run_at,0)) "
+        "WHERE state IN ('pending','failed') AND (next_run_at>? OR run_at>?)",
+        (now, now),
+    )
+    cur.execute("INSERT INTO meta(key,value) VALUES('scheduled_state',1)")
+
+
 def job_counts():
+    """Jobs per state, read from the trigger-maintained counters."""
     conn = get_conn()
-    cur = conn.cursor()
-    states = ["pending", "processing", "completed", "failed", "dead"]
+    res = {s: 0 for s in JOB_STATES}
+    for state, n in conn.execute("SELECT state, n FROM job_counts"):
+        if n or state in res:
+            res[state] = n
+    return res
+
+
+def job_totals():
+    """Lifetime enqueued/completed/failed/dead counts."""
+    conn = get_conn()
+    keys = [f"{name}_total" for name in JOB_TOTALS]
+    rows = dict(conn.execute(
+        f"SELECT key, value FROM meta WHERE key IN ({','.join('?' * len(keys))})", keys
+    ).fetchall())
+    return {name: rows.get(f"{name}_total", 0) for name in JOB_TOTALS}
+
+
+def queue_counts() -> Dict[str, Dict[str, int]]:
+    """``{queue: {state: n}}`` for every queue shard."""
     res = {}
-    for s in states:
-        cur.execute("SELECT COUNT(1) FROM jobs WHERE state=?", (s,))
-        res[s] = cur.fetchone()[0]
+    for name in queue_names():
+        with use_queue(name):
+            res[name] = job_counts()
     return res
 
 
-def fetch_and_lock_job(worker_id: str, now_iso: str):
+def all_job_counts() -> Dict[str, int]:
+    """Jobs per state summed over all queues."""
+    total = {s: 0 for s in JOB_STATES}
+    for counts in queue_counts().values():
+        for state, n in counts.items():
+            total[state] = total.get(state, 0) + n
+    return total
+
+
+def all_job_totals() -> Dict[str, int]:
+    """Lifetime totals summed over all queues."""
+    total = {name: 0 for name in JOB_TOTALS}
+    for name in queue_names():
+        with use_queue(name):
+            for key, n in job_totals().items():
+                total[key] += n
+    return total
+
+
+# UPDATE ... RETURNING needs SQLite 3.35+; older builds use the two-step claim.
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Future run_at and retry backoff live in the 'scheduled' state until the
+# scheduler promotes them, so every pending/failed row is claimable now.
+_READY_WHERE = "state IN ('pending','failed')"
+_READY_ORDER = "ORDER BY priority DESC, created_at"
+
+
+def fetch_and_lock_job(worker_id: str, now: Union[None, int, str] = None):
     """Atomically pick one eligible job and set it to processing. Returns job dict or None.
 
-    Eligible: state in ('pending','failed') and (next_run_at IS NULL OR next_run_at <= now)
+    Eligible: state in ('pending','failed'); see :func:`promote_due`.
     """
+    jobs = fetch_and_lock_jobs(worker_id, 1, now)
+    return jobs[0] if jobs else None
+
+
+def _candidates_sql(tags: Optional[List[str]], n: int):
+    """SQL and parameters selecting up to ``n`` claimable job ids, in dequeue order."""
+    if not tags:
+        return f"SELECT id FROM jobs WHERE {_READY_WHERE} {_READY_ORDER} LIMIT ?", (n,)
+    # walk idx_job_tags_ready: only claimable jobs carrying the tag, already
+    # in dequeue order. Pinned, as the planner may prefer the primary key,
+    # which also covers finished jobs.
+    by_tag = (
+        "SELECT t.job_id, t.priority, t.created_at FROM job_tags t INDEXED BY idx_job_tags_ready "
+        f"JOIN jobs ON jobs.id=t.job_id WHERE t.ready=1 AND t.tag=? AND {_READY_WHERE} "
+        "ORDER BY t.priority DESC, t.created_at LIMIT ?"
+    )
+    tags = list(dict.fromkeys(tags))
+    if len(tags) == 1:
+        return f"SELECT job_id FROM ({by_tag})", (tags[0], n)
+    # several tags: the first n of each tag, merged. A job carrying more than
+    # one of them has identical rows, so UNION keeps it once, and only
+    # len(tags) * n rows are sorted.
+    union = " UNION ".join(f"SELECT * FROM ({by_tag})" for _ in tags)
+    params = tuple(p for tag in tags for p in (tag, n))
+    return f"SELECT job_id FROM ({union}) ORDER BY priority DESC, created_at LIMIT ?", params + (n,)
+
+
+# Seconds a claim stays valid without renewal (config key lease-seconds).
+DEFAULT_LEASE_SECONDS = 60
+
+
+def lease_ms() -> int:
+    """Lease length in milliseconds, from config ``lease-seconds``."""
+    try:
+        seconds = float(get_config("lease-seconds") or DEFAULT_LEASE_SECONDS)
+    except ValueError:
+        seconds = DEFAULT_LEASE_SECONDS
+    return max(1, int(seconds * 1000))
+
+
+def fetch_and_lock_jobs(worker_id: str, n: int, now: Union[None, int, str] = None,
+                        tags: Optional[List[str]] = None):
+    """Atomically claim up to ``n`` eligible jobs for ``worker_id``.
+
+    Returns a list of job dicts in dequeue order (possibly empty). Candidates
+    are found through ``idx_jobs_ready`` and claimed with a single
+    ``UPDATE ... RETURNING`` statement, so the write lock is held for one
+    index walk regardless of how many finished jobs the table holds.
+    ``now`` (epoch ms or ISO-8601, default: the current time) is recorded
+    as ``locked_at``. Scheduled jobs are not considered until
+    :func:`promote_due` has made them pending. With ``tags``, only jobs
+    carrying at least one of them are considered. Each claim is a lease
+    until ``lease_expires_at``; see :func:`renew_leases` and
+    :func:`reap_expired`.
+    """
+    now = to_ms(now) if now is not None else now_ms()
+    expires = now + lease_ms()
+    tags = list(tags or [])
     conn = get_conn()
     cur = conn.cursor()
+    candidates, params = _candidates_sql(tags, n)
+    if _HAS_RETURNING:
+        try:
+            cur.execute(
+                f"UPDATE jobs SET state='processing', locked_by=?, locked_at=?, updated_at=?, "
+                f"lease_expires_at=? WHERE id IN ({candidates}) "
+                f"AND state IN ('pending','failed') RETURNING *",
+                (worker_id, now, now, expires, *params),
+            )
+            # fetchall() steps the statement to completion so the implicit
+            # transaction commits before we return.
+            jobs = [dict(r) for r in cur.fetchall()]
+        except sqlite3.Error:
+            return []
+        # RETURNING order is unspecified; restore dequeue order.
+        jobs.sort(key=lambda j: (-(j.get("priority") or 0), j["created_at"]))
+        return jobs
     try:
         cur.execute("BEGIN IMMEDIATE")
-        cur.execute(
-            "SELECT id FROM jobs WHERE (state='pending' OR state='failed') AND (next_run_at IS NULL OR next_run_at<=?) AND (run_at IS NULL OR run_at<=?) ORDER BY priority DESC, created_at LIMIT 1",
-            (now_iso, now_iso),
-        )
-        row = cur.fetchone()
-        if not row:
-            conn.commit()
-            return None
-        job_id = row[0]
-        locked_at = now_iso
-        cur.execute(
-            "UPDATE jobs SET state='processing', locked_by=?, locked_at=?, updated_at=? WHERE id=? AND (state='pending' OR state='failed')",
-            (worker_id, locked_at, now_iso, job_id),
-        )
-        if cur.rowcount != 1:
-            conn.commit()
-            return None
-        cur.execute("SELECT * FROM jobs WHERE id=?", (job_id,))
-        job = dict(cur.fetchone())
+        cur.execute(candidates, params)
+        ids = [r[0] for r in cur.fetchall()]
+        jobs = []
+        for job_id in ids:
+            cur.execute(
+                "UPDATE jobs SET state='processing', locked_by=?, locked_at=?, updated_at=?, lease_expires_at=? "
+                "WHERE id=? AND (state='pending' OR state='failed')",
+                (worker_id, now, now, expires, job_id),
+            )
+            if cur.rowcount != 1:
+                continue
+            cur.execute("SELECT * FROM jobs WHERE id=?", (job_id,))
+            jobs.append(dict(cur.fetchone()))
         conn.commit()
-        return job
+        return jobs
     except Exception:
         conn.rollback()
-        return None
+        return []
+
 
+# Scheduled jobs moved to the ready states per write transaction.
+PROMOTE_BATCH = 500
 
-def complete_job(job_id: str, output: Optional[str]):
+
+def promote_due(now: Union[None, int, str] = None, limit: Optional[int] = None) -> int:
+    """Make scheduled jobs due by ``now`` claimable; return how many were promoted.
+
+    At most ``limit`` (default :data:`PROMOTE_BATCH`) per call. New jobs
+    become ``pending``; retries go back to ``failed`` so their attempts are
+    kept. Due rows are found through ``idx_jobs_scheduled``,
+    and when nothing is due no write transaction is started.
+    """
+    now = to_ms(now) if now is not None else now_ms()
+    limit = limit or PROMOTE_BATCH
     conn = get_conn()
+    due = "SELECT id FROM jobs WHERE state='scheduled' AND next_run_at<=? ORDER BY next_run_at LIMIT ?"
+    if conn.execute(due, (now, 1)).fetchone() is None:
+        return 0
     cur = conn.cursor()
-    now = datetime.utcnow().isoformat() + "Z"
-    cur.execute("UPDATE jobs SET state='completed', updated_at=?, output=? WHERE id=?", (now, output, job_id))
+    cur.execute(
+        f"UPDATE jobs SET state=CASE WHEN attempts>0 THEN 'failed' ELSE 'pending' END, updated_at=? "
+        f"WHERE id IN ({due}) AND state='scheduled'",
+        (now_ms(), now, limit),
+    )
+    conn.commit()
+    return cur.rowcount
+
+
+def next_due() -> Optional[int]:
+    """Earliest ``next_run_at`` among scheduled jobs, or ``None``."""
+    row = get_conn().execute(
+        "SELECT next_run_at FROM jobs WHERE state='scheduled' ORDER BY next_run_at LIMIT 1"
+    ).fetchone()
+    return row[0] if row else None
+
+
+def renew_leases(worker_id: str, lease: Optional[int] = None) -> int:
+    """Extend the lease of every job ``worker_id`` holds, in one UPDATE.
+
+    ``lease`` is in milliseconds (default :func:`lease_ms`). Returns the
+    number of jobs renewed.
+    """
+    now = now_ms()
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE jobs SET lease_expires_at=? WHERE state='processing' AND locked_by=?",
+        (now + (lease or lease_ms()), worker_id),
+    )
+    conn.commit()
+    return cur.rowcount
+
+
+# Expired leases requeued per write transaction.
+REAP_BATCH = 500
+
+
+def reap_expired(now: Union[None, int, str] = None, limit: Optional[int] = None) -> int:
+    """Requeue up to ``limit`` (default :data:`REAP_BATCH`) jobs whose lease ran out.
+
+    The worker holding them is presumed lost, possibly killed by the job
+    itself, so this counts as a failed attempt: the job goes back to
+    ``failed`` (claimable at once) or, out of retries, to ``dead``. Expired
+    rows are found through ``idx_jobs_lease``; when none have expired no
+    write transaction is started. Returns the number of jobs requeued.
+    """
+    now = to_ms(now) if now is not None else now_ms()
+    limit = limit or REAP_BATCH
+    conn = get_conn()
+    expired = (
+        "SELECT id FROM jobs WHERE state='processing' AND lease_expires_at<=? "
+        "ORDER BY lease_expires_at LIMIT ?"
+    )
+    if conn.execute(expired, (now, 1)).fetchone() is None:
+        return 0
+    default_retries = int(get_config("default-max-retries") or 3)
+    cur = conn.cursor()
+    cur.execute(
+        f"UPDATE jobs SET state=CASE WHEN attempts+1>=COALESCE(max_retries,?) THEN 'dead' ELSE 'failed' END, "
+        f"attempts=attempts+1, output='Lease expired: worker ' || COALESCE(locked_by,'?') || ' lost', "
+        f"locked_by=NULL, locked_at=NULL, lease_expires_at=NULL, updated_at=? "
+        f"WHERE id IN ({expired}) AND state='processing'",
+        (default_retries, now_ms(), now, limit),
+    )
     conn.commit()
+    return cur.rowcount
+
 
+def release_jobs(worker_id: str, job_ids):
+    """Return claimed-but-unstarted jobs to the queue.
 
-def fail_job(job_id: str, attempts: int, max_retries: Optional[int], base: int, output: Optional[str]):
+    Only rows still locked by ``worker_id`` are touched. Jobs that already
+    failed before go back to ``failed`` so their backoff/attempts are kept.
+    """
+    job_ids = list(job_ids)
+    if not job_ids:
+        return 0
     conn = get_conn()
     cur = conn.cursor()
-    now = datetime.utcnow().isoformat() + "Z"
+    now = now_ms()
+    marks = ",".join("?" * len(job_ids))
+    cur.execute(
+        f"UPDATE jobs SET state=CASE WHEN attempts>0 THEN 'failed' ELSE 'pending' END, "
+        f"locked_by=NULL, locked_at=NULL, lease_expires_at=NULL, updated_at=? "
+        f"WHERE id IN ({marks}) AND state='processing' AND locked_by=?",
+        (now, *job_ids, worker_id),
+    )
+    conn.commit()
+    return cur.rowcount
+
+
+def _owned(worker: Optional[str]):
+    """WHERE suffix and parameters limiting a result write to ``worker``'s live claim."""
+    if worker is None:
+        return "", ()
+    return " AND state='processing' AND locked_by=?", (worker,)
+
+
+def _complete(cur, job_id: str, output: Optional[str], now: int, worker: Optional[str] = None) -> int:
+    owned, params = _owned(worker)
+    cur.execute(f"UPDATE jobs SET state='completed', updated_at=?, output=? WHERE id=?{owned}",
+                (now, output, job_id) + params)
+    return cur.rowcount
+
+
+def _fail(cur, job_id: str, attempts: int, max_retries: Optional[int], base: int, output: Optional[str],
+          now: int, worker: Optional[str] = None) -> int:
+    owned, params = _owned(worker)
     # compute next_run_at
     if max_retries is None:
         max_retries = int(get_config("default-max-retries") or 3)
     if attempts >= max_retries:
         # move to dead
         cur.execute(
-            "UPDATE jobs SET state='dead', attempts=?, updated_at=?, output=? WHERE id=?",
-            (attempts, now, output, job_id),
+            f"UPDATE jobs SET state='dead', attempts=?, updated_at=?, output=? WHERE id=?{owned}",
+            (attempts, now, output, job_id) + params,
         )
     else:
         delay = (base ** attempts)
-        next_run = (datetime.utcnow()).timestamp() + delay
-        next_run_iso = datetime.utcfromtimestamp(next_run).isoformat() + "Z"
+        next_run = now + int(delay * 1000)
+        # wait out the backoff in 'scheduled'; promote_due makes it 'failed' again
         cur.execute(
-            "UPDATE jobs SET state='failed', attempts=?, next_run_at=?, updated_at=?, output=? WHERE id=?",
-            (attempts, next_run_iso, now, output, job_id),
+            f"UPDATE jobs SET state=?, attempts=?, next_run_at=?, updated_at=?, output=? WHERE id=?{owned}",
+            ("scheduled" if next_run > now else "failed", attempts, next_run, now, output, job_id) + params,
         )
+    return cur.rowcount
+
+
+def _count_stale(cur, n: int):
+    if n:
+        cur.execute("INSERT INTO meta(key,value) VALUES('stale_total',?) "
+                    "ON CONFLICT(key) DO UPDATE SET value=value+excluded.value", (n,))
+
+
+def complete_job(job_id: str, output: Optional[str], worker: Optional[str] = None) -> bool:
+    """Mark a job completed. Returns False if the write was dropped as stale.
+
+    With ``worker`` the result only lands while that worker still holds the
+    job; once its lease was reaped (and the job requeued or claimed by
+    someone else) the write is dropped and counted in the ``stale`` total.
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+    written = _complete(cur, job_id, output, now_ms(), worker)
+    if worker is not None and not written:
+        _count_stale(cur, 1)
+    conn.commit()
+    return bool(written)
+
+
+def fail_job(job_id: str, attempts: int, max_retries: Optional[int], base: int, output: Optional[str],
+             worker: Optional[str] = None) -> bool:
+    """Record a failed attempt; ``worker`` as for :func:`complete_job`."""
+    conn = get_conn()
+    cur = conn.cursor()
+    written = _fail(cur, job_id, attempts, max_retries, base, output, now_ms(), worker)
+    if worker is not None and not written:
+        _count_stale(cur, 1)
     conn.commit()
+    return bool(written)
+
+
+def write_results(results) -> int:
+    """Record many job outcomes in one write transaction (one commit).
+
+    ``results`` holds ``("complete", job_id, output[, worker])`` and
+    ``("fail", job_id, attempts, max_retries, base, output[, worker])``
+    tuples, in the argument order of :func:`complete_job` and
+    :func:`fail_job`. All or none are applied. Returns how many were
+    written; stale ones are dropped and counted.
+    """
+    results = list(results)
+    if not results:
+        return 0
+    conn = get_conn()
+    cur = conn.cursor()
+    now = now_ms()
+    # resolve config before taking the write lock
+    get_config("default-max-retries")
+    written = stale = 0
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        for kind, *args in results:
+            if kind == "complete":
+                write, fixed = _complete, 2
+            elif kind == "fail":
+                write, fixed = _fail, 5
+            else:
+                raise ValueError(f"Unknown result kind: {kind!r}")
+            worker = args[fixed] if len(args) > fixed else None
+            n = write(cur, *args[:fixed], now, worker)
+            written += n
+            if worker is not None and not n:
+                stale += 1
+        _count_stale(cur, stale)
+        cur.execute("COMMIT")
+    except Exception:
+        conn.rollback()
+        raise
+    return written
 
 
 def get_job(job_id: str):
@@ -211,8 +1563,139 @@ def get_job(job_id: str):
 
 
 def move_dlq_to_pending(job_id: str):
+    """Give a dead job another run; it waits again for dependencies that have not completed."""
     conn = get_conn()
     cur = conn.cursor()
-    now = datetime.utcnow().isoformat() + "Z"
-    cur.execute("UPDATE jobs SET state='pending', attempts=0, next_run_at=NULL, updated_at=? WHERE id=?", (now, job_id))
-    conn.commit()
+    now = now_ms()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        row = cur.execute("SELECT depends_on, on_dep_failure FROM jobs WHERE id=?", (job_id,)).fetchone()
+        deps = split_tags(row[0]) if row else []
+        pending = 0
+        if deps:
+            pending, edges = _dep_edges(cur, job_id, deps, row[1], strict=False)
+            cur.executemany("UPDATE job_deps SET resolved=? WHERE depends_on=? AND job_id=?",
+                            [(resolved, dep, job) for dep, job, resolved in edges])
+        cur.execute(
+            "UPDATE jobs SET state=?, pending_deps=?, attempts=0, next_run_at=NULL, updated_at=? WHERE id=?",
+            ("blocked" if pending else "pending", pending, now, job_id),
+        )
+        cur.execute("COMMIT")
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def add_latency(deltas: Dict[str, Tuple[List[int], float]]):
+    """Add histogram deltas ``{stage: (bucket_counts, seconds_total)}`` in one transaction."""
+    conn = get_conn(DEFAULT_QUEUE)
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        for stage, (counts, total) in deltas.items():
+            cur.executemany(
+                "INSERT INTO latency_buckets(stage,bucket,count) VALUES(?,?,?) "
+                "ON CONFLICT(stage,bucket) DO UPDATE SET count=count+excluded.count",
+                [(stage, i, c) for i, c in enumerate(counts) if c],
+            )
+            cur.execute(
+                "INSERT INTO latency_sums(stage,total) VALUES(?,?) "
+                "ON CONFLICT(stage) DO UPDATE SET total=total+excluded.total",
+                (stage, total),
+            )
+        cur.execute("COMMIT")
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def latency_histograms(nbuckets: int = 20) -> Dict[str, Tuple[List[int], float]]:
+    """Return ``{stage: (bucket_counts, seconds_total)}`` for every recorded stage."""
+    conn = get_conn(DEFAULT_QUEUE)
+    res = {}
+    for stage, total in conn.execute("SELECT stage, total FROM latency_sums ORDER BY stage"):
+        res[stage] = ([0] * nbuckets, total)
+    for stage, bucket, count in conn.execute("SELECT stage, bucket, count FROM latency_buckets"):
+        if stage in res and bucket < nbuckets:
+            res[stage][0][bucket] = count
+    return res
+
+
+def reset_latency():
+    conn = get_conn(DEFAULT_QUEUE)
+    conn.execute("DELETE FROM latency_buckets")
+    conn.execute("DELETE FROM latency_sums")
+
+
+def _ensure_archive(conn, schema: str):
+    """Create ``<schema>.jobs_archive`` and add any columns ``jobs`` gained since."""
+    _migrate_epoch_ms(conn, schema, "jobs_archive")
+    cols = [(r[1], r[2]) for r in conn.execute("PRAGMA main.table_info(jobs)")]
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {schema}.jobs_archive ("
+        + ", ".join(f"{name} {ctype}" for name, ctype in cols)
+        + ", archived_at INTEGER)"
+    )
+    have = {r[1] for r in conn.execute(f"PRAGMA {schema}.table_info(jobs_archive)")}
+    for name, ctype in cols:
+        if name not in have:
+            conn.execute(f"ALTER TABLE {schema}.jobs_archive ADD COLUMN {name} {ctype}")
+    return [name for name, _ in cols]
+
+
+def _attach_archive(conn, archive_path: Optional[str]) -> str:
+    if not archive_path:
+        return "main"
+    attached = {r[1]: r[2] for r in conn.execute("PRAGMA database_list")}
+    if "archive" in attached:
+        if os.path.abspath(attached["archive"]) == os.path.abspath(archive_path):
+            return "archive"
+        conn.execute("DETACH DATABASE archive")
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+    return "archive"
+
+
+def archive_finished_jobs(state: str, older_than: int, batch_size: int = 500,
+                          archive_path: Optional[str] = None) -> int:
+    """Move one batch of ``state`` jobs last updated before the cutoff into the archive.
+
+    Rows are copied into ``jobs_archive`` (in this DB, or in ``archive_path``
+    when given) and deleted from ``jobs`` in the same short transaction.
+    Returns the number of jobs moved; call repeatedly until it returns 0.
+    """
+    conn = get_conn()
+    cur = conn.cursor()
+    schema = _attach_archive(conn, archive_path)
+    cols = ",".join(_ensure_archive(conn, schema))
+    now = now_ms()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS gc_batch(id TEXT PRIMARY KEY)"
+        )
+        cur.execute("DELETE FROM temp.gc_batch")
+        cur.execute(
+            f"INSERT INTO temp.gc_batch(id) SELECT id FROM jobs "
+            f"WHERE {_FINISHED} AND state=? AND updated_at<? ORDER BY updated_at LIMIT ?",
+            (state, older_than, batch_size),
+        )
+        cur.execute(
+            f"INSERT INTO {schema}.jobs_archive({cols},archived_at) "
+            f"SELECT {cols},? FROM jobs WHERE id IN (SELECT id FROM temp.gc_batch)",
+            (now,),
+        )
+        cur.execute("DELETE FROM jobs WHERE id IN (SELECT id FROM temp.gc_batch)")
+        moved = cur.rowcount
+        cur.execute("COMMIT")
+    except Exception:
+        conn.rollback()
+        raise
+    return moved
+
+
+def reclaim_space(pages: int = 1000):
+    """Return up to ``pages`` free pages (0 = all) to the OS and checkpoint the WAL."""
+    conn = get_conn()
+    # executescript steps the pragma to completion; execute() frees one page
+    conn.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+    return tuple(conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone())
@@ -0,0 +1,79 @@
+"""Claim leases: worker heartbeats and the supervisor's reaper.
+
+A claimed job is leased to its worker until ``lease_expires_at``
+(``lease-seconds`` from config, default 60). Each worker process runs a
+:class:`Heartbeat` thread that extends every lease it holds with one
+UPDATE per queue every third of the lease, however many jobs it is
+running, prefetching or waiting to write back. A worker that is killed
+stops renewing. The supervisor's :class:`Reaper` then requeues its jobs
+in bounded batches once their leases run out, counting the lost run as a
+failed attempt.
+"""
+import threading
+import time
+from typing import List
+
+from . import db
+from . import notify
+
+# Batches per queue per reaper pass, so one pass never holds up the supervisor.
+MAX_BATCHES = 10
+
+
+class Heartbeat:
+    """Background thread renewing ``worker_name``'s leases in ``queues``."""
+
+    def __init__(self, worker_name: str, queues: List[str], store=db):
+        self.name = worker_name
+        self.queues = list(queues)
+        self.store = store
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="queuectl-heartbeat", daemon=True)
+        self.thread.start()
+
+    def beat(self) -> int:
+        lease = self.store.lease_ms()
+        renewed = 0
+        for queue in self.queues:
+            with db.use_queue(queue):
+                renewed += self.store.renew_leases(self.name, lease)
+        return renewed
+
+    def _run(self):
+        while not self.stopped.wait(self.store.lease_ms() / 3000.0):
+            try:
+                self.beat()
+            except Exception as e:
+                # try again next interval; the lease outlasts two misses
+                print("lease renewal failed:", e, flush=True)
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+class Reaper:
+    """Requeue jobs whose lease expired, at most every ``INTERVAL`` seconds."""
+
+    INTERVAL = 1.0
+
+    def __init__(self, queues: List[str]):
+        self.queues = list(queues)
+        self.last_run = float("-inf")
+
+    def tick(self) -> int:
+        if time.monotonic() - self.last_run < self.INTERVAL:
+            return 0
+        self.last_run = time.monotonic()
+        reaped = 0
+        for queue in self.queues:
+            with db.use_queue(queue):
+                for _ in range(MAX_BATCHES):
+                    n = db.reap_expired()
+                    reaped += n
+                    if n < db.REAP_BATCH:
+                        break
+        if reaped:
+            print(f"requeued {reaped} jobs with expired leases", flush=True)
+            notify.poke()
+        return reaped
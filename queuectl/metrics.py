@@ -2,18 +2,60 @@ import json
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from socketserver import ThreadingMixIn
 from . import db
+from . import stats
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def prometheus_text() -> str:
+    """Render job gauges and lifetime counters in Prometheus text format."""
+    lines = [
+        "# HELP queuectl_jobs Jobs currently in each state.",
+        "# TYPE queuectl_jobs gauge",
+    ]
+    per_queue = db.queue_counts()
+    total = {}
+    for counts in per_queue.values():
+        for state, n in counts.items():
+            total[state] = total.get(state, 0) + n
+    for state, n in total.items():
+        lines.append(f'queuectl_jobs{{state="{state}"}} {n}')
+    lines.append("# HELP queuectl_queue_jobs Jobs currently in each state, per queue.")
+    lines.append("# TYPE queuectl_queue_jobs gauge")
+    for queue, counts in per_queue.items():
+        for state, n in counts.items():
+            lines.append(f'queuectl_queue_jobs{{queue="{queue}",state="{state}"}} {n}')
+    help_text = {
+        "enqueued": "Jobs enqueued.",
+        "completed": "Jobs completed successfully.",
+        "failed": "Failed job attempts.",
+        "dead": "Jobs moved to the dead letter queue.",
+        "stale": "Job results dropped because the worker's claim had been reaped.",
+    }
+    for name, n in db.all_job_totals().items():
+        metric = f"queuectl_jobs_{name}_total"
+        lines.append(f"# HELP {metric} {help_text[name]}")
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {n}")
+    lines.extend(stats.prometheus_lines())
+    return "\n".join(lines) + "\n"
 
 
 class MetricsHandler(BaseHTTPRequestHandler):
     def do_GET(self):
-        if self.path != "/metrics":
+        if self.path == "/metrics":
+            counts = db.all_job_counts()
+            self._send(json.dumps(counts).encode("utf-8"), "application/json")
+        elif self.path == "/metrics/prometheus":
+            self._send(prometheus_text().encode("utf-8"), PROMETHEUS_CONTENT_TYPE)
+        else:
             self.send_response(404)
             self.end_headers()
-            return
-        counts = db.job_counts()
-        payload = json.dumps(counts).encode("utf-8")
+
+    def _send(self, payload: bytes, content_type: str):
         self.send_response(200)
-        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Type", content_type)
         self.send_header("Content-Length", str(len(payload)))
         self.end_headers()
         self.wfile.write(payload)
@@ -26,7 +68,7 @@ class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
 def serve(port: int = 8000):
     db.init_db()
     server = ThreadedHTTPServer(("", port), MetricsHandler)
-    print(f"Metrics server listening on 0.0.0.0:{port} (endpoint /metrics)")
+    print(f"Metrics server listening on 0.0.0.0:{port} (endpoints /metrics, /metrics/prometheus)")
     try:
         server.serve_forever()
     except KeyboardInterrupt:
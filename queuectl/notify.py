@@ -0,0 +1,77 @@
+"""Local wakeup channel between producers and idle workers.
+
+The supervisor binds a Unix datagram socket at ``~/.queuectl/wakeup.sock``
+before forking workers, so every worker inherits the same descriptor and can
+block on it instead of sleeping. Producers call :func:`poke` after they commit
+new work; a poke with no listener is silently dropped.
+"""
+import os
+import select
+import socket
+
+
+def _sock_path() -> str:
+    return os.path.join(os.path.expanduser("~/.queuectl"), "wakeup.sock")
+
+
+class WakeupChannel:
+    """Datagram socket owned by the supervisor and shared with its workers."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.owner = os.getpid()
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(path)
+        self.sock.setblocking(False)
+
+    def wait(self, timeout: float) -> bool:
+        """Block up to ``timeout`` seconds; True if a poke arrived."""
+        r, _, _ = select.select([self.sock], [], [], timeout)
+        if not r:
+            return False
+        # drain queued pokes; another worker may have beaten us to them
+        while True:
+            try:
+                self.sock.recv(64)
+            except (BlockingIOError, InterruptedError):
+                break
+        return True
+
+    def close(self):
+        self.sock.close()
+        if os.getpid() == self.owner:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def open_channel():
+    """Bind the wakeup socket, or return None where that is not possible."""
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    d = os.path.expanduser("~/.queuectl")
+    os.makedirs(d, exist_ok=True)
+    try:
+        return WakeupChannel(_sock_path())
+    except OSError:
+        # e.g. path longer than sun_path allows
+        return None
+
+
+def poke():
+    """Wake idle workers, if a supervisor is listening."""
+    if not hasattr(socket, "AF_UNIX"):
+        return
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        s.setblocking(False)
+        s.sendto(b"!", _sock_path())
+    except OSError:
+        pass
+    finally:
+        s.close()
@@ -0,0 +1,95 @@
+"""Job output handling: stream to a log file, keep a bounded tail for the DB.
+
+A job's stdout/stderr never has to fit in worker memory. Uncompressed logs
+are written by the child process straight into
+``~/.queuectl/logs/<id>.log``; only the last ``output-tail-bytes`` are read
+back and stored in ``jobs.output``. With ``log-compress`` enabled the output
+is piped through the worker into ``<id>.log.gz`` and the tail is kept in a
+ring buffer as it streams past.
+"""
+import gzip
+import os
+import pathlib
+import subprocess
+
+from . import db
+
+DEFAULT_TAIL_BYTES = 65536
+
+
+def _logs_dir() -> str:
+    d = os.path.expanduser("~/.queuectl/logs")
+    pathlib.Path(d).mkdir(parents=True, exist_ok=True)
+    return d
+
+
+def settings():
+    """Return ``(tail_bytes, compress)`` from config."""
+    try:
+        tail_bytes = int(db.get_config("output-tail-bytes") or DEFAULT_TAIL_BYTES)
+    except ValueError:
+        tail_bytes = DEFAULT_TAIL_BYTES
+    compress = (db.get_config("log-compress") or "").lower() in ("1", "true", "yes", "on")
+    return max(0, tail_bytes), compress
+
+
+class JobOutput:
+    """Destination for one job run's combined stdout and stderr.
+
+    Pass :attr:`stdout` to the subprocess. When it is ``subprocess.PIPE``
+    the caller must :meth:`feed` every chunk it reads from the pipe.
+    """
+
+    def __init__(self, job_id: str, tail_bytes: int = DEFAULT_TAIL_BYTES, compress: bool = False):
+        self.tail_bytes = tail_bytes
+        self.compress = compress
+        self.path = os.path.join(_logs_dir(), f"{job_id}.log" + (".gz" if compress else ""))
+        self._tail = bytearray()
+        if compress:
+            self._file = gzip.open(self.path, "wb")
+            self.stdout = subprocess.PIPE
+        else:
+            # truncate any log from a previous attempt, then append through
+            # O_APPEND so our own notes land after what the child wrote
+            open(self.path, "wb").close()
+            self._file = open(self.path, "ab", buffering=0)
+            self.stdout = self._file
+
+    @property
+    def piped(self) -> bool:
+        return self.stdout is subprocess.PIPE
+
+    def feed(self, chunk: bytes):
+        self._file.write(chunk)
+        self._keep(chunk)
+
+    def note(self, text: str):
+        """Append a worker message (e.g. a timeout notice) to the log."""
+        data = text.encode("utf-8")
+        self._file.write(data)
+        self._keep(data)
+
+    def _keep(self, data: bytes):
+        if not self.piped or not self.tail_bytes:
+            return
+        self._tail += data
+        # trim lazily so the ring buffer costs amortised O(1) per byte
+        if len(self._tail) > 2 * self.tail_bytes:
+            del self._tail[:-self.tail_bytes]
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def tail(self) -> str:
+        """Return the last ``tail_bytes`` of output (call after :meth:`close`)."""
+        if not self.tail_bytes:
+            return ""
+        if self.piped:
+            data = bytes(self._tail[-self.tail_bytes:])
+        else:
+            with open(self.path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - self.tail_bytes))
+                data = f.read()
+        return data.decode("utf-8", "replace")
@@ -0,0 +1,98 @@
+"""Retention: archive finished jobs and reclaim space.
+
+``queuectl gc`` runs a pass on demand; the worker supervisor runs one every
+``gc-interval`` when that config key is set. Each pass moves completed/dead
+jobs older than their retention window into ``jobs_archive`` in bounded
+batches (one short write transaction each), then incrementally vacuums and
+checkpoints the WAL.
+
+Config keys: ``gc-interval``, ``retention-completed``, ``retention-dead``
+(durations like ``30m``, ``12h``, ``7d``), ``gc-batch-size`` and
+``archive-db`` (path of a separate archive database file).
+"""
+import re
+import time
+from typing import Optional
+
+from . import db
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def parse_duration(text: str) -> float:
+    """Parse ``90``, ``30s``, ``15m``, ``12h``, ``7d`` or ``2w`` into seconds."""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*", text or "")
+    if not m:
+        raise ValueError(f"Invalid duration: {text!r}")
+    return float(m.group(1)) * _UNITS[m.group(2) or "s"]
+
+
+def _cutoff(seconds: float) -> int:
+    return db.now_ms() - int(seconds * 1000)
+
+
+def run_gc(completed_older_than: Optional[float] = None, dead_older_than: Optional[float] = None,
+           batch_size: int = DEFAULT_BATCH_SIZE, archive_path: Optional[str] = None,
+           max_batches: Optional[int] = None, vacuum_pages: int = 1000):
+    """Run one retention pass and return ``{"completed": n, "dead": n}`` moved.
+
+    Every queue shard is processed in turn. ``max_batches`` bounds the work
+    per state and queue, so a background pass never runs for long; leftovers
+    are picked up by the next pass. Idempotency keys older than the dedupe
+    window are forgotten as well.
+    """
+    moved = {"completed": 0, "dead": 0}
+    for queue in db.queue_names():
+        with db.use_queue(queue):
+            for state, age in (("completed", completed_older_than), ("dead", dead_older_than)):
+                if age is None:
+                    continue
+                cutoff = _cutoff(age)
+                batches = 0
+                while max_batches is None or batches < max_batches:
+                    n = db.archive_finished_jobs(state, cutoff, batch_size, archive_path)
+                    moved[state] += n
+                    batches += 1
+                    if n < batch_size:
+                        break
+            # idempotency keys past the dedupe window
+            batches = 0
+            while max_batches is None or batches < max_batches:
+                batches += 1
+                if db.prune_idempotency_keys(batch_size) < batch_size:
+                    break
+            db.reclaim_space(vacuum_pages)
+    return moved
+
+
+class BackgroundGC:
+    """Periodic retention pass driven from the supervisor loop."""
+
+    # batches per state per pass
+    MAX_BATCHES = 20
+
+    def __init__(self):
+        self.last_run = time.monotonic()
+
+    def tick(self):
+        interval = db.get_config("gc-interval")
+        if not interval:
+            return None
+        try:
+            if time.monotonic() - self.last_run < parse_duration(interval):
+                return None
+            self.last_run = time.monotonic()
+            completed = db.get_config("retention-completed")
+            dead = db.get_config("retention-dead")
+            return run_gc(
+                parse_duration(completed) if completed else None,
+                parse_duration(dead) if dead else None,
+                batch_size=int(db.get_config("gc-batch-size") or DEFAULT_BATCH_SIZE),
+                archive_path=db.get_config("archive-db") or None,
+                max_batches=self.MAX_BATCHES,
+            )
+        except Exception as e:
+            print("gc failed:", e, flush=True)
+            return None
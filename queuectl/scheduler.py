@@ -0,0 +1,76 @@
+"""Supervisor-owned timer for delayed and retrying jobs.
+
+Jobs enqueued with a future ``run_at`` and failed jobs waiting out their
+backoff sit in the ``scheduled`` state with their due time in
+``next_run_at``. The claim query only looks at ``pending``/``failed`` rows,
+so however many jobs are scheduled, a poll never walks them.
+
+The :class:`Scheduler` keeps a heap of each queue's next due time, read
+from the head of ``idx_jobs_scheduled``. When an entry comes due it
+promotes that queue's due jobs in batches of :data:`db.PROMOTE_BATCH` and
+pokes idle workers. The heads are re-read every :attr:`Scheduler.REFRESH`
+seconds to pick up jobs scheduled since (by enqueue or by a failing
+worker). The supervisor sleeps until the earliest entry, so due jobs are
+promoted on time rather than on the next fixed tick.
+
+Workers started without a supervisor promote due jobs themselves before
+claiming (see ``worker.claim``).
+"""
+import heapq
+import time
+from typing import List, Optional
+
+from . import db
+from . import notify
+
+
+class Scheduler:
+    # seconds between re-reads of each queue's next due time
+    REFRESH = 0.5
+
+    def __init__(self, queues: List[str]):
+        self.queues = list(queues)
+        self.heap = []
+        self.refreshed = float("-inf")
+
+    def refresh(self):
+        """Reload every queue's next due time from the index."""
+        heap = []
+        for queue in self.queues:
+            with db.use_queue(queue):
+                due = db.next_due()
+            if due is not None:
+                heap.append((due, queue))
+        heapq.heapify(heap)
+        self.heap = heap
+        self.refreshed = time.monotonic()
+
+    def tick(self, now: Optional[int] = None) -> int:
+        """Promote whatever is due; return the number of jobs made claimable."""
+        if time.monotonic() - self.refreshed >= self.REFRESH:
+            self.refresh()
+        now = db.now_ms() if now is None else now
+        due = set()
+        while self.heap and self.heap[0][0] <= now:
+            due.add(heapq.heappop(self.heap)[1])
+        promoted = 0
+        for queue in due:
+            with db.use_queue(queue):
+                while True:
+                    n = db.promote_due(now)
+                    promoted += n
+                    if n < db.PROMOTE_BATCH:
+                        break
+                nxt = db.next_due()
+            if nxt is not None:
+                heapq.heappush(self.heap, (nxt, queue))
+        if promoted:
+            notify.poke()
+        return promoted
+
+    def wait(self, longest: float) -> float:
+        """Seconds to sleep before the next :meth:`tick`, at most ``longest``."""
+        if not self.heap:
+            return longest
+        delay = (self.heap[0][0] - db.now_ms()) / 1000.0
+        return min(longest, max(0.001, delay))
@@ -0,0 +1,138 @@
+"""Per-stage job latency histograms.
+
+Workers time four stages of every job:
+
+- ``queue_wait``: from when the job became runnable (enqueue, ``run_at`` or
+  retry time) until a worker claimed it
+- ``claim``: the claim transaction, including waiting for the SQLite lock
+- ``execute``: running the command
+- ``writeback``: recording the result
+
+Observations go into fixed-bucket histograms held in process memory (a
+bisect and two integer increments, no locks or I/O). Every
+``FLUSH_INTERVAL`` seconds the deltas are added to the ``latency_buckets``
+table, from which ``queuectl stats`` and the metrics server read.
+"""
+import bisect
+import time
+from typing import Dict, List, Optional
+
+from . import db
+
+STAGES = ("queue_wait", "claim", "execute", "writeback")
+
+# Bucket upper bounds in seconds; the last bucket is +Inf.
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0, float("inf"),
+)
+
+FLUSH_INTERVAL = 5.0
+
+
+class Histogram:
+    __slots__ = ("counts", "total")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+
+    def __bool__(self):
+        return any(self.counts)
+
+
+class Recorder:
+    """Process-local histograms, flushed to the database periodically."""
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, store=db):
+        self.flush_interval = flush_interval
+        self.store = store
+        self.hists = {stage: Histogram() for stage in STAGES}
+        self.last_flush = time.monotonic()
+
+    def observe(self, stage: str, seconds: float):
+        self.hists[stage].observe(max(0.0, seconds))
+
+    def due(self) -> bool:
+        return time.monotonic() - self.last_flush >= self.flush_interval
+
+    def take(self) -> Dict[str, Histogram]:
+        """Swap out and return the pending histograms."""
+        pending = {s: h for s, h in self.hists.items() if h}
+        self.hists = {stage: Histogram() for stage in STAGES}
+        self.last_flush = time.monotonic()
+        return pending
+
+    def flush(self, force: bool = False):
+        if not force and not self.due():
+            return
+        pending = self.take()
+        if pending:
+            write(pending, self.store)
+
+
+def write(pending: Dict[str, Histogram], store=db):
+    if not pending:
+        return
+    store.add_latency({s: (h.counts, h.total) for s, h in pending.items()})
+
+
+def queue_wait(job, claimed_at: float) -> Optional[float]:
+    """Seconds between a job becoming runnable and ``claimed_at`` (epoch)."""
+    ready = [t for t in (job.get("created_at"), job.get("run_at"), job.get("next_run_at")) if t]
+    if not ready:
+        return None
+    return claimed_at - max(ready) / 1000.0
+
+
+def percentile(counts: List[int], pct: float) -> Optional[float]:
+    """Estimate a percentile from bucket counts, interpolating inside the bucket."""
+    n = sum(counts)
+    if not n:
+        return None
+    rank = pct / 100.0 * n
+    seen = 0
+    for i, c in enumerate(counts):
+        if c and seen + c >= rank:
+            lo = BUCKETS[i - 1] if i else 0.0
+            hi = BUCKETS[i]
+            if hi == float("inf"):
+                return lo
+            return lo + (hi - lo) * ((rank - seen) / c)
+        seen += c
+    return BUCKETS[-2]
+
+
+def summary() -> Dict[str, Dict[str, Optional[float]]]:
+    """p50/p95/p99, mean and count per stage from the stored histograms."""
+    res = {}
+    for stage, (counts, total) in db.latency_histograms(len(BUCKETS)).items():
+        n = sum(counts)
+        res[stage] = {
+            "count": n,
+            "mean": total / n if n else None,
+            "p50": percentile(counts, 50),
+            "p95": percentile(counts, 95),
+            "p99": percentile(counts, 99),
+        }
+    return res
+
+
+def prometheus_lines() -> List[str]:
+    lines = [
+        "# HELP queuectl_job_stage_seconds Time spent per job lifecycle stage.",
+        "# TYPE queuectl_job_stage_seconds histogram",
+    ]
+    for stage, (counts, total) in db.latency_histograms(len(BUCKETS)).items():
+        cumulative = 0
+        for le, c in zip(BUCKETS, counts):
+            cumulative += c
+            label = "+Inf" if le == float("inf") else repr(le)
+            lines.append(f'queuectl_job_stage_seconds_bucket{{stage="{stage}",le="{label}"}} {cumulative}')
+        lines.append(f'queuectl_job_stage_seconds_sum{{stage="{stage}"}} {total}')
+        lines.append(f'queuectl_job_stage_seconds_count{{stage="{stage}"}} {cumulative}')
+    return lines
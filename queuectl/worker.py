@@ -1,90 +1,467 @@
+import json
 import os
+import random
 import signal
+import threading
 import time
 import subprocess
 import multiprocessing as mp
-from datetime import datetime
-from typing import Optional
+from collections import deque
+from typing import List, Optional, Tuple
 
+from . import autoscale
+from . import broker as broker_mod
+from . import callpool
 from . import db
+from . import lease
+from . import notify
+from . import output as output_mod
+from . import retention
+from . import scheduler as scheduler_mod
+from . import stats
+from . import writeback as writeback_mod
 
-import pathlib
 
+TERMINATE = mp.Event()
 
-def _logs_dir() -> str:
-    d = os.path.expanduser("~/.queuectl/logs")
-    pathlib.Path(d).mkdir(parents=True, exist_ok=True)
-    return d
+# Bytes read from a job's output pipe per chunk.
+READ_CHUNK = 65536
 
+# Idle polling backoff (seconds). Workers attached to a wakeup channel are
+# woken by enqueue, so they can afford to poll much less often.
+IDLE_BACKOFF_MIN = 0.05
+IDLE_BACKOFF_MAX = 1.0
+IDLE_BACKOFF_MAX_NOTIFIED = 5.0
 
-TERMINATE = mp.Event()
+# Longest a prefetched job may sit in the local buffer before it is handed
+# back to the queue for other workers.
+PREFETCH_MAX_HOLD = 30.0
+
+# A worker that dies within this many seconds of starting is replaced no
+# sooner than this long after it started, so a crash loop does not spin.
+RESTART_MIN_UPTIME = 5.0
+
+
+class Slot:
+    """State the supervisor shares with one worker process.
+
+    Setting ``stop`` drains just this worker: it finishes the jobs it has
+    started, hands buffered ones back and exits. ``load`` holds running
+    totals of claim attempts, successful claims and seconds spent running
+    jobs, which the autoscaler samples.
+    """
+
+    def __init__(self):
+        self.stop = mp.Event()
+        self.load = mp.RawArray("d", 3)
+
+    def stopping(self) -> bool:
+        return TERMINATE.is_set() or self.stop.is_set()
+
+    def claimed(self, got: bool):
+        self.load[0] += 1
+        if got:
+            self.load[1] += 1
 
+    def busy(self, seconds: float):
+        self.load[2] += seconds
 
-def worker_loop(worker_name: str, base_backoff: int):
-    """Single worker loop: pick, run, update"""
-    while not TERMINATE.is_set():
-        now_iso = datetime.utcnow().isoformat() + "Z"
-        job = db.fetch_and_lock_job(worker_name, now_iso)
-        if not job:
-            time.sleep(1)
+
+def _stopping(slot: Optional[Slot]) -> bool:
+    return slot.stopping() if slot is not None else TERMINATE.is_set()
+
+
+def parse_queues(text: Optional[str]) -> List[Tuple[str, int]]:
+    """Parse ``emails:3,reports`` into ``[("emails", 3), ("reports", 1)]``."""
+    res = []
+    for part in (text or "").split(","):
+        part = part.strip()
+        if not part:
             continue
+        name, _, weight = part.partition(":")
+        try:
+            weight = int(weight) if weight else 1
+        except ValueError:
+            raise ValueError(f"Invalid queue weight: {part!r}") from None
+        if weight < 1:
+            raise ValueError(f"Invalid queue weight: {part!r}")
+        res.append((db.check_queue_name(name.strip()), weight))
+    return res or [(db.DEFAULT_QUEUE, 1)]
+
+
+class QueueCycle:
+    """Weighted round-robin over a worker's queues.
+
+    With ``emails:3,reports`` emails comes first in three rounds out of
+    four. Each :meth:`round` lists every queue once, starting with the one
+    due, so a worker falls through to its other queues instead of idling
+    while one of them is empty.
+    """
+
+    def __init__(self, queues: List[Tuple[str, int]]):
+        self.names = [name for name, _ in queues]
+        self.slots = [i for i, (_, weight) in enumerate(queues) for _ in range(weight)]
+        self.pos = 0
+
+    def round(self) -> List[str]:
+        first = self.slots[self.pos % len(self.slots)]
+        self.pos += 1
+        return self.names[first:] + self.names[:first]
+
+
+def claim(worker_name: str, n: int, cycle: QueueCycle, tags=None, promote: bool = False, store=db):
+    """Claim up to ``n`` jobs from the first of the worker's queues that has any.
+
+    Each job is tagged with its ``queue`` so results go back to the right shard.
+    With ``promote`` (no supervisor scheduler running) due scheduled jobs are
+    made claimable first. ``store`` is ``db`` or a ``broker.BrokerClient``.
+    """
+    for queue in cycle.round():
+        with db.use_queue(queue):
+            if promote:
+                store.promote_due()
+            jobs = store.fetch_and_lock_jobs(worker_name, n, tags=tags)
+        if jobs:
+            for job in jobs:
+                job["queue"] = queue
+            return jobs
+    return []
+
+
+def release(worker_name: str, jobs, store=db):
+    """Hand claimed-but-unstarted jobs back to their queues."""
+    by_queue = {}
+    for job in jobs:
+        by_queue.setdefault(job.get("queue"), []).append(job["id"])
+    for queue, ids in by_queue.items():
+        with db.use_queue(queue):
+            store.release_jobs(worker_name, ids)
+
+
+def _idle_wait(wakeup, delay: float):
+    """Sleep for a jittered ``delay``, returning early if woken."""
+    timeout = random.uniform(delay / 2, delay)
+    if wakeup is None:
+        time.sleep(timeout)
+        return False
+    try:
+        return wakeup.wait(timeout)
+    except OSError:
+        time.sleep(timeout)
+        return False
+
+
+def worker_loop(worker_name: str, base_backoff: int, prefetch: int = 1, wakeup=None, tags=None,
+                queues=None, slot: Optional[Slot] = None, writeback=None, store=db):
+    """Single worker loop: pick, run, update
+
+    With ``prefetch > 1`` the worker claims up to that many jobs per
+    transaction and runs them from a local buffer. Buffered jobs not started
+    before shutdown or within ``PREFETCH_MAX_HOLD`` seconds are released.
+
+    When idle the worker backs off exponentially (with jitter) between polls
+    and, given a ``wakeup`` channel, returns to the queue as soon as a
+    producer pokes it. With ``tags`` only jobs carrying one of them are
+    claimed. ``queues`` is a list of ``(name, weight)`` picked between by
+    :class:`QueueCycle` (default: the default queue). A supervisor's
+    ``slot`` lets it drain this worker alone and read its load; without
+    one the worker also promotes due scheduled jobs itself. Results go
+    through ``writeback`` (a :class:`writeback.WriteBack`) when given.
+    Everything else goes to ``store``: ``db``, or a ``broker.BrokerClient``
+    for a worker on another host.
+    """
+    prefetch = max(1, prefetch)
+    cycle = QueueCycle(queues or [(db.DEFAULT_QUEUE, 1)])
+    buffer = deque()
+    claimed_at = 0.0
+    max_idle = IDLE_BACKOFF_MAX_NOTIFIED if wakeup is not None else IDLE_BACKOFF_MAX
+    idle = IDLE_BACKOFF_MIN
+    recorder = stats.Recorder(store=store)
+    try:
+        while not _stopping(slot):
+            if buffer and time.monotonic() - claimed_at > PREFETCH_MAX_HOLD:
+                release(worker_name, buffer, store)
+                buffer.clear()
+            if not buffer:
+                t0 = time.perf_counter()
+                buffer.extend(claim(worker_name, prefetch, cycle, tags, slot is None, store))
+                claimed_at = time.monotonic()
+                if slot is not None:
+                    slot.claimed(bool(buffer))
+                if not buffer:
+                    recorder.flush()
+                    if _idle_wait(wakeup, idle):
+                        idle = IDLE_BACKOFF_MIN
+                    else:
+                        idle = min(max_idle, idle * 2)
+                    continue
+                _observe_claim(recorder, buffer, time.perf_counter() - t0)
+                idle = IDLE_BACKOFF_MIN
+            job = buffer.popleft()
+            started = time.perf_counter()
+            with db.use_queue(job["queue"]):
+                run_job(job, base_backoff, recorder, writeback, store)
+            if slot is not None:
+                slot.busy(time.perf_counter() - started)
+            recorder.flush()
+    finally:
+        if buffer:
+            release(worker_name, buffer, store)
+        recorder.flush(force=True)
+
+
+def _observe_claim(recorder, jobs, claim_seconds: float):
+    recorder.observe("claim", claim_seconds)
+    now = time.time()
+    for job in jobs:
+        wait = stats.queue_wait(job, now)
+        if wait is not None:
+            recorder.observe("queue_wait", wait)
+
+
+def _job_limits(job):
+    """Return ``(attempts, max_retries, timeout)`` for a claimed job."""
+    attempts = job.get("attempts", 0) + 1
+    max_retries = job.get("max_retries") or db.get_config("default-max-retries")
+    if max_retries is not None:
+        try:
+            max_retries = int(max_retries)
+        except Exception:
+            max_retries = 3
+
+    # job timeout from config
+    timeout = int(db.get_config("job-timeout") or 10)
+    return attempts, max_retries, timeout
+
+
+def _pump(pipe, out):
+    while True:
+        chunk = pipe.read(READ_CHUNK)
+        if not chunk:
+            break
+        out.feed(chunk)
+    pipe.close()
+
+
+def _kill_session(pid: int):
+    # the shell runs in its own session; kill it with any grandchildren,
+    # which would otherwise keep the output pipe open
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _process_args(job):
+    """``(args, shell)`` for Popen: argv jobs are exec'd directly, without /bin/sh."""
+    if job.get("kind") == "argv":
+        return json.loads(job["payload"]), False
+    return job["command"], True
 
-        job_id = job["id"]
-        cmd = job["command"]
-        attempts = job.get("attempts", 0) + 1
-        max_retries = job.get("max_retries") or db.get_config("default-max-retries")
-        if max_retries is not None:
-            try:
-                max_retries = int(max_retries)
-            except Exception:
-                max_retries = 3
-
-        # job timeout from config
-        timeout = int(db.get_config("job-timeout") or 10)
-        logfile = None
+
+def _run_process(job, out, timeout):
+    """Run a shell or argv job; return ``(returncode, timed_out)``."""
+    args, shell = _process_args(job)
+    p = subprocess.Popen(
+        args,
+        shell=shell,
+        stdin=subprocess.DEVNULL,
+        stdout=out.stdout,
+        stderr=subprocess.STDOUT,
+        start_new_session=True,
+    )
+    pump = None
+    if out.piped:
+        pump = threading.Thread(target=_pump, args=(p.stdout, out), daemon=True)
+        pump.start()
+    try:
+        returncode = p.wait(timeout=timeout)
+        timed_out = False
+    except subprocess.TimeoutExpired:
+        _kill_session(p.pid)
+        p.wait()
+        returncode, timed_out = None, True
+    if pump is not None:
+        pump.join()
+    return returncode, timed_out
+
+
+def run_callable(job, out, timeout, pool):
+    """Run a callable job in ``pool``; return ``(returncode, timed_out)``.
+
+    Blocking; the asyncio engine calls it from a thread.
+    """
+    spec = json.loads(job["payload"])
+    if not out.piped:
+        rc, timed_out = pool.call(spec["callable"], spec.get("args"), out.path, timeout)
+    else:
+        # compressed logs go through the worker: let the child write plain
+        # text beside the log, then feed it through
+        part = out.path + ".part"
         try:
-            logs_dir = _logs_dir()
-            logfile = os.path.join(logs_dir, f"{job_id}.log")
-            p = subprocess.run(cmd, shell=True, capture_output=True, text=True, timeout=timeout)
-            output = (p.stdout or "") + (p.stderr or "")
-            # write to logfile
-            with open(logfile, "w") as f:
-                f.write(output)
-            if p.returncode == 0:
-                db.complete_job(job_id, output)
-            else:
-                db.fail_job(job_id, attempts, max_retries, base_backoff, output)
-        except subprocess.TimeoutExpired as e:
-            msg = f"Job timed out after {timeout}s\n"
-            # Try to capture partial output if any
-            out = (getattr(e, 'output', '') or '') + (getattr(e, 'stderr', '') or '')
-            full = msg + out
-            if logfile:
-                with open(logfile, "w") as f:
-                    f.write(full)
-            db.fail_job(job_id, attempts, max_retries, base_backoff, full)
-        except FileNotFoundError as e:
-            db.fail_job(job_id, attempts, max_retries, base_backoff, str(e))
-        except Exception as e:
-            db.fail_job(job_id, attempts, max_retries, base_backoff, str(e))
-
-
-def _run_worker_process(worker_id: int, base_backoff: int):
+            rc, timed_out = pool.call(spec["callable"], spec.get("args"), part, timeout)
+            if os.path.exists(part):
+                with open(part, "rb") as f:
+                    for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+                        out.feed(chunk)
+        finally:
+            if os.path.exists(part):
+                os.remove(part)
+    if rc == callpool.DIED:
+        out.note("Callable worker process exited unexpectedly\n")
+    return rc, timed_out
+
+
+def cache_result(store, key: str, output: str):
+    """Cache a successful output; a failure to cache never fails the job."""
+    try:
+        store.cache_result(key, output)
+    except Exception as e:
+        print("could not cache result:", e, flush=True)
+
+
+def run_job(job, base_backoff: int, recorder=None, writeback=None, store=db):
+    """Execute one claimed job and record the outcome.
+
+    Output is streamed to the job's log file as it is produced; only the
+    bounded tail ends up in ``jobs.output``. Execution and write-back times
+    go to ``recorder`` when one is given. With ``writeback`` the outcome is
+    buffered for a group commit instead of committed here, otherwise it
+    goes to ``store``. A ``cache_ttl`` job with a fresh cached result is
+    completed with it without running. Outcomes carry the claiming worker,
+    so one whose lease was reaped in the meantime is dropped as stale.
+    """
+    results = writeback or store
+    job_id = job["id"]
+    worker = job.get("locked_by")
+    if job.get("cache_key"):
+        cached = store.cached_result(job["cache_key"], job["cache_ttl"])
+        if cached is not None:
+            results.complete_job(job_id, cached, worker)
+            return
+    attempts, max_retries, timeout = _job_limits(job)
+    tail_bytes, compress = output_mod.settings()
+    out = None
+    try:
+        out = output_mod.JobOutput(job_id, tail_bytes, compress)
+        started = time.perf_counter()
+        if job.get("kind") == "callable":
+            returncode, timed_out = run_callable(job, out, timeout, callpool.get_pool())
+        else:
+            returncode, timed_out = _run_process(job, out, timeout)
+        if timed_out:
+            out.note(f"Job timed out after {timeout}s\n")
+        out.close()
+        output = out.tail()
+        written = time.perf_counter()
+        if recorder is not None:
+            recorder.observe("execute", written - started)
+        if not timed_out and returncode == 0:
+            if job.get("cache_key"):
+                cache_result(store, job["cache_key"], output)
+            results.complete_job(job_id, output, worker)
+        else:
+            results.fail_job(job_id, attempts, max_retries, base_backoff, output, worker)
+        if recorder is not None:
+            recorder.observe("writeback", time.perf_counter() - written)
+    except Exception as e:
+        if out is not None:
+            out.close()
+        results.fail_job(job_id, attempts, max_retries, base_backoff, str(e), worker)
+
+
+def _run_worker_process(worker_id: int, base_backoff: int, prefetch: int = 1, wakeup=None,
+                        concurrency: int = 1, tags=None, queues=None, writeback=None,
+                        broker: Optional[str] = None, slot: Optional[Slot] = None):
     name = f"worker-{os.getpid()}-{worker_id}"
+    store = db
+    if broker:
+        # everything, config included, comes from the broker
+        store = broker_mod.BrokerClient(broker).attach()
+        wakeup = broker_mod.Wakeup(store) if concurrency == 1 else None
+    # writeback: (interval_ms, batch) to group-commit results
+    wb = writeback_mod.WriteBack(*writeback, store=store) if writeback else None
+    heartbeat = lease.Heartbeat(name, [q for q, _ in queues or [(db.DEFAULT_QUEUE, 1)]], store)
     try:
-        worker_loop(name, base_backoff)
+        if concurrency > 1:
+            from . import aioworker
+            aioworker.run(name, base_backoff, concurrency, wakeup, tags, queues, slot, wb, store)
+        else:
+            worker_loop(name, base_backoff, prefetch, wakeup, tags, queues, slot, wb, store)
     except KeyboardInterrupt:
         # Graceful
         return
+    finally:
+        if wb is not None:
+            wb.close()
+        # keep leases alive until buffered results are written
+        heartbeat.stop()
+        callpool.shutdown()
+        if store is not db:
+            store.close()
+
+
+class _Worker:
+    """Supervisor-side handle on one worker process."""
+
+    def __init__(self, worker_id: int, args):
+        self.id = worker_id
+        self.slot = Slot()
+        self.proc = mp.Process(target=_run_worker_process,
+                               args=(worker_id,) + args + (self.slot,))
+        self.proc.start()
+        self.started = time.monotonic()
 
+    def drain(self):
+        self.slot.stop.set()
 
-def start_workers(count: int, base_backoff: int):
-    procs = []
 
-    for i in range(count):
-        p = mp.Process(target=_run_worker_process, args=(i, base_backoff))
-        p.start()
-        procs.append(p)
+def start_workers(count: int, base_backoff: int, prefetch: int = 1, concurrency: int = 1, tags=None,
+                  queues=None, min_count: Optional[int] = None, max_count: Optional[int] = None,
+                  writeback: Optional[Tuple[int, int]] = None, broker: Optional[str] = None):
+    """Run ``count`` worker processes until SIGTERM/SIGINT.
+
+    A worker that exits without being asked to is replaced. Given
+    ``max_count`` the pool is resized between ``min_count`` (default 1) and
+    ``max_count`` by :class:`autoscale.Autoscaler`; workers retired on the
+    way down drain instead of being killed. ``writeback`` is
+    ``(interval_ms, batch)`` to group-commit each worker's results.
+
+    With ``broker`` (an address for :class:`broker.BrokerClient`) there is
+    no local database: workers claim and report through the broker, which
+    also does the scheduling, lease reaping and GC this loop would.
+    """
+    store = db
+    if broker:
+        store = broker_mod.BrokerClient(broker).attach()
+    else:
+        for name, _ in queues or []:
+            with db.use_queue(name):
+                db.init_db()
+    # TERMINATE is shared with whoever imported this module first; a pool
+    # started after an earlier one stopped must not inherit its shutdown
+    TERMINATE.clear()
+    # children must not inherit an open SQLite handle
+    db.close_conn()
+    # remote workers long-poll the broker instead
+    wakeup = notify.open_channel() if not broker else None
+    args = (base_backoff, prefetch, wakeup, concurrency, tags, queues, writeback, broker)
+    queue_list = [name for name, _ in queues or [(db.DEFAULT_QUEUE, 1)]]
+
+    scaler = None
+    if max_count is not None:
+        scaler = autoscale.Autoscaler(min_count or 1, max_count)
+        count = scaler.clamp(count)
+    next_id = 0
+
+    def spawn():
+        nonlocal next_id
+        w = _Worker(next_id, args)
+        next_id += 1
+        return w
+
+    active = [spawn() for _ in range(count)]
+    retiring = []
 
     def _signal_handler(sig, frame):
         TERMINATE.set()
@@ -92,11 +469,74 @@ def start_workers(count: int, base_backoff: int):
     signal.signal(signal.SIGTERM, _signal_handler)
     signal.signal(signal.SIGINT, _signal_handler)
 
-    # Wait for children to exit
+    gc = scheduler = reaper = None
+    if not broker:
+        gc = retention.BackgroundGC()
+        scheduler = scheduler_mod.Scheduler(queue_list)
+        reaper = lease.Reaper(queue_list)
+    sampled = time.monotonic()
+
+    # Supervise until told to stop: promote due jobs, replace dead workers,
+    # resize, housekeeping
     try:
-        while any(p.is_alive() for p in procs):
-            time.sleep(0.5)
+        while not TERMINATE.is_set():
+            time.sleep(scheduler.wait(0.5) if scheduler is not None else 0.5)
+            if TERMINATE.is_set():
+                break
+            if scheduler is not None:
+                try:
+                    scheduler.tick()
+                except Exception as e:
+                    print("scheduler failed:", e, flush=True)
+                try:
+                    reaper.tick()
+                except Exception as e:
+                    print("lease reaper failed:", e, flush=True)
+            now = time.monotonic()
+            for i, w in enumerate(active):
+                if w.proc.is_alive() or now - w.started < RESTART_MIN_UPTIME:
+                    continue
+                w.proc.join()
+                print(f"worker {w.proc.pid} exited with code {w.proc.exitcode}; starting a replacement",
+                      flush=True)
+                active[i] = spawn()
+            retiring = [w for w in retiring if w.proc.is_alive()]
+            if scaler is not None and now - sampled >= scaler.INTERVAL:
+                sampled = now
+                active = _autoscale(scaler, active, retiring, spawn, queue_list, store)
+            if gc is not None:
+                gc.tick()
     finally:
         TERMINATE.set()
-        for p in procs:
-            p.join(timeout=5)
+        # wake idle workers so they notice shutdown promptly
+        notify.poke()
+        for w in active + retiring:
+            w.proc.join(timeout=5)
+        if wakeup is not None:
+            wakeup.close()
+
+
+def _autoscale(scaler, active, retiring, spawn, queues, store=db):
+    """One autoscaler step; return the new list of active workers."""
+    hit_rate, busy, cpu = scaler.sample([(w.id, w.slot.load, w.proc.pid) for w in active])
+    try:
+        depth = autoscale.ready_depth(queues, store)
+    except Exception as e:
+        print("autoscale: cannot read queue depth:", e, flush=True)
+        return active
+    target = scaler.decide(len(active), depth, hit_rate, busy, cpu)
+    if target == len(active):
+        return active
+    print(f"autoscale: {len(active)} -> {target} workers (ready={depth}, busy={busy:.2f}, "
+          f"claim hit rate={'-' if hit_rate is None else f'{hit_rate:.2f}'}, "
+          f"cpu={'-' if cpu is None else f'{cpu:.2f}'})", flush=True)
+    if target > len(active):
+        return active + [spawn() for _ in range(target - len(active))]
+    # retire the newest first; each finishes its current job before exiting
+    keep, leaving = active[:target], active[target:]
+    for w in leaving:
+        w.drain()
+    retiring.extend(leaving)
+    # idle workers notice their stop event on the next poll
+    notify.poke()
+    return keep
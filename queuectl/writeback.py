@@ -0,0 +1,119 @@
+"""Group-committed job results (``worker start --writeback-ms``).
+
+By default a worker commits each job's outcome on its own, and with
+``synchronous=FULL`` every commit is an fsync. A :class:`WriteBack` instead
+buffers outcomes and a background thread commits them with
+:func:`db.write_results`: one transaction per queue every ``interval_ms``
+milliseconds, or sooner once ``batch`` results are waiting. Buffered
+results are flushed when the worker exits.
+
+Jobs stay ``processing``, with their leases renewed, until their result
+is committed. If the worker dies first, the buffered results are lost and
+the jobs are requeued when their leases expire, exactly as if the worker
+had died while running them; a job is never marked completed without
+having run.
+"""
+import threading
+import time
+from typing import Optional
+
+from . import db
+
+DEFAULT_BATCH = 100
+
+# attempts at the final flush before giving up on a failing database
+CLOSE_RETRIES = 5
+
+
+class WriteBack:
+    """Buffers outcomes; :meth:`complete_job`/:meth:`fail_job` mirror ``db``."""
+
+    def __init__(self, interval_ms: int, batch: int = DEFAULT_BATCH, store=db):
+        self.store = store
+        self.interval = max(1, interval_ms) / 1000.0
+        self.batch = max(1, batch)
+        self.pending = {}
+        self.count = 0
+        self.oldest = None
+        self.closed = False
+        self.cond = threading.Condition()
+        # commits made, for benchmarks
+        self.commits = 0
+        self.thread = threading.Thread(target=self._run, name="queuectl-writeback", daemon=True)
+        self.thread.start()
+
+    def complete_job(self, job_id: str, output: Optional[str], worker: Optional[str] = None,
+                     queue: Optional[str] = None):
+        self._add(queue, ("complete", job_id, output, worker))
+
+    def fail_job(self, job_id: str, attempts: int, max_retries: Optional[int], base: int,
+                 output: Optional[str], worker: Optional[str] = None, queue: Optional[str] = None):
+        self._add(queue, ("fail", job_id, attempts, max_retries, base, output, worker))
+
+    def _add(self, queue, result):
+        queue = queue or db.current_queue()
+        with self.cond:
+            first = self.oldest is None
+            self._put(queue, [result])
+            # the first result starts the flusher's timer
+            if first or self.count >= self.batch:
+                self.cond.notify()
+
+    def _put(self, queue, results, front: bool = False):
+        # caller holds self.cond
+        cur = self.pending.setdefault(queue, [])
+        if front:
+            cur[:0] = results
+        else:
+            cur.extend(results)
+        self.count += len(results)
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+
+    def flush(self) -> bool:
+        """Commit everything buffered; False if some of it must be retried."""
+        with self.cond:
+            pending, self.pending = self.pending, {}
+            self.count, self.oldest = 0, None
+        ok = True
+        for queue, results in pending.items():
+            try:
+                with db.use_queue(queue):
+                    self.store.write_results(results)
+                self.commits += 1
+            except Exception as e:
+                print(f"write-back of {len(results)} results failed: {e}", flush=True)
+                ok = False
+                with self.cond:
+                    self._put(queue, results, front=True)
+        return ok
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.closed and self.count < self.batch:
+                    if self.oldest is None:
+                        self.cond.wait()
+                        continue
+                    remaining = self.oldest + self.interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                if self.closed:
+                    # close() does the last flush
+                    return
+            if not self.flush():
+                time.sleep(self.interval)
+
+    def close(self):
+        """Stop the flusher thread and commit whatever is left."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+        for _ in range(CLOSE_RETRIES):
+            if self.flush():
+                return
+            time.sleep(self.interval)
+        if self.count:
+            print(f"write-back: gave up on {self.count} results; their jobs will be requeued", flush=True)
@@ -0,0 +1,39 @@
+import os
+import time
+import multiprocessing as mp
+from queuectl import db
+from queuectl import aioworker
+
+
+def run_async_worker():
+    aioworker.run('aio-test', 2, 4)
+
+
+def test_async_engine_runs_jobs_concurrently(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        db.set_config('job-timeout', '1')
+        for i in range(4):
+            db.insert_job({'id': f'c{i}', 'command': f'sleep 0.5; echo c{i}'})
+        db.insert_job({'id': 'tmo', 'command': 'echo partial; sleep 5', 'max_retries': 1})
+        p = mp.Process(target=run_async_worker)
+        p.start()
+        # four half-second jobs need ~2s serially; give the pool well under that
+        deadline = time.time() + 1.4
+        while time.time() < deadline and db.job_counts()['completed'] < 4:
+            time.sleep(0.05)
+        assert db.job_counts()['completed'] == 4
+        assert db.get_job('c2')['output'] == 'c2\n'
+        time.sleep(1.0)
+        p.terminate()
+        p.join(timeout=1)
+        j = db.get_job('tmo')
+        assert j['state'] == 'dead'
+        assert 'timed out' in j['output'] and 'partial' in j['output']
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
@@ -0,0 +1,124 @@
+import os
+import signal
+import time
+import multiprocessing as mp
+from queuectl import autoscale
+from queuectl import db
+from queuectl import worker as worker_mod
+
+
+def test_autoscaler_hysteresis():
+    s = autoscale.Autoscaler(2, 8, ncpu=16)
+    # one busy sample is not enough; the second doubles, capped by the backlog
+    assert s.decide(2, 100, 1.0, 0.95, 0.2, now=0) == 2
+    assert s.decide(2, 100, 1.0, 0.95, 0.2, now=2) == 4
+    # cooldown after a change
+    assert s.decide(4, 100, 1.0, 0.95, 0.2, now=3) == 4
+    assert s.decide(4, 100, 1.0, 0.95, 0.2, now=6) == 8
+    assert s.decide(8, 100, 1.0, 0.95, 0.2, now=20) == 8  # at max
+    # a saturated host or an empty backlog holds the pool steady
+    s = autoscale.Autoscaler(1, 8, ncpu=4)
+    for t in range(5):
+        assert s.decide(2, 100, 1.0, 0.95, 0.95, now=t) == 2
+        assert s.decide(2, 0, 1.0, 0.95, 0.2, now=t) == 2
+    # idle and finding nothing: shrink only after a sustained lull
+    s = autoscale.Autoscaler(2, 8)
+    for t in range(4):
+        assert s.decide(8, 0, 0.1, 0.05, 0.0, now=100 + t) == 8
+    # a busy sample in between resets the streak
+    assert s.decide(8, 0, 0.1, 0.5, 0.0, now=104) == 8
+    for t in range(4):
+        assert s.decide(8, 0, 0.1, 0.05, 0.0, now=105 + t) == 8
+    assert s.decide(8, 0, 0.1, 0.05, 0.0, now=109) == 6
+    # no claims and not busy: idle workers backing off count as idle
+    for t in range(4):
+        assert s.decide(6, 0, None, 0.0, 0.0, now=200 + t) == 6
+    assert s.decide(6, 0, None, 0.0, 0.0, now=204) == 5
+    # never below min
+    for t in range(20):
+        assert s.decide(2, 0, 0.0, 0.0, 0.0, now=300 + t * 40) == 2
+
+
+def test_autoscaler_sample():
+    s = autoscale.Autoscaler(1, 4)
+    a, b = [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]
+    assert s.sample([(0, a, -1), (1, b, -1)], now=0) == (None, 0.0, None)
+    a[:] = [10, 9, 1.5]
+    b[:] = [10, 1, 0.5]
+    hit_rate, busy, cpu = s.sample([(0, a, -1), (1, b, -1)], now=2)
+    assert (hit_rate, busy, cpu) == (0.5, 0.5, None)
+
+
+def _loop(slot):
+    worker_mod.worker_loop('w', 2, slot=slot)
+
+
+def test_drain_finishes_current_job(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        now = db.now_ms()
+        db.insert_job({'id': 'slow', 'command': 'sleep 1', 'created_at': now - 1000})
+        db.insert_job({'id': 'next', 'command': 'true', 'created_at': now})
+        db.close_conn()
+        slot = worker_mod.Slot()
+        p = mp.Process(target=_loop, args=(slot,))
+        p.start()
+        deadline = time.time() + 10
+        while db.get_job('slow')['state'] != 'processing' and time.time() < deadline:
+            time.sleep(0.05)
+        slot.stop.set()
+        p.join(timeout=10)
+        assert p.exitcode == 0
+        assert db.get_job('slow')['state'] == 'completed'
+        assert db.get_job('next')['state'] == 'pending'
+        assert slot.load[0] >= 1 and slot.load[1] >= 1 and slot.load[2] >= 0.9
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def _wait_done(job_id):
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        job = db.get_job(job_id)
+        if job['state'] == 'completed':
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'{job_id} not completed')
+
+
+def test_dead_worker_is_replaced(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    old_uptime = worker_mod.RESTART_MIN_UPTIME
+    worker_mod.RESTART_MIN_UPTIME = 0
+    sup = None
+    try:
+        db.init_db()
+        db.insert_job({'id': 'a', 'command': 'echo $PPID'})
+        db.close_conn()
+        sup = mp.Process(target=worker_mod.start_workers, args=(1, 2))
+        sup.start()
+        first = int(_wait_done('a')['output'])
+        os.kill(first, signal.SIGKILL)
+        time.sleep(0.2)
+        db.insert_job({'id': 'b', 'command': 'echo $PPID'})
+        second = int(_wait_done('b')['output'])
+        assert second != first
+    finally:
+        worker_mod.RESTART_MIN_UPTIME = old_uptime
+        if sup is not None:
+            os.kill(sup.pid, signal.SIGTERM)
+            sup.join(timeout=10)
+            # the supervisor sets the shared shutdown event on its way out
+            worker_mod.TERMINATE.clear()
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
@@ -0,0 +1,179 @@
+import os
+import signal
+import threading
+import time
+import multiprocessing as mp
+from queuectl import broker
+from queuectl import db
+from queuectl import worker as worker_mod
+
+
+def _start(token=None):
+    server = broker.make_server('127.0.0.1:0', token)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f'{host}:{port}'
+
+
+def test_client_ops_and_pipelining(tmp_path, capsys):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    server = None
+    try:
+        db.init_db()
+        db.set_config('lease-seconds', '10')
+        server, address = _start()
+        client = broker.BrokerClient(address)
+        assert client.insert_jobs([{'id': f'j{i}', 'command': 'true'} for i in range(4)]) == []
+        with db.use_queue('emails'):
+            assert client.insert_jobs([{'id': 'e0', 'command': 'true'}]) == []
+            assert [j['id'] for j in client.fetch_and_lock_jobs('w', 5)] == ['e0']
+        assert client.config_snapshot()['lease-seconds'] == '10'
+
+        jobs = client.fetch_and_lock_jobs('w', 3)
+        assert [j['id'] for j in jobs] == ['j0', 'j1', 'j2']
+        # posted: no round trip until the next call
+        client.complete_job('j0', 'ok')
+        client.fail_job('j1', 1, 1, 2, 'boom')
+        assert client.renew_leases('w') == 1
+        assert db.get_job('j0')['state'] == 'completed'
+        assert db.get_job('j1')['state'] == 'dead'
+        client.release_jobs('w', ['j2'])
+        assert db.get_job('j2')['state'] == 'pending'
+        assert client.write_results([('complete', j['id'], '') for j in client.fetch_and_lock_jobs('w', 2)]) == 2
+        assert client.job_counts()['completed'] == 3
+
+        # a failed posted request is reported with the next call, which still gets its reply
+        client.post('fail', job='j2')
+        assert client.job_counts()['completed'] == 3
+        assert 'posted request failed' in capsys.readouterr().out
+        assert client.pipeline([{'op': 'counts'}, {'op': 'counts', 'queue': 'emails'}])[1]['processing'] == 1
+        try:
+            client.pipeline([{'op': 'nope'}, {'op': 'counts'}])
+            assert False, 'expected BrokerError'
+        except broker.BrokerError:
+            pass
+        # the pipeline's replies were all read
+        assert client.job_counts()['completed'] == 3
+
+        # a worker in the long poll is woken by an enqueue
+        woken = []
+        waiter = threading.Thread(target=lambda: woken.append(broker.Wakeup(client).wait(5)))
+        waiter.start()
+        time.sleep(0.2)
+        broker.BrokerClient(address).insert_jobs([{'id': 'late', 'command': 'true'}])
+        waiter.join()
+        assert woken == [True]
+        client.close()
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_rejected_post_does_not_lose_a_claim(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    server = None
+    try:
+        db.init_db()
+        db.insert_jobs([{'id': 'j1', 'command': 'true'}])
+        server, address = _start()
+        client = broker.BrokerClient(address)
+        client.post('results', results=[['bogus']])
+        assert [j['id'] for j in client.fetch_and_lock_jobs('w1', 5)] == ['j1']
+        client.complete_job('j1', '')
+        assert client.job_counts()['completed'] == 1
+        client.close()
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_token_is_checked(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    old_token = os.environ.pop('QUEUECTL_BROKER_TOKEN', None)
+    server = None
+    try:
+        db.init_db()
+        server, address = _start('s3cret')
+        try:
+            broker.BrokerClient(address, token='wrong').job_counts()
+            assert False, 'expected BrokerError'
+        except broker.BrokerError as e:
+            assert 'bad token' in str(e)
+        assert broker.BrokerClient(address, token='s3cret').job_counts()['pending'] == 0
+        assert broker.parse_address('unix:/tmp/b.sock')[1] == '/tmp/b.sock'
+        assert broker.parse_address(':9000')[1] == ('127.0.0.1', 9000)
+    finally:
+        if old_token is not None:
+            os.environ['QUEUECTL_BROKER_TOKEN'] = old_token
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def _remote_worker(home, address):
+    # a host without the database
+    os.environ['HOME'] = home
+    worker_mod._run_worker_process(0, 2, prefetch=2, writeback=(20, 10), broker=address)
+
+
+def test_remote_worker_runs_jobs_through_broker(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path / 'broker')
+    stop = threading.Event()
+    serving = None
+    p = None
+    try:
+        address = 'unix:' + str(tmp_path / 'broker.sock')
+        serving = threading.Thread(target=broker.serve, args=(address, stop), daemon=True)
+        serving.start()
+        db.init_db()
+        db.set_config('job-timeout', '1')
+        db.insert_jobs([{'id': 'ok', 'command': 'echo hi'},
+                        {'id': 'slow', 'command': 'sleep 5', 'max_retries': 1}])
+        deadline = time.time() + 5
+        while not os.path.exists(address[5:]) and time.time() < deadline:
+            time.sleep(0.02)
+        remote = tmp_path / 'remote'
+        remote.mkdir()
+        p = mp.Process(target=_remote_worker, args=(str(remote), address))
+        p.start()
+        deadline = time.time() + 15
+        while time.time() < deadline and db.job_counts()['completed'] + db.job_counts()['dead'] < 2:
+            time.sleep(0.05)
+        assert db.get_job('ok')['state'] == 'completed'
+        assert db.get_job('ok')['output'] == 'hi\n'
+        # the broker's job-timeout applied on the remote host
+        assert db.get_job('slow')['state'] == 'dead'
+        assert not os.path.exists(remote / '.queuectl' / 'queue.db')
+    finally:
+        if p is not None:
+            os.kill(p.pid, signal.SIGINT)
+            p.join(timeout=10)
+        stop.set()
+        if serving is not None:
+            serving.join(timeout=10)
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
@@ -0,0 +1,27 @@
+import os
+from queuectl import cli
+from queuectl import db
+
+
+def test_bulk_enqueue_reports_bad_lines(tmp_path, capsys):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        path = tmp_path / 'jobs.jsonl'
+        lines = [f'{{"id": "b{i}", "command": "true"}}' for i in range(5)]
+        lines += ['{oops', '{"id": "b1", "command": "dup"}', '', '{"id": "b9", "command": "true"}']
+        path.write_text('\n'.join(lines) + '\n')
+        rc = cli.main(['enqueue', '--file', str(path), '--batch-size', '2'])
+        assert rc == 1
+        out, err = capsys.readouterr()
+        assert 'line 6: Invalid JSON' in err
+        assert 'line 7: Job b1 already exists' in err
+        assert 'Enqueued 6 jobs, 2 errors' in out
+        assert db.job_counts()['pending'] == 6
+        assert db.get_job('b1')['command'] == 'true'
+        assert db.get_job('b9') is not None
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
@@ -0,0 +1,58 @@
+import os
+from queuectl import db
+
+
+def test_claim_uses_ready_index(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        now = '2025-11-08T00:00:00Z'
+        db.insert_job({'id': 'done', 'command': 'true', 'state': 'completed', 'priority': 99})
+        db.insert_job({'id': 'later', 'command': 'true', 'next_run_at': '2999-01-01T00:00:00Z', 'priority': 50})
+        db.insert_job({'id': 'ready', 'command': 'true'})
+        conn = db.get_conn()
+        plan = conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT id FROM jobs WHERE {db._READY_WHERE} {db._READY_ORDER} LIMIT 1"
+        ).fetchall()
+        assert any('idx_jobs_ready' in r[3] for r in plan)
+        assert db.get_job('later')['state'] == 'scheduled'
+        picked = db.fetch_and_lock_job('w', now)
+        assert picked and picked['id'] == 'ready'
+        assert picked['state'] == 'processing' and picked['locked_by'] == 'w'
+        assert db.fetch_and_lock_job('w', now) is None
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_tagged_claim_walks_tag_index(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        db.insert_jobs([{'id': f'j{i}', 'command': 'true', 'tags': 'gpu,big' if i % 2 else 'gpu',
+                         'priority': i % 3, 'created_at': i + 1} for i in range(50)])
+        conn = db.get_conn()
+
+        def plan(tags):
+            sql, params = db._candidates_sql(tags, 2)
+            return [r[3] for r in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        # one tag: index order, nothing sorted
+        single = plan(['gpu'])
+        assert any('idx_job_tags_ready' in d for d in single)
+        assert not any('TEMP B-TREE' in d for d in single)
+        # several: each tag walks the index; only the per-tag heads are merged
+        several = plan(['gpu', 'big'])
+        assert sum('idx_job_tags_ready' in d for d in several) == 2
+        assert not any('GROUP BY' in d for d in several)
+        got = db.fetch_and_lock_jobs('w', 3, tags=['gpu', 'big', 'gpu'])
+        assert [j['id'] for j in got] == ['j2', 'j5', 'j8']
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
@@ -0,0 +1,40 @@
+import os
+import threading
+from queuectl import db
+
+
+def test_config_cache_tracks_version(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        assert db.get_config('job-timeout') == '10'
+        statements = []
+        db.get_conn().set_trace_callback(statements.append)
+        for _ in range(5):
+            assert db.get_config('job-timeout') == '10'
+        # unchanged config: only the data_version probe runs
+        assert not any('config' in s.lower() for s in statements)
+
+        # a write from another connection is picked up on the next read
+        t = threading.Thread(target=db.set_config, args=('job-timeout', '3'))
+        t.start()
+        t.join()
+        assert db.get_config('job-timeout') == '3'
+
+        # job-table writes elsewhere do not reload the config table
+        t = threading.Thread(target=db.insert_job, args=({'id': 'x', 'command': 'true'},))
+        t.start()
+        t.join()
+        del statements[:]
+        assert db.get_config('job-timeout') == '3'
+        assert not any('from config' in s.lower() for s in statements)
+
+        db.set_config('backoff-base', '5')
+        assert db.get_config('backoff-base') == '5'
+    finally:
+        db.get_conn().set_trace_callback(None)
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
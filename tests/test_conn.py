@@ -0,0 +1,36 @@
+import os
+import threading
+import multiprocessing as mp
+from queuectl import db
+
+
+def _child_insert(q):
+    # runs in a forked child that inherited the parent's cached connection
+    db.insert_job({'id': 'child', 'command': 'true'})
+    q.put(db.get_job('child') is not None)
+
+
+def test_connection_reuse_and_fork(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        conn = db.get_conn()
+        assert db.get_conn() is conn
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 30000
+        other = []
+        t = threading.Thread(target=lambda: other.append(db.get_conn()))
+        t.start()
+        t.join()
+        assert other[0] is not conn
+        q = mp.Queue()
+        p = mp.Process(target=_child_insert, args=(q,))
+        p.start()
+        assert q.get(timeout=10) is True
+        p.join(timeout=5)
+        assert db.get_job('child') is not None
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
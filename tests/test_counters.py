@@ -0,0 +1,55 @@
+import os
+from queuectl import db
+from queuectl import metrics
+
+
+def test_counters_follow_transitions(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        now = '2025-11-08T00:00:00Z'
+        for i in range(3):
+            db.insert_job({'id': f'j{i}', 'command': 'true', 'max_retries': 1})
+        a, b = db.fetch_and_lock_jobs('w', 2, now)
+        db.complete_job(a['id'], 'ok')
+        db.fail_job(b['id'], 1, 1, 2, 'boom')
+        counts = db.job_counts()
+        assert counts == {'blocked': 0, 'scheduled': 0, 'pending': 1, 'processing': 0, 'completed': 1, 'failed': 0,
+                          'dead': 1}
+        conn = db.get_conn()
+        for state, n in counts.items():
+            assert conn.execute('SELECT COUNT(1) FROM jobs WHERE state=?', (state,)).fetchone()[0] == n
+        assert db.job_totals() == {'enqueued': 3, 'completed': 1, 'failed': 1, 'dead': 1, 'stale': 0}
+
+        text = metrics.prometheus_text()
+        assert 'queuectl_jobs{state="pending"} 1' in text
+        assert 'queuectl_jobs_dead_total 1' in text
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_counters_backfilled_on_existing_db(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        conn = db.get_conn()
+        # simulate a database from before counters existed
+        for name in ('insert', 'update', 'delete'):
+            conn.execute(f'DROP TRIGGER trg_jobs_count_{name}')
+        conn.execute('DELETE FROM job_counts')
+        conn.execute('PRAGMA user_version=0')
+        db.insert_job({'id': 'a', 'command': 'true'})
+        db.insert_job({'id': 'b', 'command': 'true', 'state': 'dead'})
+        db.init_db()
+        assert db.job_counts()['pending'] == 1
+        assert db.job_counts()['dead'] == 1
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
@@ -27,3 +27,33 @@ def test_db_init_and_insert(tmp_path):
             del os.environ['HOME']
         else:
             os.environ['HOME'] = old_home
+
+
+def test_migrations_run_once(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    old_migrations = db._MIGRATIONS
+    try:
+        conn = db.init_db()
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == len(db._MIGRATIONS)
+        statements = []
+        conn.set_trace_callback(statements.append)
+        db.init_db()
+        conn.set_trace_callback(None)
+        assert statements == ['PRAGMA user_version']
+
+        # a later release appends a step; it runs on the next init only
+        runs = []
+        db._MIGRATIONS = old_migrations + [lambda c: runs.append(c.execute('SELECT COUNT(1) FROM jobs').fetchone()[0])]
+        db.insert_job({'id': 'a', 'command': 'true'})
+        db.init_db()
+        db.init_db()
+        assert runs == [1]
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == len(old_migrations) + 1
+    finally:
+        db._MIGRATIONS = old_migrations
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
@@ -0,0 +1,121 @@
+import os
+from queuectl import db
+
+
+def _states(*ids):
+    return [db.get_job(i)['state'] for i in ids]
+
+
+def test_dependents_unblock_when_last_dependency_completes(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        errors = db.insert_jobs([
+            {'id': 'a', 'command': 'true'},
+            {'id': 'b', 'command': 'true', 'created_at': 1},
+            {'id': 'c', 'command': 'true', 'depends_on': ['a', 'b'], 'tags': 'etl'},
+            {'id': 'later', 'command': 'true', 'depends_on': 'c', 'run_at': '2999-01-01T00:00:00Z'},
+            {'id': 'oops', 'command': 'true', 'depends_on': ['missing']},
+        ])
+        assert errors == [(4, 'Unknown dependency: missing')]
+        assert _states('c', 'later') == ['blocked', 'blocked']
+        assert db.get_job('c')['pending_deps'] == 2
+        assert db.job_counts()['blocked'] == 2
+        # blocked jobs are never claimed, with or without tags
+        assert [j['id'] for j in db.fetch_and_lock_jobs('w', 10)] == ['b', 'a']
+        assert db.fetch_and_lock_jobs('w', 10, tags=['etl']) == []
+
+        db.complete_job('a', '')
+        assert (db.get_job('c')['state'], db.get_job('c')['pending_deps']) == ('blocked', 1)
+        # a second completion of the same job settles nothing twice
+        db.complete_job('a', '')
+        assert db.get_job('c')['pending_deps'] == 1
+        db.write_results([('complete', 'b', '')])
+        assert db.get_job('c')['state'] == 'pending'
+        assert [j['id'] for j in db.fetch_and_lock_jobs('w', 10, tags=['etl'])] == ['c']
+        db.complete_job('c', '')
+        # still waiting for its run_at
+        assert db.get_job('later')['state'] == 'scheduled'
+        assert db.job_counts()['blocked'] == 0
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_dead_dependency_cascades_by_policy(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        db.insert_jobs([
+            {'id': 'a', 'command': 'false', 'max_retries': 1},
+            {'id': 'b', 'command': 'true', 'depends_on': ['a']},
+            {'id': 'c', 'command': 'true', 'depends_on': ['b']},
+            {'id': 'cleanup', 'command': 'true', 'depends_on': ['a'], 'on_dep_failure': 'run'},
+            {'id': 'after', 'command': 'true', 'depends_on': ['cleanup']},
+        ])
+        db.fetch_and_lock_jobs('w', 1)
+        db.fail_job('a', 1, 1, 2, 'boom')
+        assert _states('a', 'b', 'c', 'cleanup', 'after') == ['dead', 'dead', 'dead', 'pending', 'blocked']
+        assert db.get_job('c')['output'] == 'Dependency b failed'
+        try:
+            db.insert_job({'id': 'd', 'command': 'true', 'depends_on': ['a']})
+            assert False, 'expected ValueError'
+        except ValueError as e:
+            assert 'dead' in str(e)
+        db.insert_job({'id': 'd', 'command': 'true', 'depends_on': ['a'], 'on_dep_failure': 'run'})
+        assert db.get_job('d')['state'] == 'pending'
+
+        # retried from the DLQ, c waits for b again; b for a
+        db.move_dlq_to_pending('c')
+        db.move_dlq_to_pending('b')
+        assert _states('b', 'c') == ['blocked', 'blocked']
+        db.move_dlq_to_pending('a')
+        db.complete_job('a', '')
+        assert _states('b', 'c') == ['pending', 'blocked']
+        db.complete_job('b', '')
+        assert db.get_job('c')['state'] == 'pending'
+
+        # a lost worker's job running out of retries cascades too
+        db.insert_jobs([{'id': 'x', 'command': 'true', 'max_retries': 1},
+                        {'id': 'y', 'command': 'true', 'depends_on': ['x']}])
+        db.fetch_and_lock_jobs('gone', 10)
+        db.reap_expired(db.now_ms() + 10 ** 9)
+        assert _states('x', 'y') == ['dead', 'dead']
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_dag_listing_follows_edges_both_ways(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        db.insert_jobs([
+            {'id': 'root', 'command': 'true', 'created_at': 1},
+            {'id': 'mid', 'command': 'true', 'depends_on': ['root'], 'created_at': 2},
+            {'id': 'leaf', 'command': 'true', 'depends_on': ['mid'], 'created_at': 3},
+            {'id': 'other', 'command': 'true', 'created_at': 4},
+        ])
+        assert [j['id'] for j in db.dag_jobs('mid', ['id'])] == ['root', 'mid', 'leaf']
+        assert db.dag_jobs('leaf', ['id', 'pending_deps'])[2] == {'id': 'leaf', 'pending_deps': 1}
+        assert [j['id'] for j in db.dag_jobs('other', ['id'])] == ['other']
+        try:
+            db.dag_jobs('nope')
+            assert False, 'expected ValueError'
+        except ValueError:
+            pass
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
@@ -0,0 +1,110 @@
+import os
+from queuectl import db
+from queuectl import worker as worker_mod
+
+
+def test_idempotency_key_dedupes_within_window(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        assert db.insert_job({'id': 'a', 'command': 'true', 'idempotency_key': 'order-1'}) == 'a'
+        # a retried submission gets the first job back
+        assert db.insert_job({'id': 'a2', 'command': 'true', 'idempotency_key': 'order-1'}) == 'a'
+        assert db.get_job('a2') is None
+        try:
+            db.insert_job({'id': 'a', 'command': 'true'})
+            assert False, 'expected ValueError'
+        except ValueError as e:
+            assert str(e) == 'Job a already exists'
+
+        dups = []
+        errors = db.insert_jobs([
+            {'id': 'b', 'command': 'true', 'idempotency_key': 'order-2'},
+            {'id': 'b2', 'command': 'true', 'idempotency_key': 'order-2'},
+            {'id': 'c', 'command': 'true', 'idempotency_key': 'order-1'},
+            {'id': 'b', 'command': 'true'},
+        ], dups)
+        assert errors == [(3, 'Job b already exists')]
+        assert dups == [(1, 'b'), (2, 'a')]
+        assert db.job_counts()['pending'] == 2
+
+        # outside the window the key is free again, and gc forgets it
+        db.get_conn().execute("UPDATE idempotency_keys SET created_at=created_at-7200000 WHERE key='order-2'")
+        db.set_config('idempotency-window', '1h')
+        assert db.insert_job({'id': 'b3', 'command': 'true', 'idempotency_key': 'order-2'}) == 'b3'
+        db.get_conn().execute("UPDATE idempotency_keys SET created_at=created_at-7200000")
+        assert db.prune_idempotency_keys() == 2
+
+        # the window starts at enqueue time, whatever created_at the client sends
+        before = db.now_ms()
+        old = {'command': 'true', 'idempotency_key': 'order-3', 'created_at': '2020-01-01T00:00:00Z'}
+        assert db.insert_job(dict(old, id='d')) == 'd'
+        assert db.insert_job(dict(old, id='d2')) == 'd'
+        assert db.insert_jobs([dict(old, id='d3', idempotency_key='order-4'),
+                               dict(old, id='d4', idempotency_key='order-4')], dups) == []
+        assert dups[-1] == (1, 'd3')
+        stamped = db.get_conn().execute(
+            "SELECT created_at FROM idempotency_keys WHERE key='order-3'").fetchone()[0]
+        assert before <= stamped <= db.now_ms()
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_result_cache_ttl_and_lru(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        db.set_config('result-cache-size', '2')
+        db.cache_result('k1', 'one', now=1000)
+        db.cache_result('k2', 'two', now=2000)
+        assert db.cached_result('k1', 500, now=2000) is None
+        # a hit marks k1 recently used, so k2 is evicted next
+        assert db.cached_result('k1', 5000, now=3000) == 'one'
+        db.cache_result('k3', 'three', now=4000)
+        assert db.cached_result('k2', 10 ** 6, now=4000) is None
+        assert db.cached_result('k1', 10 ** 6, now=4000) == 'one'
+        # same work, same key; the queue shard does not matter
+        assert db.cache_key({'command': 'echo hi'}) == db.cache_key({'command': 'echo hi', 'kind': 'shell'})
+        assert db.cache_key({'command': 'echo hi'}) != db.cache_key({'command': 'echo ho'})
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_cached_job_completes_without_running(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    old_run = worker_mod._run_process
+    try:
+        db.init_db()
+        db.insert_jobs([{'id': 'first', 'command': 'echo hi', 'cache_ttl': 60000, 'created_at': 1},
+                        {'id': 'again', 'command': 'echo hi', 'cache_ttl': 60000, 'created_at': 2},
+                        {'id': 'uncached', 'command': 'echo hi', 'created_at': 3}])
+        worker_mod.run_job(db.fetch_and_lock_job('w'), 2)
+        assert db.get_job('first')['output'] == 'hi\n'
+
+        def _no_process(job, out, timeout):
+            raise AssertionError('cache hit ran a process')
+        worker_mod._run_process = _no_process
+        worker_mod.run_job(db.fetch_and_lock_job('w'), 2)
+        again = db.get_job('again')
+        assert (again['state'], again['output']) == ('completed', 'hi\n')
+        # without cache_ttl the job runs
+        worker_mod.run_job(db.fetch_and_lock_job('w'), 2)
+        assert 'cache hit ran a process' in db.get_job('uncached')['output']
+    finally:
+        worker_mod._run_process = old_run
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
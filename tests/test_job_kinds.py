@@ -0,0 +1,73 @@
+import os
+import time
+from queuectl import callpool
+from queuectl import cli
+from queuectl import db
+from queuectl import worker as worker_mod
+
+
+def _enqueue(job):
+    db.insert_job(cli._prepare_job(job, 0, db.now_ms()))
+
+
+def _run(job_id):
+    job = db.fetch_and_lock_jobs('w', 1)[0]
+    assert job['id'] == job_id
+    worker_mod.run_job(job, 2)
+    return db.get_job(job_id)
+
+
+def test_argv_and_callable_jobs(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        db.set_config('job-timeout', '1')
+        db.set_config('callable-max-tasks', '3')
+
+        # no shell: metacharacters reach the program untouched
+        _enqueue({'id': 'a', 'argv': ['echo', '$HOME; a b']})
+        j = _run('a')
+        assert j['state'] == 'completed' and j['kind'] == 'argv'
+        assert j['output'] == '$HOME; a b\n' and j['command'] == "echo '$HOME; a b'"
+
+        # a process job that times out is killed and keeps what it printed
+        _enqueue({'id': 'hang', 'argv': ['sh', '-c', 'echo partial; sleep 3'], 'max_retries': 1})
+        j = _run('hang')
+        assert j['state'] == 'dead'
+        assert j['output'] == 'partial\nJob timed out after 1s\n'
+
+        _enqueue({'id': 'c', 'callable': 'json:dumps', 'args': {'obj': [1, 2]}})
+        j = _run('c')
+        assert j['state'] == 'completed' and j['output'] == '"[1, 2]"\n'
+
+        _enqueue({'id': 'err', 'callable': 'operator:truediv', 'args': [1, 0], 'max_retries': 1})
+        j = _run('err')
+        assert j['state'] == 'dead' and 'ZeroDivisionError' in j['output']
+
+        _enqueue({'id': 'slow', 'callable': 'time:sleep', 'args': [5], 'max_retries': 1})
+        t0 = time.monotonic()
+        j = _run('slow')
+        assert time.monotonic() - t0 < 3
+        assert j['state'] == 'dead' and 'timed out' in j['output']
+
+        # warm: the child (and its imports) is reused until recycled
+        pids = []
+        for i in range(5):
+            _enqueue({'id': f'p{i}', 'callable': 'os:getpid'})
+            pids.append(_run(f'p{i}')['output'])
+        assert pids[0] == pids[1] == pids[2] != pids[3] == pids[4]
+
+        for bad in ({'id': 'x'}, {'id': 'x', 'argv': 'echo hi'}, {'id': 'x', 'callable': 'nomodule'},
+                    {'id': 'x', 'command': 'true', 'argv': ['true']}):
+            try:
+                cli._prepare_job(bad, 0, 0)
+                assert False, bad
+            except ValueError:
+                pass
+    finally:
+        callpool.shutdown()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
@@ -0,0 +1,192 @@
+import os
+import signal
+import sqlite3
+import time
+import multiprocessing as mp
+from queuectl import db
+from queuectl import worker as worker_mod
+
+
+def test_leases_renew_and_reap(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    old_batch = db.REAP_BATCH
+    try:
+        db.init_db()
+        db.set_config('lease-seconds', '10')
+        for i in range(5):
+            db.insert_job({'id': f'j{i}', 'command': 'true', 'max_retries': 2 if i == 4 else 3})
+        a = db.fetch_and_lock_jobs('a', 4)
+        b = db.fetch_and_lock_jobs('b', 1)
+        assert all(j['lease_expires_at'] - j['locked_at'] == 10000 for j in a + b)
+
+        assert db.renew_leases('a', 60000) == 4
+        assert db.get_job('j0')['lease_expires_at'] > a[0]['lease_expires_at']
+        now = b[0]['lease_expires_at']
+        assert db.reap_expired(now - 1) == 0
+        assert db.reap_expired(now) == 1
+        j4 = db.get_job('j4')
+        assert (j4['state'], j4['attempts'], j4['locked_by']) == ('failed', 1, None)
+        assert 'worker b lost' in j4['output']
+
+        # out of retries: dead
+        assert db.fetch_and_lock_job('b')['id'] == 'j4'
+        assert db.reap_expired(db.now_ms() + 10000) == 1
+        assert db.get_job('j4')['state'] == 'dead'
+
+        db.REAP_BATCH = 3
+        assert db.reap_expired(db.now_ms() + 120000) == 3
+        assert db.reap_expired(db.now_ms() + 120000) == 1
+        assert db.job_counts()['processing'] == 0
+    finally:
+        db.REAP_BATCH = old_batch
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_results_after_a_reaped_lease_are_dropped(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        db.set_config('lease-seconds', '10')
+        db.insert_jobs([{'id': 'j0', 'command': 'true'}, {'id': 'j1', 'command': 'true'}])
+        slow = db.fetch_and_lock_jobs('slow', 2)
+        assert db.reap_expired(max(j['lease_expires_at'] for j in slow)) == 2
+        assert db.fetch_and_lock_job('fast')['id'] == 'j0'
+
+        # the reaped worker finishes late: neither the requeued nor the reclaimed job is touched
+        assert db.complete_job('j0', 'late', 'slow') is False
+        assert db.write_results([('fail', 'j1', 1, 3, 2, 'late', 'slow')]) == 0
+        assert (db.get_job('j0')['state'], db.get_job('j0')['locked_by']) == ('processing', 'fast')
+        assert db.get_job('j1')['output'] != 'late'
+        assert db.job_totals()['stale'] == 2
+
+        assert db.write_results([('complete', 'j0', 'ok', 'fast')]) == 1
+        assert db.get_job('j0')['state'] == 'completed'
+        assert db.fail_job('j0', 1, 3, 2, 'late', 'fast') is False
+        assert db.job_totals()['stale'] == 3
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_processing_jobs_get_a_lease_on_upgrade(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        path = os.path.join(str(tmp_path), '.queuectl', 'queue.db')
+        os.makedirs(os.path.dirname(path))
+        old = sqlite3.connect(path)
+        old.executescript("""
+        CREATE TABLE jobs (
+            id TEXT PRIMARY KEY, command TEXT NOT NULL, state TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0, max_retries INTEGER,
+            created_at INTEGER NOT NULL, updated_at INTEGER NOT NULL, next_run_at INTEGER,
+            locked_by TEXT, locked_at INTEGER, output TEXT
+        );
+        INSERT INTO jobs(id,command,state,created_at,updated_at,locked_by,locked_at)
+        VALUES ('stuck','true','processing',1000,1000,'gone',2000);
+        """)
+        old.close()
+        db.init_db()
+        assert db.get_job('stuck')['lease_expires_at'] == 2000 + db.DEFAULT_LEASE_SECONDS * 1000
+        assert db.reap_expired() == 1
+        assert db.get_job('stuck')['state'] == 'failed'
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_lease_backfill_follows_the_timestamp_migration(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        path = os.path.join(str(tmp_path), '.queuectl', 'queue.db')
+        os.makedirs(os.path.dirname(path))
+        old = sqlite3.connect(path)
+        old.executescript("""
+        CREATE TABLE jobs (
+            id TEXT PRIMARY KEY, command TEXT NOT NULL, state TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0, max_retries INTEGER,
+            created_at TEXT NOT NULL, updated_at TEXT NOT NULL, next_run_at TEXT,
+            locked_by TEXT, locked_at TEXT, output TEXT
+        );
+        INSERT INTO jobs(id,command,state,created_at,updated_at,locked_by,locked_at)
+        VALUES ('stuck','true','processing','2025-11-08T12:00:00Z','2025-11-08T12:00:00Z',
+                'gone','2025-11-08T12:00:01Z');
+        """)
+        old.close()
+        db.init_db()
+        stuck = db.get_job('stuck')
+        assert stuck['locked_at'] == db.to_ms('2025-11-08T12:00:01Z')
+        assert stuck['lease_expires_at'] == stuck['locked_at'] + db.DEFAULT_LEASE_SECONDS * 1000
+        assert db.reap_expired() == 1
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def _wait_state(job_id, state, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = db.get_job(job_id)
+        if job['state'] == state:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'{job_id} never reached {state}: {db.get_job(job_id)}')
+
+
+def test_killed_worker_job_is_requeued(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    old_uptime = worker_mod.RESTART_MIN_UPTIME
+    worker_mod.RESTART_MIN_UPTIME = 0
+    sup = None
+    try:
+        db.init_db()
+        db.set_config('lease-seconds', '1')
+        marker = tmp_path / 'pids'
+        # first run records (worker, shell) pids and hangs; the rerun succeeds
+        db.insert_job({'id': 'victim', 'command':
+                       f'if [ -f {marker} ]; then exit 0; fi; echo $PPID $$ > {marker}; sleep 30'})
+        # outlives the lease; heartbeats must keep it
+        db.insert_job({'id': 'long', 'command': 'sleep 2.5', 'created_at': db.now_ms() + 1})
+        db.close_conn()
+        sup = mp.Process(target=worker_mod.start_workers, args=(2, 2))
+        sup.start()
+        deadline = time.time() + 10
+        while not (marker.exists() and marker.read_text().strip()) and time.time() < deadline:
+            time.sleep(0.05)
+        worker_pid, shell_pid = map(int, marker.read_text().split())
+        os.kill(worker_pid, signal.SIGKILL)
+        os.killpg(shell_pid, signal.SIGKILL)
+
+        victim = _wait_state('victim', 'completed')
+        assert victim['attempts'] == 1
+        long = _wait_state('long', 'completed')
+        assert long['attempts'] == 0
+    finally:
+        worker_mod.RESTART_MIN_UPTIME = old_uptime
+        if sup is not None:
+            os.kill(sup.pid, signal.SIGTERM)
+            sup.join(timeout=10)
+            # the supervisor sets the shared shutdown event on its way out
+            worker_mod.TERMINATE.clear()
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
@@ -0,0 +1,49 @@
+import os
+from queuectl import db
+
+
+def test_iter_jobs_keyset_pages_and_filters(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        base = db.to_ms('2025-11-08T00:00:00Z')
+        for i in range(25):
+            db.insert_job({
+                'id': f'j{i:02d}', 'command': 'true', 'priority': i % 5,
+                'tags': 'gpu,nightly' if i % 2 else 'cpu',
+                'created_at': base + i * 1000, 'state': 'dead' if i % 3 == 0 else 'pending',
+            })
+        db.get_conn().execute("UPDATE jobs SET output='big' WHERE id='j00'")
+
+        seen, after = [], None
+        while True:
+            page = list(db.iter_jobs(after=after, limit=10, page_size=4))
+            if not page:
+                break
+            seen.extend(j['id'] for j in page)
+            after = page[-1]['id']
+        assert seen == [f'j{i:02d}' for i in range(25)]
+
+        first = next(db.iter_jobs())
+        assert 'output' not in first and first['created_at'] == base
+        assert next(db.iter_jobs(columns=['id', 'output'])) == {'id': 'j00', 'output': 'big'}
+
+        dead = [j['id'] for j in db.iter_jobs('dead', ['id'])]
+        assert dead == [f'j{i:02d}' for i in range(0, 25, 3)]
+        gpu = [j['id'] for j in db.iter_jobs(tag='gpu', min_priority=2, max_priority=3, columns=['id'])]
+        assert gpu == [f'j{i:02d}' for i in range(25) if i % 2 and 2 <= i % 5 <= 3]
+        window = [j['id'] for j in db.iter_jobs(since=base + 5000, until=base + 8000, columns=['id'])]
+        assert window == ['j05', 'j06', 'j07']
+
+        for kwargs in ({'after': 'nope'}, {'columns': ['id', 'bogus']}):
+            try:
+                list(db.iter_jobs(**kwargs))
+                assert False, 'expected ValueError'
+            except ValueError:
+                pass
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
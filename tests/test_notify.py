@@ -0,0 +1,27 @@
+import os
+from queuectl import notify
+
+
+def test_poke_wakes_channel(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        ch = notify.open_channel()
+        assert ch is not None
+        try:
+            assert ch.wait(0.01) is False
+            notify.poke()
+            notify.poke()
+            assert ch.wait(1.0) is True
+            # both pokes were drained by the first wait
+            assert ch.wait(0.01) is False
+        finally:
+            ch.close()
+        assert not os.path.exists(ch.path)
+        # poking with no listener is a no-op
+        notify.poke()
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
@@ -0,0 +1,56 @@
+import gzip
+import os
+from queuectl import db
+from queuectl import worker as worker_mod
+
+
+def _run(job_id, command):
+    db.insert_job({'id': job_id, 'command': command, 'max_retries': 1})
+    job = db.fetch_and_lock_job('t', '2999-01-01T00:00:00Z')
+    worker_mod.run_job(job, 2)
+    return db.get_job(job_id)
+
+
+def test_output_streams_to_log_with_bounded_tail(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        db.set_config('output-tail-bytes', '100')
+        cmd = "python3 -c \"print('x' * 9999)\"; echo END"
+        j = _run('big', cmd)
+        assert j['state'] == 'completed'
+        assert len(j['output']) == 100 and j['output'].endswith('x\nEND\n')
+        log = tmp_path / '.queuectl' / 'logs' / 'big.log'
+        assert log.stat().st_size == 10004
+
+        db.set_config('log-compress', 'true')
+        j = _run('gz', cmd + '; exit 1')
+        assert j['state'] == 'dead'
+        assert len(j['output']) == 100 and j['output'].endswith('x\nEND\n')
+        with gzip.open(tmp_path / '.queuectl' / 'logs' / 'gz.log.gz', 'rb') as f:
+            assert len(f.read()) == 10004
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_timed_out_job_keeps_partial_output(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        db.set_config('job-timeout', '1')
+        j = _run('slow', 'echo partial; sleep 3')
+        assert j['state'] == 'dead'
+        assert j['output'] == 'partial\nJob timed out after 1s\n'
+        log = tmp_path / '.queuectl' / 'logs' / 'slow.log'
+        assert log.read_text() == 'partial\nJob timed out after 1s\n'
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
@@ -0,0 +1,27 @@
+import os
+from queuectl import db
+
+
+def test_batch_claim_and_release(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        now = '2025-11-08T00:00:00Z'
+        for i, prio in enumerate([1, 10, 5]):
+            db.insert_job({'id': f'j{i}', 'command': 'true', 'priority': prio})
+        picked = db.fetch_and_lock_jobs('w1', 2, now)
+        assert [j['id'] for j in picked] == ['j1', 'j2']
+        assert all(j['state'] == 'processing' for j in picked)
+        # another worker cannot release jobs it does not hold
+        assert db.release_jobs('w2', ['j1', 'j2']) == 0
+        assert db.release_jobs('w1', ['j2']) == 1
+        assert db.get_job('j2')['state'] == 'pending'
+        assert db.get_job('j2')['locked_by'] is None
+        rest = db.fetch_and_lock_jobs('w2', 5, now)
+        assert [j['id'] for j in rest] == ['j2', 'j0']
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
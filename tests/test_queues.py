@@ -0,0 +1,58 @@
+import os
+from queuectl import db
+from queuectl import metrics
+from queuectl import worker as worker_mod
+
+
+def test_named_queues_are_separate_shards(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        db.insert_job({'id': 'd1', 'command': 'true'})
+        for name in ('emails', 'reports'):
+            with db.use_queue(name):
+                db.init_db()
+                db.insert_jobs([{'id': f'{name}{i}', 'command': 'true'} for i in range(3)])
+        assert os.path.exists(os.path.join(str(tmp_path), '.queuectl', 'queues', 'emails.db'))
+        assert db.queue_names() == ['default', 'emails', 'reports']
+        # the same id may exist in two queues
+        with db.use_queue('emails'):
+            db.insert_job({'id': 'd1', 'command': 'true'})
+            assert db.current_queue() == 'emails'
+        assert db.current_queue() == 'default'
+        assert db.get_job('emails0') is None
+
+        assert db.queue_counts()['reports']['pending'] == 3
+        assert db.all_job_counts()['pending'] == 8
+        assert db.all_job_totals()['enqueued'] == 8
+        text = metrics.prometheus_text()
+        assert 'queuectl_jobs{state="pending"} 8' in text
+        assert 'queuectl_queue_jobs{queue="emails",state="pending"} 4' in text
+
+        # emails:2,reports -> emails first in two rounds of three
+        cycle = worker_mod.QueueCycle(worker_mod.parse_queues('emails:2,reports'))
+        picked = [worker_mod.claim('w', 1, cycle)[0] for _ in range(3)]
+        assert [j['queue'] for j in picked] == ['emails', 'emails', 'reports']
+        worker_mod.release('w', picked)
+        assert db.queue_counts()['emails']['processing'] == 0
+
+        # an empty queue falls through to the next one
+        cycle = worker_mod.QueueCycle([('empty', 5), ('default', 1)])
+        with db.use_queue('empty'):
+            db.init_db()
+        assert worker_mod.claim('w', 1, cycle)[0]['id'] == 'd1'
+
+        assert worker_mod.parse_queues('') == [('default', 1)]
+        for bad in ('a/b', 'x:0', 'x:y', '../etc'):
+            try:
+                worker_mod.parse_queues(bad)
+                assert False, bad
+            except ValueError:
+                pass
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
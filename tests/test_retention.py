@@ -0,0 +1,41 @@
+import os
+import sqlite3
+from queuectl import db
+from queuectl import retention
+
+
+def test_gc_archives_old_finished_jobs(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        old = '2000-01-01T00:00:00Z'
+        for i in range(5):
+            db.insert_job({'id': f'old{i}', 'command': 'true', 'state': 'completed', 'updated_at': old})
+        db.insert_job({'id': 'olddead', 'command': 'false', 'state': 'dead', 'updated_at': old})
+        db.insert_job({'id': 'fresh', 'command': 'true', 'state': 'completed'})
+        db.insert_job({'id': 'live', 'command': 'true', 'updated_at': old})
+
+        moved = retention.run_gc(completed_older_than=retention.parse_duration('7d'), batch_size=2)
+        assert moved == {'completed': 5, 'dead': 0}
+        assert db.get_job('old0') is None
+        assert db.get_job('fresh') is not None and db.get_job('live') is not None
+        archived = db.get_conn().execute('SELECT COUNT(1) FROM jobs_archive').fetchone()[0]
+        assert archived == 5
+
+        archive = str(tmp_path / 'archive.db')
+        moved = retention.run_gc(dead_older_than=60, archive_path=archive)
+        assert moved == {'completed': 0, 'dead': 1}
+        with sqlite3.connect(archive) as a:
+            assert a.execute('SELECT id, state FROM jobs_archive').fetchall() == [('olddead', 'dead')]
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_parse_duration():
+    assert retention.parse_duration('90') == 90
+    assert retention.parse_duration('7d') == 7 * 86400
+    assert retention.parse_duration('1.5h') == 5400
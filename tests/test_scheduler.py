@@ -0,0 +1,89 @@
+import os
+from queuectl import db
+from queuectl import scheduler as scheduler_mod
+
+
+def test_retry_waits_in_scheduled_state(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        db.insert_job({'id': 'r', 'command': 'false', 'max_retries': 3, 'tags': 'gpu'})
+        job = db.fetch_and_lock_job('w')
+        db.fail_job(job['id'], 1, 3, 2, 'boom')
+        job = db.get_job('r')
+        assert job['state'] == 'scheduled' and job['attempts'] == 1
+        assert db.job_totals()['failed'] == 1
+        assert db.next_due() == job['next_run_at']
+        assert db.fetch_and_lock_jobs('w', 1, tags=['gpu']) == []
+
+        assert db.promote_due(job['next_run_at'] - 1) == 0
+        assert db.promote_due(job['next_run_at']) == 1
+        assert db.get_job('r')['state'] == 'failed'
+        assert db.next_due() is None
+        # the tag index follows the promotion
+        assert [j['id'] for j in db.fetch_and_lock_jobs('w', 1, tags=['gpu'])] == ['r']
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_scheduler_promotes_due_jobs_in_batches(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    old_batch = db.PROMOTE_BATCH
+    db.PROMOTE_BATCH = 7
+    try:
+        base = db.now_ms() + 3600 * 1000
+        for queue in ('default', 'emails'):
+            with db.use_queue(queue):
+                db.init_db()
+                db.insert_jobs([{'id': f'{queue}{i}', 'command': 'true', 'run_at': base + (i % 2) * 1000}
+                                for i in range(20)])
+        s = scheduler_mod.Scheduler(['default', 'emails'])
+        assert s.tick(base - 1) == 0
+        assert s.heap == sorted([(base, 'default'), (base, 'emails')])
+        assert s.tick(base) == 20
+        assert s.heap == sorted([(base + 1000, 'default'), (base + 1000, 'emails')])
+        with db.use_queue('emails'):
+            assert db.job_counts()['pending'] == 10 and db.job_counts()['scheduled'] == 10
+        assert s.tick(base + 1000) == 20
+        assert s.heap == [] and s.wait(0.5) == 0.5
+    finally:
+        db.PROMOTE_BATCH = old_batch
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_existing_future_jobs_move_to_scheduled(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        conn = db.get_conn()
+        future = db.now_ms() + 3600 * 1000
+        # rows as an older version left them: waiting in pending/failed
+        conn.execute("INSERT INTO jobs(id,command,state,created_at,updated_at,run_at) "
+                     "VALUES('a','true','pending',0,0,?)", (future,))
+        conn.execute("INSERT INTO jobs(id,command,state,attempts,created_at,updated_at,next_run_at) "
+                     "VALUES('b','true','failed',1,0,0,?)", (future + 1,))
+        conn.execute("INSERT INTO jobs(id,command,state,created_at,updated_at) VALUES('c','true','pending',0,0)")
+        conn.execute("DELETE FROM meta WHERE key='scheduled_state'")
+        conn.execute("PRAGMA user_version=0")
+        db.init_db()
+        assert db.get_job('a')['state'] == 'scheduled' and db.get_job('a')['next_run_at'] == future
+        assert db.get_job('b')['state'] == 'scheduled'
+        assert db.get_job('c')['state'] == 'pending'
+        assert db.promote_due(future + 1) == 2
+        assert db.get_job('b')['state'] == 'failed' and db.get_job('a')['state'] == 'pending'
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
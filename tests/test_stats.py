@@ -0,0 +1,37 @@
+import os
+from queuectl import db
+from queuectl import stats
+
+
+def test_histograms_flush_and_summarize(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        rec = stats.Recorder(flush_interval=3600)
+        for _ in range(90):
+            rec.observe('execute', 0.003)
+        for _ in range(10):
+            rec.observe('execute', 2.0)
+        rec.flush()
+        assert db.latency_histograms() == {}
+        rec.flush(force=True)
+        # a second process adds to the same buckets
+        other = stats.Recorder()
+        other.observe('execute', 0.003)
+        other.observe('claim', 0.0002)
+        other.flush(force=True)
+
+        s = stats.summary()
+        assert s['execute']['count'] == 101
+        assert 0.0025 <= s['execute']['p50'] <= 0.005
+        assert 1.0 <= s['execute']['p99'] <= 2.5
+        assert s['claim']['count'] == 1
+        assert 'queuectl_job_stage_seconds_count{stage="execute"} 101' in stats.prometheus_lines()
+        db.reset_latency()
+        assert stats.summary() == {}
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
@@ -0,0 +1,73 @@
+import os
+from queuectl import db
+
+
+def test_tag_routed_claim(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        db.insert_jobs([
+            {'id': 'plain', 'command': 'true', 'priority': 9},
+            {'id': 'gpu1', 'command': 'true', 'tags': ['gpu', ' gpu', 'big'], 'priority': 1},
+            {'id': 'gpu2', 'command': 'true', 'tags': 'gpu', 'priority': 5},
+            {'id': 'rep', 'command': 'true', 'tags': 'reports'},
+        ])
+        assert db.get_job('gpu1')['tags'] == 'gpu,big'
+        conn = db.get_conn()
+        rows = conn.execute('SELECT tag, job_id, ready FROM job_tags ORDER BY tag, job_id').fetchall()
+        assert [tuple(r) for r in rows] == [('big', 'gpu1', 1), ('gpu', 'gpu1', 1), ('gpu', 'gpu2', 1), ('reports', 'rep', 1)]
+
+        got = db.fetch_and_lock_jobs('w', 10, tags=['gpu', 'big'])
+        assert [j['id'] for j in got] == ['gpu2', 'gpu1']
+        assert conn.execute("SELECT COUNT(1) FROM job_tags WHERE ready=1 AND tag='gpu'").fetchone()[0] == 0
+        assert db.fetch_and_lock_jobs('w', 10, tags=['gpu']) == []
+
+        # back in the queue: claimable again through the tag index
+        db.fail_job('gpu1', 1, 3, 2, 'boom')
+        db.release_jobs('w', ['gpu2'])
+        assert [j['id'] for j in db.fetch_and_lock_jobs('w', 10, tags=['gpu'])] == ['gpu2']
+        # untagged workers still take anything
+        assert [j['id'] for j in db.fetch_and_lock_jobs('u', 10)] == ['plain', 'rep']
+
+        db.complete_job('gpu2', 'ok')
+        conn.execute("UPDATE jobs SET updated_at=0 WHERE id='gpu2'")
+        db.archive_finished_jobs('completed', db.now_ms(), 10)
+        assert conn.execute("SELECT COUNT(1) FROM job_tags WHERE job_id='gpu2'").fetchone()[0] == 0
+
+        # a job matching several tags takes one slot of the batch
+        db.insert_jobs([{'id': 'both', 'command': 'true', 'tags': 'gpu,big', 'priority': 9},
+                        {'id': 'one', 'command': 'true', 'tags': 'gpu'}])
+        got = db.fetch_and_lock_jobs('w', 2, tags=['gpu', 'big'])
+        assert sorted(j['id'] for j in got) == ['both', 'one']
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_job_tags_backfilled_from_tags_column(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        conn = db.get_conn()
+        # a database from before job_tags: tags only in the jobs column
+        conn.executescript("""
+        DROP TRIGGER trg_jobs_tags_ready;
+        DROP TRIGGER trg_jobs_tags_delete;
+        DROP TABLE job_tags;
+        INSERT INTO jobs(id,command,state,attempts,created_at,updated_at,tags)
+        VALUES ('old','true','pending',0,1,1,'a, b'), ('done','true','completed',1,2,2,'a');
+        PRAGMA user_version=0;
+        """)
+        db.init_db()
+        rows = conn.execute('SELECT tag, job_id, ready FROM job_tags ORDER BY tag, job_id').fetchall()
+        assert [tuple(r) for r in rows] == [('a', 'done', 0), ('a', 'old', 1), ('b', 'old', 1)]
+        assert [j['id'] for j in db.fetch_and_lock_jobs('w', 5, tags=['b'])] == ['old']
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
@@ -0,0 +1,86 @@
+import os
+import sqlite3
+from queuectl import db
+
+
+def test_to_ms_accepts_iso_variants():
+    base = db.to_ms('2025-11-08T12:00:00Z')
+    assert base == 1762603200000
+    assert db.to_ms('2025-11-08T12:00:00') == base
+    assert db.to_ms('2025-11-08T12:00:00.000000Z') == base
+    assert db.to_ms('2025-11-08T13:00:00+01:00') == base
+    assert db.to_ms('2025-11-08T12:00:00.5') == base + 500
+    assert db.to_ms(base) == base
+    assert db.ms_to_iso(base) == '2025-11-08T12:00:00.000Z'
+    try:
+        db.to_ms('tomorrow')
+        assert False, 'expected ValueError'
+    except ValueError:
+        pass
+
+
+def test_run_at_mixed_formats_order_correctly(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        # compared as text, 'due' sorts after now ('Z' > '.') and 'future'
+        # before it (' ' < 'T')
+        db.insert_job({'id': 'due', 'command': 'true', 'run_at': '2999-11-08T12:00:01Z'})
+        db.insert_job({'id': 'future', 'command': 'true', 'run_at': '2999-11-08 12:00:02'})
+        now = '2999-11-08T12:00:01.5Z'
+        assert db.fetch_and_lock_jobs('w', 10, now) == []
+        assert db.promote_due(now) == 1
+        picked = db.fetch_and_lock_jobs('w', 10, now)
+        assert [j['id'] for j in picked] == ['due']
+        assert isinstance(picked[0]['locked_at'], int)
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_migrates_text_timestamps(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        path = os.path.join(str(tmp_path), '.queuectl', 'queue.db')
+        os.makedirs(os.path.dirname(path))
+        old = sqlite3.connect(path)
+        old.executescript("""
+        CREATE TABLE jobs (
+            id TEXT PRIMARY KEY, command TEXT NOT NULL, state TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0, max_retries INTEGER,
+            created_at TEXT NOT NULL, updated_at TEXT NOT NULL, next_run_at TEXT,
+            locked_by TEXT, locked_at TEXT, output TEXT,
+            priority INTEGER DEFAULT 0, output_file TEXT, tags TEXT, run_at TEXT
+        );
+        INSERT INTO jobs(id,command,state,attempts,created_at,updated_at,next_run_at,run_at)
+        VALUES ('a','true','failed',1,'2025-11-08T12:00:00Z','2025-11-08T12:00:00.250000Z',
+                '2025-11-08T12:05:00Z','2025-11-08T12:00:00');
+        INSERT INTO jobs(id,command,state,created_at,updated_at)
+        VALUES ('b','true','completed','2025-11-08T12:00:00Z','2025-11-08T12:00:00Z');
+        """)
+        old.close()
+
+        db.init_db()
+        types = {r[1]: r[2] for r in db.get_conn().execute('PRAGMA table_info(jobs)')}
+        assert types['created_at'] == types['next_run_at'] == types['run_at'] == 'INTEGER'
+        a = db.get_job('a')
+        base = db.to_ms('2025-11-08T12:00:00Z')
+        assert (a['created_at'], a['updated_at'], a['next_run_at'], a['run_at']) == (
+            base, base + 250, base + 300000, base)
+        assert a['attempts'] == 1 and a['locked_at'] is None
+        assert db.job_counts()['completed'] == 1
+        # indexes come back after the rebuild
+        names = {r[0] for r in db.get_conn().execute("SELECT name FROM sqlite_master WHERE type='index'")}
+        assert 'idx_jobs_ready' in names
+        db.init_db()
+        assert db.get_job('b')['created_at'] == base
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
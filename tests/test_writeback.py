@@ -0,0 +1,123 @@
+import os
+import signal
+import time
+import multiprocessing as mp
+from queuectl import db
+from queuectl import worker as worker_mod
+from queuectl import writeback as writeback_mod
+
+
+def test_write_results_is_one_transaction(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        for i in range(3):
+            db.insert_job({'id': f'j{i}', 'command': 'true'})
+        db.fetch_and_lock_jobs('w', 3)
+        try:
+            db.write_results([('complete', 'j0', 'ok'), ('bogus', 'j1')])
+            assert False, 'expected ValueError'
+        except ValueError:
+            pass
+        assert db.get_job('j0')['state'] == 'processing'
+        assert db.write_results([('complete', 'j0', 'ok'), ('fail', 'j1', 1, 1, 2, 'boom'),
+                                 ('fail', 'j2', 1, 3, 2, 'again')]) == 3
+        assert [db.get_job(f'j{i}')['state'] for i in range(3)] == ['completed', 'dead', 'scheduled']
+        assert db.get_job('j0')['output'] == 'ok'
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def test_writeback_groups_by_batch_interval_and_close(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        for queue in ('default', 'emails'):
+            with db.use_queue(queue):
+                db.init_db()
+                db.insert_jobs([{'id': f'{queue}{i}', 'command': 'true'} for i in range(4)])
+                db.fetch_and_lock_jobs('w', 4)
+        wb = writeback_mod.WriteBack(60000, batch=3)
+        for i in range(3):
+            wb.complete_job(f'default{i}', '')
+        deadline = time.time() + 5
+        while wb.commits < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        assert wb.commits == 1 and db.get_job('default2')['state'] == 'completed'
+        wb.complete_job('default3', '')
+        with db.use_queue('emails'):
+            wb.fail_job('emails0', 1, 1, 2, 'x')
+        time.sleep(0.1)
+        assert db.get_job('default3')['state'] == 'processing'
+        wb.close()
+        # one transaction per queue
+        assert wb.commits == 3
+        assert db.get_job('default3')['state'] == 'completed'
+        with db.use_queue('emails'):
+            assert db.get_job('emails0')['state'] == 'dead'
+
+        wb = writeback_mod.WriteBack(20, batch=100)
+        with db.use_queue('emails'):
+            wb.complete_job('emails1', '')
+        deadline = time.time() + 5
+        while wb.commits < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        with db.use_queue('emails'):
+            assert db.get_job('emails1')['state'] == 'completed'
+        wb.close()
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+
+
+def _worker(marker):
+    worker_mod._run_worker_process(0, 2, writeback=(60000, 100))
+
+
+def test_crash_before_flush_never_marks_completed(tmp_path):
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = str(tmp_path)
+    try:
+        db.init_db()
+        marker = tmp_path / 'ran'
+        db.insert_job({'id': 'a', 'command': f'touch {marker}'})
+        db.close_conn()
+        p = mp.Process(target=_worker, args=(marker,))
+        p.start()
+        deadline = time.time() + 10
+        while not marker.exists() and time.time() < deadline:
+            time.sleep(0.02)
+        time.sleep(0.2)
+        os.kill(p.pid, signal.SIGKILL)
+        p.join()
+        # ran, but the result was still buffered: at-least-once, not at-most-once
+        assert marker.exists()
+        assert db.get_job('a')['state'] == 'processing'
+
+        db.insert_job({'id': 'b', 'command': 'true'})
+        db.close_conn()
+        p = mp.Process(target=_worker, args=(marker,))
+        p.start()
+        deadline = time.time() + 10
+        while db.get_job('b')['state'] != 'processing' and time.time() < deadline:
+            time.sleep(0.02)
+        time.sleep(0.3)
+        assert db.get_job('b')['state'] == 'processing'
+        # a graceful stop flushes
+        os.kill(p.pid, signal.SIGINT)
+        p.join(timeout=10)
+        assert db.get_job('b')['state'] == 'completed'
+    finally:
+        db.close_conn()
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home